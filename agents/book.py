@@ -0,0 +1,322 @@
+"""
+book.py
+Square Stacker position book and book lookup agents
+
+A position book maps canonical positions to the move chosen by an expensive
+agent offline. Positions are canonicalized over the 8 board symmetries, the 6
+piece orders and color relabeling (colors by first appearance), since the game
+rules are invariant under all three, and keyed by a 64-bit BLAKE2b hash of the
+canonical color codes and combo count.
+
+Book File (.npy, sorted by key):
+    key = Position hash [uint64]
+    move = Move index in canonical frame [0..26]
+    count = Times position was seen while building
+    value = Mean final score of games through position while building
+
+Books are opened with np.load(mmap_mode='r'), so worker processes share the
+book pages through the OS page cache rather than each loading a copy.
+"""
+
+from collections import Counter
+from hashlib import blake2b
+from itertools import permutations
+
+import numpy as np
+from agents.agent import Agent
+from agents.random import RandomAgent
+from agents.search.agent import SearchAgent
+from square_stacker_game import SquareStackerGame
+from utils.progress_tracker import ProgressTracker
+
+book_dtype = np.dtype([('key', '<u8'), ('move', 'u1'), ('count', '<u4'), ('value', '<f4')])
+
+
+def _make_symmetries():
+    """
+    Makes all board symmetry and piece order combinations
+    :return cell_perms: Canonical cell of each cell [np.array 48 x 9]
+    :return piece_perms: Original piece of each canonical piece [np.array 48 x 3]
+    """
+    i, j = np.divmod(np.arange(9), 3)
+    cell_perms = []
+    for transpose in [False, True]:
+        for flip_i in [False, True]:
+            for flip_j in [False, True]:
+                ti, tj = (j, i) if transpose else (i, j)
+                ti = 2 - ti if flip_i else ti
+                tj = 2 - tj if flip_j else tj
+                cell_perms.append(3 * ti + tj)
+    pairs = [(cells, pieces) for cells in cell_perms for pieces in permutations(range(3))]
+    return np.array([p[0] for p in pairs]), np.array([p[1] for p in pairs])
+
+
+_cell_perms, _piece_perms = _make_symmetries()
+_num_symmetries = len(_cell_perms)
+
+
+def canonicalize(game):
+    """
+    Finds canonical form of game position
+    :param game: Square Stacker game
+    :return key: Position hash [int]
+    :return symmetry: Index of symmetry mapping position to canonical form
+    """
+    codes = game.get_state_vector('color')
+    return canonical_key(codes[:36], codes[37])
+
+
+def canonical_key(codes, combo):
+    """
+    Finds canonical form of position given as color codes
+    :param codes: Board and piece color codes [np.array 36] (first 36 of 'color' state vector)
+    :param combo: Combo count
+    :return key: Position hash [int]
+    :return symmetry: Index of symmetry mapping position to canonical form
+    """
+    board = codes[:27].reshape(9, 3)
+    piece = codes[27:36].reshape(3, 3)
+
+    # Color codes of all symmetric positions [48 x 36]
+    boards = np.empty((_num_symmetries, 9, 3), dtype=np.int64)
+    boards[np.arange(_num_symmetries)[:, np.newaxis], _cell_perms] = board
+    pieces = piece[_piece_perms]
+    variants = np.concatenate((boards.reshape(-1, 27), pieces.reshape(-1, 9)), axis=1)
+
+    # Relabel colors by first appearance
+    num_colors = SquareStackerGame._num_colors
+    is_color = variants[..., np.newaxis] == np.arange(1, num_colors + 1)
+    first = np.where(np.any(is_color, axis=1), np.argmax(is_color, axis=1), variants.shape[1])
+    labels = np.zeros((_num_symmetries, num_colors + 1), dtype=np.int64)
+    labels[:, 1:] = np.argsort(np.argsort(first, axis=1, kind='stable'), axis=1) + 1
+    variants = np.take_along_axis(labels, variants, axis=1)
+
+    # Lexicographic min (last column is primary lexsort key)
+    symmetry = int(np.lexsort(variants.T[::-1])[0])
+    data = variants[symmetry].astype(np.uint8).tobytes() + bytes([min(int(combo), 255)])
+    key = int.from_bytes(blake2b(data, digest_size=8).digest(), 'little')
+    return key, symmetry
+
+
+def to_canonical_move(move, symmetry):
+    """
+    :param move: Move [k, i, j] in original frame
+    :param symmetry: Symmetry index from canonicalize
+    :return: Move index in canonical frame
+    """
+    k, i, j = move
+    k_canon = int(np.flatnonzero(_piece_perms[symmetry] == k)[0])
+    return 9 * k_canon + int(_cell_perms[symmetry][3 * i + j])
+
+
+def from_canonical_move(index, symmetry):
+    """
+    :param index: Move index in canonical frame
+    :param symmetry: Symmetry index from canonicalize
+    :return: Move [k, i, j] in original frame
+    """
+    k_canon, cell_canon = divmod(int(index), 9)
+    cell = int(np.flatnonzero(_cell_perms[symmetry] == cell_canon)[0])
+    return [int(_piece_perms[symmetry][k_canon]), cell // 3, cell % 3]
+
+
+def build_book(agent, file_name, num_games=10000, max_moves=6, num_positions=10000, min_count=2,
+               sampling_agent=None):
+    """
+    Builds position book from most frequent early-game positions
+    :param agent: Square Stacker AI agent choosing book moves (may be slow)
+    :param file_name: Path of book .npy file
+    :param num_games: Number of sampled games
+    :param max_moves: Number of opening moves sampled per game
+    :param num_positions: Max number of positions in book
+    :param min_count: Min times a position is seen to be in book
+    :param sampling_agent: Agent playing sampled games (default RandomAgent)
+    :return: None
+    """
+
+    # Initial printout
+    print('Building Square Stacker Position Book')
+    sampling_agent = sampling_agent if sampling_agent is not None else RandomAgent()
+    progress_tracker = ProgressTracker(5.0)
+    progress_tracker.start()
+
+    # Sample early-game positions
+    counts = Counter()
+    score_sums = Counter()
+    examples = {}
+    for game_i in range(num_games):
+        game = SquareStackerGame()
+        keys = []
+        for _ in range(max_moves):
+            key, _ = canonicalize(game)
+            keys.append(key)
+            counts[key] += 1
+            if key not in examples:
+                examples[key] = game.deepcopy()
+            move = _select_move(sampling_agent, game)
+            if move is None:
+                break
+            game.make_move(move)
+
+        # Finish game for position values
+        while True:
+            move = _select_move(sampling_agent, game)
+            if move is None:
+                break
+            game.make_move(move)
+        for key in keys:
+            score_sums[key] += game.get_score()
+        progress_tracker.update(0.5 * (game_i + 1) / num_games)
+
+    # Solve most frequent positions with agent
+    frequent = [(key, count) for key, count in counts.most_common(num_positions) if count >= min_count]
+    book = np.zeros(len(frequent), dtype=book_dtype)
+    for n, (key, count) in enumerate(frequent):
+        game = examples[key]
+        _, symmetry = canonicalize(game)
+        move = _select_move(agent, game)
+        book[n] = (key, to_canonical_move(move, symmetry) if move is not None else 255,
+                   count, score_sums[key] / count)
+        progress_tracker.update(0.5 + 0.5 * (n + 1) / len(frequent))
+
+    # Save sorted by key
+    progress_tracker.stop()
+    book.sort(order='key')
+    np.save(file_name, book)
+    print(f'Saved {len(book)} positions to {file_name}')
+
+
+def _select_move(agent, game):
+    """
+    :param agent: Square Stacker AI agent
+    :param game: Current game
+    :return: Move selected by agent (or None)
+    """
+    if issubclass(type(agent), SearchAgent):
+        move, _ = agent.select_move(game)
+        return move
+    return agent.select_move(game)
+
+
+class PositionBook:
+
+    def __init__(self, file_name):
+        """
+        Opens memory-mapped position book
+        :param file_name: Path of book .npy file (written by build_book)
+        """
+        self._file_name = file_name
+        self._book = np.load(file_name, mmap_mode='r')
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self):
+        """
+        :return: Number of positions in book
+        """
+        return len(self._book)
+
+    def __getstate__(self):
+        """
+        Pickles file name only (workers re-map the shared file)
+        """
+        return {'file_name': self._file_name}
+
+    def __setstate__(self, state):
+        self.__init__(state['file_name'])
+
+    def lookup(self, game):
+        """
+        Looks up book move of game position
+        :param game: Current game [SquareStackerGame]
+        :return: Move [k, i, j] or None if position is not in book
+        """
+        key, symmetry = canonicalize(game)
+        keys = self._book['key']
+        n = int(np.searchsorted(keys, key))
+        if n < len(keys) and keys[n] == key and self._book['move'][n] != 255:
+            self._hits += 1
+            return from_canonical_move(self._book['move'][n], symmetry)
+        self._misses += 1
+        return None
+
+    def get_hits(self):
+        """
+        :return: Number of lookups found in book
+        """
+        return self._hits
+
+    def get_misses(self):
+        """
+        :return: Number of lookups not found in book
+        """
+        return self._misses
+
+
+class BookAgent(Agent):
+
+    def __init__(self, agent, book):
+        """
+        Constructs agent which plays book moves and defers to agent otherwise
+        :param agent: Square Stacker AI agent (not a SearchAgent)
+        :param book: PositionBook or path of book .npy file
+        """
+        Agent.__init__(self)
+        self._agent = agent
+        self._book = book if isinstance(book, PositionBook) else PositionBook(book)
+
+    def get_book(self):
+        """
+        :return: PositionBook
+        """
+        return self._book
+
+    def select_move(self, game):
+        """
+        Selects book move or move of wrapped agent
+        :param game: Current game [SquareStackerGame]
+        :return: Move [k, i, j] or None if no moves exist
+        """
+        move = self._book.lookup(game)
+        return move if move is not None else self._agent.select_move(game)
+
+
+class BookSearchAgent(SearchAgent):
+
+    def __init__(self, agent, book):
+        """
+        Constructs search agent which plays book moves and searches otherwise
+        :param agent: Square Stacker AI search agent
+        :param book: PositionBook or path of book .npy file
+        """
+        SearchAgent.__init__(self)
+        self._agent = agent
+        self._book = book if isinstance(book, PositionBook) else PositionBook(book)
+
+    def get_book(self):
+        """
+        :return: PositionBook
+        """
+        return self._book
+
+    def select_move(self, game):
+        """
+        Selects book move or searches with wrapped agent
+        :param game: Current game [SquareStackerGame]
+        :return move: Move [k, i, j] or None if no moves exist
+        :return moves_searched: Number of moves searched (0 on book hit)
+        """
+        move = self._book.lookup(game)
+        return (move, 0) if move is not None else self._agent.select_move(game)
+
+
+def with_book(agent, book):
+    """
+    Wraps agent with book lookup
+    :param agent: Square Stacker AI agent
+    :param book: PositionBook or path of book .npy file
+    :return: BookSearchAgent if agent is a SearchAgent, else BookAgent
+    """
+    if issubclass(type(agent), SearchAgent):
+        return BookSearchAgent(agent, book)
+    return BookAgent(agent, book)
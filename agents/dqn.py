@@ -3,16 +3,16 @@ dqn.py
 Square Stacker Deep Q Network agent
 """
 
-import csv
-
-import matplotlib.pyplot as plt
-from keras.layers import Dense, Activation
-from keras.models import Sequential
-from keras.optimizers import Adam
+import os
 
 from agents.agent import Agent
+from agents.dqn_policy import DQNPolicy
+from utils.game_records import GameRecordWriter
+from utils.metrics_sink import MetricsSink
 from utils.progress_tracker import ProgressTracker
+from utils.replay_buffer import ReplayBuffer
 from utils.score_tracker import ScoreTracker
+from utils.trajectories import TrajectoryWriter
 from square_stacker_game import *
 
 
@@ -21,8 +21,12 @@ class DQNAgent(Agent):
     def __init__(self):
         """
         Initializes random DQN model
+        (Keras is imported on first construction, not on module import)
         """
         Agent.__init__(self)
+        from keras.layers import Dense, Activation
+        from keras.models import Sequential
+        from keras.optimizers import Adam
 
         # Initialize DQN
         dqn_input_dim = len(SquareStackerGame().get_state_vector())
@@ -36,7 +40,19 @@ class DQNAgent(Agent):
         ])
         self._dqn.compile(optimizer=Adam(), loss='mse', metrics=['accuracy'])
 
-    def train(self, num_fits, games_per_fit, discount, epsilon, csv_name=None):
+        # Experience replay (created on first call to train)
+        self._replay = None
+
+        # Number of fits completed by train (saved in checkpoints)
+        self._num_fits_done = 0
+
+        # NumPy policy of current weights used by select_move (rebuilt after weights change)
+        self._policy = None
+
+    def train(self, num_fits, games_per_fit, discount, epsilon, csv_name=None,
+              batch_size=32, predict_batch_size=4096, replay_capacity=100000, prioritized=False,
+              num_envs=64, checkpoint_name=None, checkpoint_interval=1, resume=False,
+              jsonl_name=None, plot=False, packed_replay=False, trajectory_dir=None, record_path=None):
         """
         Trains DQN via repeated game simulation
         :param num_fits: Number of times to fit network
@@ -44,6 +60,19 @@ class DQNAgent(Agent):
         :param discount: DQN discount factor [0,1]
         :param epsilon: Probability of random action [0,1]
         :param csv_name: Name of log CSV file (or None)
+        :param batch_size: Minibatch size for fitting network
+        :param predict_batch_size: Batch size for computing Q-targets
+        :param replay_capacity: Max transitions kept in replay buffer across fits and calls
+        :param prioritized: Use prioritized (vs uniform) replay sampling
+        :param num_envs: Number of self-play games run concurrently
+        :param checkpoint_name: Name of checkpoint file saved during training (or None)
+        :param checkpoint_interval: Number of fits between checkpoints
+        :param resume: Skip fits already completed (e.g. after loading a checkpoint)
+        :param jsonl_name: Name of JSON-lines log of game scores and summaries (or None)
+        :param plot: Live plot score progress in separate process
+        :param packed_replay: Store replay states as packed 'bits' state vectors
+        :param trajectory_dir: Directory of trajectory dataset to record games to (or None)
+        :param record_path: Path of game record file to append games to (or None)
         :return: None
         """
 
@@ -55,134 +84,358 @@ class DQNAgent(Agent):
         score_tracker = ScoreTracker(100)
         num_games = num_fits * games_per_fit
 
-        # Score plotting
-        plot_game_count = []
-        plot_mean_score = []
-        plot_min_score = []
-        plot_max_score = []
-        fig = plt.figure()
-        axes = fig.add_subplot(1, 1, 1)
+        # Resume after fits already completed
+        first_fit = self._num_fits_done if resume else 0
 
-        # CSV logger
-        make_csv_log = (csv_name is not None)
-        if make_csv_log:
-            csv_file = open(csv_name, 'w', newline='')
-            csv_writer = csv.writer(csv_file, delimiter=',')
+        # Metrics logging and plotting (written in background)
+        metrics = MetricsSink(csv_name=csv_name, jsonl_name=jsonl_name, plot=plot, append=first_fit > 0)
+
+        # Experience replay buffer (kept between fits and calls to train, and rebuilt with
+        # its newest transitions if capacity or sampling changed)
+        if self._replay is None:
+            self._replay = self.make_replay(replay_capacity, prioritized, packed_replay)
+        elif self.get_replay_encoding() != ('bits' if packed_replay else 'state'):
+            raise ValueError('packed_replay differs from existing replay buffer (set_replay(None) to replace it)')
+        elif self._replay.get_capacity() != replay_capacity or self._replay.is_prioritized() != prioritized:
+            replay = self.make_replay(replay_capacity, prioritized, packed_replay)
+            self._replay.copy_to(replay)
+            self._replay = replay
+        encoding = self.get_replay_encoding()
+
+        # Trajectory recording
+        writer = TrajectoryWriter(trajectory_dir) if trajectory_dir is not None else None
+        record_writer = GameRecordWriter(record_path, append=True) if record_path is not None else None
 
         # Play games to train model
-        game_count = 1
+        game_count = first_fit * games_per_fit + 1
         progress_tracker.start()
+        score_tracker.start()
 
-        for fit_i in range(num_fits):
+        for fit_i in range(first_fit, num_fits):
 
-            # Create batch of training data (state, move, reward, next_state, done)
-            training_data = []
+            # Number of transitions added to replay buffer this fit
+            num_transitions = 0
 
-            # Play multiple games in-between fits
-            for game_i in range(games_per_fit):
+            # Play games in-between fits, num_envs at a time
+            num_active = min(num_envs, games_per_fit)
+            games = [SquareStackerGame() for _ in range(num_active)]
+            games_started = num_active
+            states = np.array([game.get_state_vector(encoding) for game in games])
+            masks = np.array([game.get_valid_move_mask() for game in games])
+            trajectories = [([], [], [], []) for _ in games]
+            game_moves = [bytearray() for _ in games]
 
-                # Simulate the game until loss
-                game = SquareStackerGame()
-                valid_moves = game.get_valid_moves()
-                num_valid_moves = len(valid_moves)
-                done = num_valid_moves == 0
+            while len(games) > 0:
 
-                while not done:
+                # Select best moves with one batched forward pass
+                num_active = len(games)
+                explore = np.random.random(num_active) <= epsilon
+                if np.all(explore):
+                    best_indices = np.zeros(num_active, dtype=int)
+                else:
+                    q_values = self._dqn.predict(self._unpack(states), batch_size=predict_batch_size)
+                    best_indices = np.argmax(np.where(masks, q_values, -np.inf), axis=1)
+
+                # Select random valid moves (uniform over mask)
+                random_indices = np.argmax(np.where(masks, np.random.random(masks.shape), -1.0), axis=1)
+                move_indices = np.where(explore, random_indices, best_indices)
+
+                # Apply moves
+                rewards = np.zeros(num_active)
+                next_states = np.empty_like(states)
+                next_masks = np.empty_like(masks)
+                for n in range(num_active):
+                    if writer is not None:
+                        bits = states[n] if encoding == 'bits' else games[n].get_state_vector('bits')
+                        trajectories[n][0].append(bits)
+                    rewards[n] = games[n].make_move(index_to_move(move_indices[n]))
+                    game_moves[n].append(move_indices[n])
+                    if writer is not None:
+                        trajectories[n][1].append(move_indices[n])
+                        trajectories[n][2].append(rewards[n])
+                        trajectories[n][3].append(games[n].get_score())
+                    next_states[n] = games[n].get_state_vector(encoding)
+                    next_masks[n] = games[n].get_valid_move_mask()
+                dones = ~np.any(next_masks, axis=1)
+
+                # Add data to replay buffer
+                self._replay.add_batch(states, move_indices, rewards, next_states, dones)
+                num_transitions += num_active
+
+                # Log finished games and replace them with new games
+                keep = np.ones(num_active, dtype=bool)
+                for n in np.flatnonzero(dones):
+
+                    # Log game score
+                    score = games[n].get_score()
+                    metrics.publish('game', {'game': game_count, 'score': score})
+
+                    # Record trajectory
+                    if writer is not None:
+                        writer.add_game(*trajectories[n])
+                        trajectories[n] = ([], [], [], [])
+                    if record_writer is not None:
+                        record_writer.add_game(games[n], game_moves[n])
+                    game_moves[n] = bytearray()
+
+                    # Progress tracking (printed in background)
+                    progress_tracker.update(float(game_count) / num_games)
+                    if score_tracker.update(score):
+
+                        # Log score summary of completed window
+                        metrics.publish('summary', {
+                            'game': game_count,
+                            'mean': score_tracker.get_mean_score(),
+                            'min': score_tracker.get_min_score(),
+                            'max': score_tracker.get_max_score(),
+                        })
+
+                    # Increment game count
+                    game_count += 1
+
+                    # Auto-reset game
+                    if games_started < games_per_fit:
+                        games[n] = SquareStackerGame()
+                        next_states[n] = games[n].get_state_vector(encoding)
+                        next_masks[n] = games[n].get_valid_move_mask()
+                        games_started += 1
+                    else:
+                        keep[n] = False
 
-                    # Get game state vector
-                    state = game.get_state_vector()
+                # Drop finished games
+                games = [game for game, k in zip(games, keep) if k]
+                trajectories = [trajectory for trajectory, k in zip(trajectories, keep) if k]
+                game_moves = [moves for moves, k in zip(game_moves, keep) if k]
+                states = next_states[keep]
+                masks = next_masks[keep]
 
-                    # Select best or random move
-                    if np.random.random() > epsilon:
-                        all_q_values = self._dqn.predict(np.array([state]))[0]
-                        q_values = []
-                        for move in valid_moves:
-                            q_values.append(all_q_values[move_to_index(move)])
-                        move = valid_moves[np.argmax(q_values)]
-                    else:
-                        move = valid_moves[np.random.randint(0, num_valid_moves)]
-
-                    # Apply move
-                    reward = game.make_move(move)
-                    valid_moves = game.get_valid_moves()
-                    num_valid_moves = len(valid_moves)
-                    done = num_valid_moves == 0
-
-                    # Add data to batch
-                    next_state = game.get_state_vector()
-                    training_data.append((state, move, reward, next_state, done))
-
-                    # Exit game if lost
-                    if done:
-                        break
-
-                # Write game to CSV file
-                score = game.get_score()
-                if make_csv_log:
-                    csv_writer.writerow([str(game_count), str(score)])
-
-                # Progress Printouts
-                progress_tracker.update(float(game_count) / num_games)
-                if score_tracker.update(score):
-
-                    # Update score lists
-                    plot_mean_score.append(score_tracker.get_mean_score())
-                    plot_min_score.append(score_tracker.get_min_score())
-                    plot_max_score.append(score_tracker.get_max_score())
-                    plot_game_count.append(game_count)
-
-                    # Update progress plot
-                    axes.clear()
-                    axes.set_title('Score Progress')
-                    axes.set_xlabel('Game')
-                    axes.set_ylabel('Score')
-                    axes.plot(plot_game_count, plot_mean_score, label='Mean')
-                    axes.plot(plot_game_count, plot_min_score, label='Min')
-                    axes.plot(plot_game_count, plot_max_score, label='Max')
-                    axes.legend()
-                    axes.grid()
-                    plt.draw()
-                    plt.pause(1e-6)
-
-                    # Reset score tracker
-                    score_tracker.reset()
-
-                # Increment game count
-                game_count += 1
-
-            # Form training data from games
+            # Fit network to replay data
             print('Fitting Model...')
-            states = []
-            q_vectors = []
-            for (state, move, reward, next_state, done) in training_data:
-                states.append(state)
-                move_index = move_to_index(move)
-                q_vector = self._dqn.predict(np.array([state]))[0]
-                if not done:
-                    max_future_q = np.max(self._dqn.predict(np.array([next_state]))[0])
-                    q_vector[move_index] = reward + discount * max_future_q
-                else:
-                    q_vector[move_index] = reward
-                q_vectors.append(q_vector)
+            self.fit_replay(num_transitions, discount, batch_size, predict_batch_size)
+            self._num_fits_done = fit_i + 1
+
+            # Periodic checkpoint
+            if checkpoint_name is not None and self._num_fits_done % checkpoint_interval == 0:
+                metrics.flush()
+                self.save(checkpoint_name)
+
+        # Stop printouts, close metrics logger and recorders
+        progress_tracker.stop()
+        score_tracker.stop()
+        metrics.close()
+        if writer is not None:
+            writer.close()
+        if record_writer is not None:
+            record_writer.close()
+
+    def fit_replay(self, num_samples, discount, batch_size=32, predict_batch_size=4096, replay=None):
+        """
+        Samples transitions from replay buffer and fits network to their Q-targets
+        :param num_samples: Number of transitions to sample
+        :param discount: DQN discount factor [0,1]
+        :param batch_size: Minibatch size for fitting network
+        :param predict_batch_size: Batch size for computing Q-targets
+        :param replay: ReplayBuffer or TrajectoryDataset to sample (default agent replay buffer)
+        :return: None
+        """
+
+        # Sample training data from replay buffer
+        if replay is None:
+            replay = self._replay
+        states, move_indices, rewards, next_states, dones, weights, indices = replay.sample(num_samples)
+
+        # Batched Q-value predictions for states and next states
+        q_vectors = self._dqn.predict(states, batch_size=predict_batch_size)
+        max_future_q = np.max(self._dqn.predict(next_states, batch_size=predict_batch_size), axis=1)
+
+        # Bellman targets (future value masked out for terminal moves)
+        targets = rewards + discount * max_future_q * ~dones
+        rows = np.arange(num_samples)
+        replay.update_priorities(indices, targets - q_vectors[rows, move_indices])
+        q_vectors[rows, move_indices] = targets
+
+        # Train network
+        self._dqn.fit(states, q_vectors, batch_size=batch_size, sample_weight=weights, verbose=0)
+        self._policy = None
+
+    @staticmethod
+    def make_replay(capacity, prioritized=False, packed=False):
+        """
+        Makes empty replay buffer for DQN training
+        :param capacity: Max transitions kept in replay buffer
+        :param prioritized: Use prioritized (vs uniform) replay sampling
+        :param packed: Store states as packed 'bits' state vectors (unpacked when sampled)
+        :return: ReplayBuffer
+        """
+        if packed:
+            return ReplayBuffer(capacity, STATE_BITS_BYTES, prioritized=prioritized,
+                                state_dtype=np.uint8, unpack=unpack_state_bits)
+        else:
+            state_dim = len(SquareStackerGame().get_state_vector())
+            return ReplayBuffer(capacity, state_dim, prioritized=prioritized)
+
+    def get_replay_encoding(self):
+        """
+        :return: State vector encoding stored in replay buffer ('state' or 'bits')
+        """
+        if self._replay is not None and self._replay.get_state_dtype() == np.uint8:
+            return 'bits'
+        else:
+            return 'state'
+
+    def _unpack(self, states):
+        """
+        Converts states in replay encoding to network inputs
+        :param states: State vectors [np.array]
+        :return: Network input vectors [np.array]
+        """
+        if self.get_replay_encoding() == 'bits':
+            return unpack_state_bits(states)
+        else:
+            return states
+
+    def get_replay(self):
+        """
+        :return: Experience replay buffer (or None before training)
+        """
+        return self._replay
 
-            # Train network
-            self._dqn.fit(np.array(states), np.array(q_vectors), verbose=0)
+    def set_replay(self, replay):
+        """
+        Sets experience replay buffer used by training
+        :param replay: ReplayBuffer
+        :return: None
+        """
+        self._replay = replay
 
-        pass
+    def get_weights(self):
+        """
+        :return: List [W1, b1, W2, b2, ...] of network weights
+        """
+        return self._dqn.get_weights()
+
+    def save(self, file_name, save_replay=True):
+        """
+        Saves checkpoint of network weights, optimizer state and replay buffer
+        :param file_name: Path of .npz checkpoint file
+        :param save_replay: Include replay buffer snapshot
+        :return: None
+        """
+        arrays = {'num_fits_done': np.array(self._num_fits_done)}
+        for n, w in enumerate(self._dqn.get_weights()):
+            arrays[f'dqn_{n}'] = w
+        for n, w in enumerate(self._get_optimizer_state()):
+            arrays[f'opt_{n}'] = w
+        if save_replay and self._replay is not None:
+            for key, array in self._replay.to_arrays().items():
+                arrays[f'replay_{key}'] = array
+
+        # Write to temporary file first so interrupted saves keep last checkpoint
+        tmp_name = file_name + '.tmp'
+        with open(tmp_name, 'wb') as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(tmp_name, file_name)
+
+    def load(self, file_name, load_replay=True):
+        """
+        Loads checkpoint saved by DQNAgent.save
+        :param file_name: Path of .npz checkpoint file
+        :param load_replay: Restore replay buffer snapshot (if saved)
+        :return: None
+        """
+        with np.load(file_name) as arrays:
+            dqn_weights = self._get_arrays(arrays, 'dqn_')
+            opt_weights = self._get_arrays(arrays, 'opt_')
+
+            if len(opt_weights) > 0:
+                self._set_optimizer_state(opt_weights, dqn_weights)
+            self._dqn.set_weights(dqn_weights)
+            self._policy = None
+
+            # Training progress and replay buffer
+            self._num_fits_done = int(arrays['num_fits_done'])
+            if load_replay and 'replay_states' in arrays:
+                replay_arrays = {}
+                for key in arrays.files:
+                    if key.startswith('replay_'):
+                        replay_arrays[key[len('replay_'):]] = arrays[key]
+                unpack = unpack_state_bits if replay_arrays['states'].dtype == np.uint8 else None
+                self._replay = ReplayBuffer.from_arrays(replay_arrays, unpack)
+
+    def _optimizer_variables(self):
+        """
+        Builds optimizer state variables for network (Keras 3 and tf.keras >= 2.11 optimizers)
+        :return: List of optimizer variables (or None for Keras 2 optimizers without build)
+        """
+        optimizer = self._dqn.optimizer
+        if not hasattr(optimizer, 'build'):
+            return None
+        optimizer.build(self._dqn.trainable_variables)
+        variables = optimizer.variables
+        return list(variables() if callable(variables) else variables)
+
+    def _get_optimizer_state(self):
+        """
+        :return: List of optimizer state arrays
+        """
+        variables = self._optimizer_variables()
+        if variables is None:
+            return self._dqn.optimizer.get_weights()
+        return [np.array(variable) for variable in variables]
+
+    def _set_optimizer_state(self, opt_weights, dqn_weights):
+        """
+        Restores optimizer state saved by _get_optimizer_state
+        :param opt_weights: List of optimizer state arrays
+        :param dqn_weights: List of network weights (shapes of Keras 2 warm-up update)
+        :return: None
+        """
+        variables = self._optimizer_variables()
+        if variables is None:
+
+            # Keras 2 optimizer weights only exist after first update
+            if len(self._dqn.optimizer.get_weights()) == 0:
+                dim_in = dqn_weights[0].shape[0]
+                dim_out = dqn_weights[-1].shape[0]
+                self._dqn.train_on_batch(np.zeros((1, dim_in)), np.zeros((1, dim_out)))
+            self._dqn.optimizer.set_weights(opt_weights)
+            return
+        if len(variables) != len(opt_weights):
+            raise ValueError(f'Checkpoint has {len(opt_weights)} optimizer arrays, optimizer has {len(variables)}')
+        for variable, w in zip(variables, opt_weights):
+            variable.assign(w)
+
+    @staticmethod
+    def _get_arrays(arrays, prefix):
+        """
+        Returns numbered arrays [prefix0, prefix1, ...] from loaded archive
+        :param arrays: Loaded .npz archive
+        :param prefix: Array name prefix
+        :return: List of arrays
+        """
+        result = []
+        while f'{prefix}{len(result)}' in arrays:
+            result.append(arrays[f'{prefix}{len(result)}'])
+        return result
+
+    def export_policy(self, quantize=False):
+        """
+        Exports trained weights to a NumPy-only policy
+        :param quantize: Store layer matrices as int8 with per-column scales
+        :return: DQNPolicy
+        """
+        return DQNPolicy(self._dqn.get_weights(), quantize=quantize)
 
     def select_move(self, game):
         """
         Selects move which maximizes Q-values predicted by DQN
+        Q-values come from a NumPy policy of the current weights (see export_policy),
+        rebuilt after training or loading, so moves need no Keras predict call.
         :param game: Current game [SquareStackerGame]
         :return: Move [k, i, j] or None if no moves exist
         """
-        state = game.get_state_vector()
-        valid_moves = game.get_valid_moves()
-        if len(valid_moves) > 0:
-            all_q_values = self._dqn.predict(np.array([state]))[0]
-            q_values = []
-            for move in valid_moves:
-                q_values.append(all_q_values[move_to_index(move)])
-            return valid_moves[np.argmax(q_values)]
-        else:
-            return None
+        if self._policy is None:
+            self._policy = self.export_policy()
+        mask = game.get_valid_move_mask()
+        index = self._policy.select_move_indices(game.get_state_vector()[np.newaxis], mask[np.newaxis])[0]
+        return index_to_move(int(index)) if index >= 0 else None
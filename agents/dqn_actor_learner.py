@@ -0,0 +1,274 @@
+"""
+dqn_actor_learner.py
+Multi-process actor/learner training for the Square Stacker Deep Q Network agent
+
+Actor processes play epsilon-greedy self-play games with a NumPy copy of the
+network (see DQNPolicy), so they never import TensorFlow. Their experience is
+streamed in chunks through a queue to the learner (the calling process), which
+adds it to the DQNAgent replay buffer and fits the network continuously.
+The learner periodically publishes its weights to a shared-memory array which
+actors poll between steps.
+"""
+
+import multiprocessing as mp
+from queue import Empty
+from time import time
+
+import numpy as np
+
+from agents.dqn_policy import DQNPolicy
+from square_stacker_game import SquareStackerGame, index_to_move, unpack_state_bits
+from utils.score_tracker import ScoreTracker, ScoreSummary
+
+
+def _run_actor(actor_id, shapes, shared_weights, weights_version, weights_lock, experience_queue,
+               stop_event, games_counter, steps_counter, num_envs, epsilon, chunk_size, encoding, seed):
+    """
+    Actor process main loop: plays self-play games and sends experience chunks
+    Chunks are tuples (version, states, move_indices, rewards, next_states, dones, scores),
+    where scores is a ScoreSummary of games finished since the last chunk.
+    :param actor_id: Index of actor
+    :param shapes: Shapes of network weight arrays
+    :param shared_weights: Flat float32 shared array of network weights
+    :param weights_version: Shared counter incremented on each weights publish
+    :param weights_lock: Lock guarding shared_weights
+    :param experience_queue: Queue of experience chunks to learner
+    :param stop_event: Event set by learner to stop actors
+    :param games_counter: Shared counter of games played by all actors
+    :param steps_counter: Shared counter of moves made by all actors
+    :param num_envs: Number of self-play games run concurrently
+    :param epsilon: Probability of random action [0,1]
+    :param chunk_size: Number of transitions per experience chunk
+    :param encoding: State vector encoding of experience ('state' or 'bits')
+    :param seed: Random seed of actor
+    :return: None
+    """
+    np.random.seed(seed)
+    flat_weights = np.frombuffer(shared_weights, dtype=np.float32)
+
+    # Weight sync from learner
+    def sync():
+        with weights_lock:
+            version_ = weights_version.value
+            flat = flat_weights.copy()
+        weights, offset = [], 0
+        for shape in shapes:
+            size = int(np.prod(shape))
+            weights.append(flat[offset:offset + size].reshape(shape))
+            offset += size
+        return DQNPolicy(weights), version_
+
+    policy, version = sync()
+
+    # Self-play games
+    games = [SquareStackerGame() for _ in range(num_envs)]
+    states = np.array([game.get_state_vector(encoding) for game in games])
+    masks = np.array([game.get_valid_move_mask() for game in games])
+    chunk = []
+    scores = ScoreSummary()
+
+    while not stop_event.is_set():
+
+        # Pick up newly published weights
+        if weights_version.value != version:
+            policy, version = sync()
+
+        # Epsilon-greedy moves from one batched forward pass
+        explore = np.random.random(num_envs) <= epsilon
+        inputs = unpack_state_bits(states) if encoding == 'bits' else states
+        best_indices = policy.select_move_indices(inputs, masks)
+        random_indices = np.argmax(np.where(masks, np.random.random(masks.shape), -1.0), axis=1)
+        move_indices = np.where(explore, random_indices, best_indices)
+
+        # Apply moves
+        rewards = np.zeros(num_envs, dtype=np.float32)
+        next_states = np.empty_like(states)
+        next_masks = np.empty_like(masks)
+        for n in range(num_envs):
+            rewards[n] = games[n].make_move(index_to_move(int(move_indices[n])))
+            next_states[n] = games[n].get_state_vector(encoding)
+            next_masks[n] = games[n].get_valid_move_mask()
+        dones = ~np.any(next_masks, axis=1)
+        chunk.append((states, move_indices, rewards, next_states.copy(), dones))
+
+        # Auto-reset finished games
+        for n in np.flatnonzero(dones):
+            scores.update(games[n].get_score())
+            games[n] = SquareStackerGame()
+            next_states[n] = games[n].get_state_vector(encoding)
+            next_masks[n] = games[n].get_valid_move_mask()
+        states = next_states
+        masks = next_masks
+
+        # Update throughput counters
+        with steps_counter.get_lock():
+            steps_counter.value += num_envs
+        if np.any(dones):
+            with games_counter.get_lock():
+                games_counter.value += int(np.sum(dones))
+
+        # Send experience chunk
+        if len(chunk) * num_envs >= chunk_size:
+            experience_queue.put((version,) + tuple(np.concatenate(x) for x in zip(*chunk)) + (scores,))
+            chunk = []
+            scores = ScoreSummary()
+
+
+class ActorLearner:
+
+    def __init__(self, agent, num_actors=4, num_envs=64, epsilon=0.1, sync_interval=100,
+                 max_staleness=10, chunk_size=1024, replay_capacity=100000, prioritized=False,
+                 packed_replay=False):
+        """
+        Constructs actor/learner trainer for DQN agent
+        :param agent: DQNAgent to train (learner network)
+        :param num_actors: Number of actor processes
+        :param num_envs: Number of games run concurrently per actor
+        :param epsilon: Probability of random action [0,1]
+        :param sync_interval: Learner updates between weight publishes to actors
+        :param max_staleness: Max weight versions an experience chunk may lag (older chunks are dropped)
+        :param chunk_size: Transitions per experience chunk sent by actors
+        :param replay_capacity: Max transitions kept in replay buffer (if agent has none yet)
+        :param prioritized: Use prioritized (vs uniform) replay sampling (if agent has no buffer yet)
+        :param packed_replay: Store and send states as packed 'bits' vectors (if agent has no buffer yet)
+        """
+        self._agent = agent
+        self._num_actors = num_actors
+        self._num_envs = num_envs
+        self._epsilon = epsilon
+        self._sync_interval = sync_interval
+        self._max_staleness = max_staleness
+        self._chunk_size = chunk_size
+
+        # Experience replay buffer
+        if agent.get_replay() is None:
+            agent.set_replay(agent.make_replay(replay_capacity, prioritized, packed_replay))
+
+        # Throughput counters
+        self._stats = {}
+
+    def run(self, num_updates, discount, batch_size=32, min_replay=10000, print_interval=5.0, batches_per_fit=16):
+        """
+        Runs actors and trains learner network
+        :param num_updates: Number of minibatch updates to make
+        :param discount: DQN discount factor [0,1]
+        :param batch_size: Transitions per minibatch update
+        :param min_replay: Transitions in replay buffer before updates start
+        :param print_interval: Print interval of throughput stats [s]
+        :param batches_per_fit: Minibatch updates per network fit (one Q-target prediction and
+            fit call for all of them, instead of per minibatch)
+        :return: Dict of throughput stats (see get_stats)
+        """
+
+        # Initial printout
+        print('Training Square Stacker DQN (actor/learner)')
+        print(f'Actors: {self._num_actors}, Games per actor: {self._num_envs}\n')
+
+        # Shared weights
+        weights = self._agent.get_weights()
+        shapes = [w.shape for w in weights]
+        ctx = mp.get_context('spawn')
+        shared_weights = ctx.RawArray('f', int(sum(w.size for w in weights)))
+        flat_weights = np.frombuffer(shared_weights, dtype=np.float32)
+        weights_version = ctx.RawValue('l', 0)
+        weights_lock = ctx.Lock()
+
+        def publish():
+            flat = np.concatenate([np.ravel(w) for w in self._agent.get_weights()])
+            with weights_lock:
+                flat_weights[:] = flat
+                weights_version.value += 1
+
+        publish()
+
+        # Start actors
+        experience_queue = ctx.Queue(maxsize=4 * self._num_actors)
+        stop_event = ctx.Event()
+        games_counter = ctx.Value('l', 0)
+        steps_counter = ctx.Value('l', 0)
+        actors = []
+        for actor_id in range(self._num_actors):
+            actor = ctx.Process(target=_run_actor, daemon=True, args=(
+                actor_id, shapes, shared_weights, weights_version, weights_lock, experience_queue,
+                stop_event, games_counter, steps_counter, self._num_envs, self._epsilon,
+                self._chunk_size, self._agent.get_replay_encoding(), np.random.randint(2 ** 31)))
+            actor.start()
+            actors.append(actor)
+
+        # Learner loop
+        replay = self._agent.get_replay()
+        score_tracker = ScoreTracker(100)
+        num_chunks = 0
+        num_dropped = 0
+        updates = 0
+        time_init = time()
+        time_print = time_init
+        score_tracker.start()
+        try:
+            while updates < num_updates:
+
+                # Drain experience from actors (block only while replay buffer fills)
+                while True:
+                    try:
+                        block = len(replay) < min_replay
+                        version, states, move_indices, rewards, next_states, dones, scores = \
+                            experience_queue.get(block=block, timeout=1.0 if block else None)
+                    except Empty:
+                        if block and not all(actor.is_alive() for actor in actors):
+                            codes = [actor.exitcode for actor in actors]
+                            raise RuntimeError(f'Actor process exited while filling replay buffer (exit codes {codes})')
+                        break
+                    num_chunks += 1
+                    score_tracker.merge(scores)
+                    if weights_version.value - version > self._max_staleness:
+                        num_dropped += 1
+                        continue
+                    replay.add_batch(states, move_indices, rewards, next_states, dones)
+
+                # Minibatch updates (several per fit, publishing weights every sync_interval updates)
+                if len(replay) >= min_replay:
+                    num_batches = min(batches_per_fit, num_updates - updates)
+                    self._agent.fit_replay(num_batches * batch_size, discount, batch_size, num_batches * batch_size)
+                    updates += num_batches
+                    if updates // self._sync_interval > (updates - num_batches) // self._sync_interval:
+                        publish()
+
+                # Throughput printouts
+                time_now = time()
+                self._stats = {
+                    'actor_games': games_counter.value,
+                    'actor_steps': steps_counter.value,
+                    'actor_steps_per_sec': steps_counter.value / (time_now - time_init),
+                    'learner_updates': updates,
+                    'learner_samples_per_sec': updates * batch_size / (time_now - time_init),
+                    'chunks_received': num_chunks,
+                    'chunks_dropped': num_dropped,
+                    'weights_version': weights_version.value,
+                }
+                if time_now - time_print > print_interval:
+                    time_print = time_now
+                    print(f'Updates: {updates}/{num_updates}, '
+                          f'Actor steps/s: {self._stats["actor_steps_per_sec"]:.1f}, '
+                          f'Learner samples/s: {self._stats["learner_samples_per_sec"]:.1f}, '
+                          f'Dropped chunks: {num_dropped}/{num_chunks}')
+        finally:
+
+            # Stop actors and score printouts
+            score_tracker.stop()
+            stop_event.set()
+            while any(actor.is_alive() for actor in actors):
+                try:
+                    experience_queue.get(timeout=0.1)
+                except Empty:
+                    pass
+            for actor in actors:
+                actor.join()
+
+        print('\nComplete!\n')
+        return self.get_stats()
+
+    def get_stats(self):
+        """
+        :return: Dict of actor and learner throughput counters from last run
+        """
+        return dict(self._stats)
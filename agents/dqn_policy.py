@@ -0,0 +1,145 @@
+"""
+dqn_policy.py
+Square Stacker Deep Q Network policy evaluated in pure NumPy
+
+Trained DQNAgent weights are exported into a DQNPolicy (see DQNAgent.export_policy),
+which runs the dense ReLU network forward pass with NumPy only. Evaluation and
+serving therefore do not need TensorFlow or Keras imported at all.
+"""
+
+import numpy as np
+
+from agents.agent import Agent
+from square_stacker_game import index_to_move
+
+
+class DQNPolicy:
+
+    def __init__(self, weights, quantize=False):
+        """
+        Constructs policy from dense layer weights
+        :param weights: List [W1, b1, W2, b2, ...] as returned by Keras get_weights()
+        :param quantize: Store layer matrices as int8 with per-column scales (dequantized
+            once here, so int8 only shrinks saved files and the forward pass stays float32)
+        """
+        self._quantize = quantize
+        self._layers = []
+        self._quantized = []
+        for n in range(0, len(weights), 2):
+            w = np.asarray(weights[n], dtype=np.float32)
+            b = np.asarray(weights[n + 1], dtype=np.float32)
+            if quantize:
+                scale = np.max(np.abs(w), axis=0) / 127.0
+                scale[scale == 0.0] = 1.0
+                w = np.round(w / scale).astype(np.int8)
+                self._add_quantized(w, b, scale.astype(np.float32))
+            else:
+                self._layers.append((w, b))
+
+    def _add_quantized(self, w, b, scale):
+        """
+        Adds int8 layer, kept for saving and dequantized for forward pass
+        :param w: Layer matrix [np.array int8]
+        :param b: Layer bias [np.array float32]
+        :param scale: Per-column scales of layer matrix [np.array float32]
+        :return: None
+        """
+        self._quantized.append((w, scale))
+        self._layers.append((w.astype(np.float32) * scale, b))
+
+    def q_values(self, states):
+        """
+        Runs network forward pass
+        :param states: State vectors [np.array N x state_dim]
+        :return: Q-values [np.array N x 27]
+        """
+        x = np.asarray(states, dtype=np.float32)
+        last = len(self._layers) - 1
+        for n, (w, b) in enumerate(self._layers):
+            x = x @ w
+            x += b
+            if n < last:
+                np.maximum(x, 0.0, out=x)
+        return x
+
+    def select_move_indices(self, states, masks):
+        """
+        Selects highest Q-value valid moves for batch of states
+        :param states: State vectors [np.array N x state_dim]
+        :param masks: Valid move masks [np.array N x 27]
+        :return: Move indices [np.array N] (-1 where no moves are valid)
+        """
+        masks = np.asarray(masks, dtype=bool)
+        q_values = np.where(masks, self.q_values(states), -np.inf)
+        indices = np.argmax(q_values, axis=1)
+        indices[~np.any(masks, axis=1)] = -1
+        return indices
+
+    def get_weights(self):
+        """
+        :return: List [W1, b1, W2, b2, ...] of float32 layer weights (dequantized if quantized)
+        """
+        weights = []
+        for w, b in self._layers:
+            weights += [w, b]
+        return weights
+
+    def save(self, file_name):
+        """
+        Saves policy to compressed NumPy archive
+        :param file_name: Path of .npz file
+        :return: None
+        """
+        arrays = {'quantize': np.array(self._quantize)}
+        for n, (w, b) in enumerate(self._layers):
+            arrays[f'w{n}'] = self._quantized[n][0] if self._quantize else w
+            arrays[f'b{n}'] = b
+            if self._quantize:
+                arrays[f's{n}'] = self._quantized[n][1]
+        np.savez_compressed(file_name, **arrays)
+
+    @staticmethod
+    def load(file_name):
+        """
+        Loads policy saved by DQNPolicy.save
+        :param file_name: Path of .npz file
+        :return: DQNPolicy
+        """
+        with np.load(file_name) as arrays:
+            policy = DQNPolicy([])
+            policy._quantize = bool(arrays['quantize'])
+            n = 0
+            while f'w{n}' in arrays:
+                if policy._quantize:
+                    policy._add_quantized(arrays[f'w{n}'], arrays[f'b{n}'], arrays[f's{n}'])
+                else:
+                    policy._layers.append((arrays[f'w{n}'], arrays[f'b{n}']))
+                n += 1
+        return policy
+
+
+class DQNPolicyAgent(Agent):
+
+    def __init__(self, policy):
+        """
+        Constructs agent from exported policy
+        :param policy: DQNPolicy or path of .npz file saved by DQNPolicy.save
+        """
+        Agent.__init__(self)
+        if isinstance(policy, str):
+            policy = DQNPolicy.load(policy)
+        self._policy = policy
+
+    def select_move(self, game):
+        """
+        Selects move which maximizes Q-values predicted by policy
+        :param game: Current game [SquareStackerGame]
+        :return: Move [k, i, j] or None if no moves exist
+        """
+        state = game.get_state_vector()
+        mask = game.get_valid_move_mask()
+        index = self._policy.select_move_indices(state[np.newaxis], mask[np.newaxis])[0]
+        if index >= 0:
+            return index_to_move(int(index))
+        else:
+            return None
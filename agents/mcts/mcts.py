@@ -23,14 +23,24 @@ import math
 from agents.agent import Agent
 from square_stacker_game import SquareStackerGame
 from agents.mcts.Node import Node
+from agents.search.moves import group_moves
+from utils.transposition_table import KIND_MCTS, depth_tag, hash_state
+
+# transposition table depth tag of MCTS simulation results
+TABLE_DEPTH = depth_tag(KIND_MCTS)
 
 
 class MCTS(Agent):
 
-    def __init__(self, max_sims = 50):
+    def __init__(self, max_sims = 50, table=None, dedup=False, symmetric=False, min_visits=8):
         # Takes an instance of a Board and optionally some keyword
         # arguments.  Initializes the list of game states and the
-        # statistics tables.
+        # statistics tables. An optional TranspositionTable shares
+        # simulation results between searches and processes; a state's
+        # mean result is reused once min_visits simulations are
+        # averaged into it (until then simulations run and accumulate). With
+        # dedup, moves with the same afterstate (or a symmetric one)
+        # share one child node.
 
         Agent.__init__(self)
 
@@ -41,6 +51,11 @@ class MCTS(Agent):
 
         # parameters to change for how deep it goes
         self.max_sims = max_sims
+        self.table = table
+        self.min_visits = min_visits
+        self.dedup = dedup
+        self.symmetric = symmetric
+        self.num_deduplicated = 0
 
     def select_move(self, game):
         # type: (SquareStackerGame) -> None
@@ -50,7 +65,7 @@ class MCTS(Agent):
         :return: best possible move
         """
 
-        root = deepcopy(game)
+        root = game.deepcopy()
         self.root_node = Node(root)
         self.total_simulations = 0
         # while within some limit (time or power)
@@ -116,6 +131,11 @@ class MCTS(Agent):
         self.debug("EXPAND CHILDREN")
         valid_moves = parent.valid_moves
 
+        # one child per afterstate
+        if self.dedup:
+            valid_moves, num_deduplicated = group_moves(parent.game_state, self.symmetric)
+            self.num_deduplicated += num_deduplicated
+
         # if not node.children:
         for move in valid_moves:
             new_game = parent.game_state.deepcopy()
@@ -133,6 +153,14 @@ class MCTS(Agent):
     # SIMULATION
     def simulation(self, node):
         self.debug("SIMULATION")
+
+        # reuses mean simulated points of state if sampled enough
+        if self.table is not None:
+            key = hash_state(node.game_state)
+            entry = self.table.lookup(key, TABLE_DEPTH)
+            if entry is not None and entry[0] >= self.min_visits:
+                return node.state_score + entry[1]
+
         # creates copy of game to run simulation on
         sim_game = node.game_state.deepcopy()
         sim_node = deepcopy(node)
@@ -141,6 +169,8 @@ class MCTS(Agent):
         while self.non_terminal(sim_node):
             sim_node = self.sim_random(sim_node)
 
+        if self.table is not None:
+            self.table.store(key, TABLE_DEPTH, sim_node.state_score - node.state_score, accumulate=True)
         return sim_node.state_score
 
     # randomly select child
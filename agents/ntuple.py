@@ -0,0 +1,324 @@
+"""
+ntuple.py
+Square Stacker n-tuple network agent trained by afterstate TD(0) learning
+
+The value of an afterstate (board and remaining pieces after a move, before new
+pieces are dealt) is a sum of lookup-table entries, one per board pattern:
+    Lines = Per color, each cell's (has color, empty layers) along each row,
+            column (shared table) and diagonal (own table)
+    Tiles = Layer colors of each tile relabeled by first appearance, with one
+            table per tile class (corner, edge, center)
+    Pieces = Occupied layer of each remaining piece and its number of open cells
+    Combo = Combo count after move
+Colors are interchangeable in the game rules, so tables are shared by all colors.
+Moves maximize points + afterstate value, and tables are updated toward
+the next move's points + afterstate value (0 when the game ends).
+
+Reference: Szubert and Jaskowski, Temporal Difference Learning of N-Tuple Networks
+for the Game 2048 (CIG 2014)
+"""
+
+import numpy as np
+
+from agents.agent import Agent
+from square_stacker_game import afterstates, batch_afterstates, index_to_move
+from utils.game_records import GameRecordWriter
+from utils.progress_tracker import ProgressTracker
+from utils.score_tracker import ScoreTracker
+
+# Lookup table sizes and offsets
+_num_colors = 6
+_max_combo = 15
+_table_sizes = {
+    'line': 8 ** 3,
+    'diag': 8 ** 3,
+    'tile': 3 * 4 ** 3,
+    'piece': 4 * 10,
+    'combo': _max_combo + 1,
+}
+_offsets = {}
+_num_weights = 0
+for _name, _size in _table_sizes.items():
+    _offsets[_name] = _num_weights
+    _num_weights += _size
+
+# Weight indices per afterstate (lines, diagonals, tiles, pieces, combo)
+_num_features = 8 * _num_colors + 9 + 3 + 1
+
+# Tile class of each cell (corner 0, edge 1, center 2)
+_tile_class = np.array([0, 1, 0, 1, 2, 1, 0, 1, 0])
+
+
+def _make_tile_tables():
+    """
+    Precomputes per-tile lookups indexed by tile color code (49 * layer 0 + 7 * layer 1 + layer 2)
+    :return canon: Tile colors relabeled by first appearance [np.array 343] (4 ** 3 values)
+    :return cells: Line cell code of each color, 4 * has color + empty layers [np.array 343 x 6]
+    :return empty: Empty layers [np.array 343 x 3]
+    """
+    canon = np.zeros(7 ** 3, dtype=np.int64)
+    cells = np.zeros((7 ** 3, _num_colors), dtype=np.int64)
+    empty = np.zeros((7 ** 3, 3), dtype=np.int64)
+    for code in range(7 ** 3):
+        colors = [code // 49, (code // 7) % 7, code % 7]
+        labels = {0: 0}
+        index = 0
+        for color in colors:
+            if color not in labels:
+                labels[color] = len(labels)
+            index = 4 * index + labels[color]
+        canon[code] = index
+        empty[code] = [color == 0 for color in colors]
+        for color in range(1, _num_colors + 1):
+            cells[code, color - 1] = 4 * (color in colors) + colors.count(0)
+    return canon, cells, empty
+
+
+_tile_canon, _tile_cells, _tile_empty = _make_tile_tables()
+
+# Cells of each line (rows, columns, then diagonals) and table offset of each line
+_line_cells = np.array([[0, 1, 2], [3, 4, 5], [6, 7, 8], [0, 3, 6], [1, 4, 7], [2, 5, 8], [0, 4, 8], [2, 4, 6]])
+_line_offsets = np.array([_offsets['line']] * 6 + [_offsets['diag']] * 2)[:, np.newaxis]
+
+# Tile table index of each cell and tile code
+_tile_index = _offsets['tile'] + 64 * _tile_class[:, np.newaxis] + _tile_canon[np.newaxis, :]
+
+# Occupied layer of each piece code (0 = none)
+_piece_layer = np.array([next((n + 1 for n, c in enumerate([code // 49, (code // 7) % 7, code % 7]) if c), 0)
+                         for code in range(7 ** 3)])
+
+
+def afterstate_features(boards, pieces, combos):
+    """
+    Computes lookup-table weight indices of batch of afterstates
+    Tiles are looked up once per afterstate, then each tuple is one gather over all afterstates.
+    :param boards: Board color codes [np.array B x 3 x 3 x 3] (0 = empty)
+    :param pieces: Remaining piece color codes [np.array B x 3 x 3] (0 = empty)
+    :param combos: Combo counts after moves [np.array B]
+    :return: Weight indices [np.array B x num_features]
+    """
+    num_states = boards.shape[0]
+    tile_codes = boards.reshape(num_states, 9, 3) @ np.array([49, 7, 1])
+
+    # Lines per color from cell codes [B x 9 x 6] (rows and columns share table)
+    cell_codes = _tile_cells[tile_codes]
+    lines = _line_offsets + 64 * cell_codes[:, _line_cells[:, 0]] + 8 * cell_codes[:, _line_cells[:, 1]] + \
+        cell_codes[:, _line_cells[:, 2]]
+    lines = lines.transpose(0, 2, 1)
+
+    # Tiles
+    tile_index = _tile_index[np.arange(9), tile_codes]
+
+    # Pieces: occupied layer (0 = none) and number of cells with that layer empty
+    layer = _piece_layer[pieces @ np.array([49, 7, 1])]
+    open_cells = np.zeros((num_states, 4), dtype=np.int64)
+    open_cells[:, 1:] = np.sum(_tile_empty[tile_codes], axis=1)
+    piece_index = _offsets['piece'] + 10 * layer + np.take_along_axis(open_cells, layer, axis=1)
+
+    # Combo
+    combo_index = _offsets['combo'] + np.minimum(combos, _max_combo)
+
+    return np.concatenate((
+        lines[..., :6].reshape(num_states, 6 * _num_colors),
+        lines[..., 6:].reshape(num_states, 2 * _num_colors),
+        tile_index,
+        piece_index,
+        combo_index[:, np.newaxis],
+    ), axis=1)
+
+
+class NTupleAgent(Agent):
+
+    def __init__(self, weights=None):
+        """
+        Constructs n-tuple network agent
+        :param weights: Lookup-table weights (or None for all zeros)
+        """
+        Agent.__init__(self)
+        self._weights = np.zeros(_num_weights, dtype=np.float32) if weights is None else weights
+
+    def _afterstates(self, game):
+        """
+        Makes afterstates of all valid moves
+        :param game: Current game [SquareStackerGame]
+        :return move_indices: Indices of valid moves [np.array]
+        :return points: Points of each move [np.array]
+        :return features: Weight indices of each afterstate [np.array]
+        """
+        codes = game.get_state_vector('color')
+        move_indices, boards, pieces, points, combos = afterstates(codes[:36], codes[37])
+        return move_indices, points, afterstate_features(boards, pieces, combos)
+
+    def evaluate(self, features):
+        """
+        :param features: Weight indices of afterstates [np.array B x num_features]
+        :return: Afterstate values [np.array B]
+        """
+        return np.sum(self._weights[features], axis=1)
+
+    def select_move(self, game):
+        """
+        Selects move maximizing points plus afterstate value
+        :param game: Current game [SquareStackerGame]
+        :return: Move [k, i, j] or None if no moves exist
+        """
+        move_indices, points, features = self._afterstates(game)
+        if len(move_indices) == 0:
+            return None
+        return index_to_move(int(move_indices[np.argmax(points + self.evaluate(features))]))
+
+    def train(self, num_games, alpha=0.001, epsilon=0.0, record_path=None, num_parallel=256):
+        """
+        Trains lookup tables by afterstate TD(0) self-play
+        Games are played in lockstep: each step simulates and evaluates all moves of all
+        running games in one batch, applies all TD(0) updates at once and deals new
+        pieces with NumPy, so no SquareStackerGame objects are used.
+        :param num_games: Number of games to play
+        :param alpha: Learning rate per weight
+        :param epsilon: Probability of random action [0,1]
+        :param record_path: Path of game record file to append games to (or None)
+        :param num_parallel: Number of games played in lockstep
+        :return num_moves: Number of moves made
+        """
+
+        # Initial printout
+        print('Training Square Stacker N-Tuple Network')
+
+        # Progress trackers
+        progress_tracker = ProgressTracker(5.0)
+        score_tracker = ScoreTracker(1000)
+        record_writer = GameRecordWriter(record_path, append=True) if record_path is not None else None
+        progress_tracker.start()
+        score_tracker.start()
+
+        # Running games (codes are boards then pieces, as in 'color' state vectors)
+        num_slots = min(num_parallel, num_games)
+        codes = np.zeros((num_slots, 36), dtype=np.int64)
+        combos = np.zeros(num_slots, dtype=np.int64)
+        scores = np.zeros(num_slots, dtype=np.int64)
+        prev_features = np.zeros((num_slots, _num_features), dtype=np.int64)
+        has_prev = np.zeros(num_slots, dtype=bool)
+        game_deals = [bytearray() for _ in range(num_slots)]
+        game_moves = [bytearray() for _ in range(num_slots)]
+        self._deal(codes, np.arange(num_slots), game_deals)
+        running = np.ones(num_slots, dtype=bool)
+        num_started = num_slots
+        num_finished = 0
+        num_moves = 0
+
+        while np.any(running):
+            slots = np.flatnonzero(running)
+
+            # Simulate and evaluate all moves of running games
+            states, move_indices, boards, pieces, points, next_combos = batch_afterstates(codes[slots], combos[slots])
+            features = afterstate_features(boards, pieces, next_combos)
+            values = points + self.evaluate(features)
+
+            # Select best (first on ties) or random move of each game with moves
+            counts = np.bincount(states, minlength=len(slots))
+            playing = counts > 0
+            starts = np.cumsum(counts) - counts
+            order = np.lexsort((-values, states))
+            chosen = order[starts[playing]]
+            explore = np.random.random(len(chosen)) < epsilon
+            chosen[explore] = starts[playing][explore] + \
+                (np.random.random(np.count_nonzero(explore)) * counts[playing][explore]).astype(np.int64)
+
+            # TD(0) updates of previous afterstates (target is 0 when game is over)
+            targets = np.zeros(len(slots))
+            targets[playing] = values[chosen]
+            self._update(prev_features[slots[has_prev[slots]]], targets[has_prev[slots]], alpha)
+
+            # Make moves and deal pieces to games without pieces left
+            moving = slots[playing]
+            num_moves += len(moving)
+            codes[moving, :27] = boards[chosen].reshape(-1, 27)
+            codes[moving, 27:] = pieces[chosen].reshape(-1, 9)
+            combos[moving] = next_combos[chosen]
+            scores[moving] += points[chosen]
+            prev_features[moving] = features[chosen]
+            has_prev[moving] = True
+            if record_writer is not None:
+                for slot, move_index in zip(moving, move_indices[chosen]):
+                    game_moves[slot].append(move_index)
+            self._deal(codes, moving[~np.any(codes[moving, 27:], axis=1)], game_deals)
+
+            # Finish games without moves and start new games in their slots
+            for slot in slots[~playing]:
+                if record_writer is not None:
+                    record_writer.add(None, int(scores[slot]), bytes(game_deals[slot]), game_moves[slot])
+                score_tracker.update(int(scores[slot]))
+                num_finished += 1
+                progress_tracker.update(float(num_finished) / num_games)
+                if num_started < num_games:
+                    codes[slot] = 0
+                    combos[slot] = 0
+                    scores[slot] = 0
+                    has_prev[slot] = False
+                    game_deals[slot] = bytearray()
+                    game_moves[slot] = bytearray()
+                    self._deal(codes, [slot], game_deals)
+                    num_started += 1
+                else:
+                    running[slot] = False
+
+        # Stop printouts and close recorder
+        progress_tracker.stop()
+        score_tracker.stop()
+        if record_writer is not None:
+            record_writer.close()
+        return num_moves
+
+    @staticmethod
+    def _deal(codes, slots, game_deals):
+        """
+        Deals three random pieces (uniform color and layer) to games
+        :param codes: Board and piece color codes of games [np.array G x 36]
+        :param slots: Indices of games to deal to
+        :param game_deals: Dealt pieces of each game as codes 3 * color + layer [list of bytearray]
+        :return: None
+        """
+        slots = np.asarray(slots, dtype=np.int64)
+        colors = np.random.randint(0, _num_colors, (len(slots), 3))
+        layers = np.random.randint(0, 3, (len(slots), 3))
+        codes[slots, 27:] = 0
+        codes[slots[:, np.newaxis], 27 + 3 * np.arange(3) + layers] = colors + 1
+        for slot, deals in zip(slots, 3 * colors + layers):
+            game_deals[slot] += bytes(deals.astype(np.uint8))
+
+    def _update(self, features, targets, alpha):
+        """
+        Moves afterstate values toward targets
+        Each weight moves by its update averaged over the afterstates containing it, so
+        weights shared by many games in a batch take one step (as for a single afterstate).
+        :param features: Weight indices of afterstates [np.array B x num_features]
+        :param targets: Target values [np.array B]
+        :param alpha: Learning rate per weight
+        :return: None
+        """
+        deltas = targets - self.evaluate(features)
+        steps = np.bincount(features.ravel(), np.repeat(deltas, features.shape[1]), minlength=_num_weights)
+
+        # Number of afterstates containing each weight (repeats within one afterstate count once)
+        ordered = np.sort(features, axis=1)
+        first = np.ones(ordered.shape, dtype=bool)
+        first[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+        counts = np.bincount(ordered[first], minlength=_num_weights)
+        self._weights += (alpha * steps / np.maximum(counts, 1)).astype(self._weights.dtype)
+
+    def save(self, file_name):
+        """
+        Saves lookup tables
+        :param file_name: Path of .npy file
+        :return: None
+        """
+        np.save(file_name, self._weights)
+
+    @staticmethod
+    def load(file_name):
+        """
+        Loads agent saved by NTupleAgent.save
+        :param file_name: Path of .npy file
+        :return: NTupleAgent
+        """
+        return NTupleAgent(np.load(file_name))
@@ -4,15 +4,21 @@ Superclass for Square Stacker AI search agents
 """
 
 from agents.agent import Agent
+from agents.search.moves import group_moves
 
 
 class SearchAgent(Agent):
 
-    def __init__(self):
+    def __init__(self, dedup=False, symmetric=False):
         """
-        Empty constructor
+        Constructs search agent
+        :param dedup: Search one move per group of moves with the same afterstate
+        :param symmetric: Also group moves with symmetric afterstates (if dedup)
         """
         Agent.__init__(self)
+        self._dedup = dedup
+        self._symmetric = symmetric
+        self._num_deduplicated = 0
 
     def select_move(self, game):
         """
@@ -22,3 +28,21 @@ class SearchAgent(Agent):
         :return moves_searched: Number of moves searched before deciding
         """
         return None, 0
+
+    def get_search_moves(self, game):
+        """
+        Gets moves to search (one per afterstate if deduplicating)
+        :param game: Current game [SquareStackerGame]
+        :return: List of valid moves
+        """
+        if not self._dedup:
+            return game.get_valid_moves()
+        moves, num_deduplicated = group_moves(game, self._symmetric)
+        self._num_deduplicated += num_deduplicated
+        return moves
+
+    def get_num_deduplicated(self):
+        """
+        :return: Number of move evaluations skipped as equivalent to a searched move
+        """
+        return self._num_deduplicated
@@ -0,0 +1,127 @@
+"""
+beam.py
+Class for Square Stacker Beam Search Agent
+
+The beam search agent searches move sequences for the pieces currently dealt.
+At each depth, all children of the beam are simulated and scored in one batch
+by points plus a heuristic evaluation, and only the best beam_width are kept.
+Sequences end when the hand is played out (or no moves remain, which ends the
+game), and the first move of the best sequence is selected.
+
+Heuristic terms (weighted sum):
+    near_lines = Lines with a color on 2 tiles and room for it on the third
+    empty = Empty tile layers
+    combo = Combo count after move
+    tile = Tiles with 2 layers of one color and third layer empty
+    game_over = Penalty if pieces remain with no valid moves
+"""
+
+import numpy as np
+from agents.search.agent import SearchAgent
+from square_stacker_game import SquareStackerGame, afterstates, index_to_move
+
+# Default heuristic weights
+default_weights = {
+    'near_lines': 1.0,
+    'empty': 1.0,
+    'combo': 2.0,
+    'tile': 1.0,
+    'game_over': 1000.0,
+}
+
+# Tile indices [i, j] of 8 lines
+_line_i = np.array([[0, 0, 0], [1, 1, 1], [2, 2, 2], [0, 1, 2], [0, 1, 2], [0, 1, 2], [0, 1, 2], [0, 1, 2]])
+_line_j = np.array([[0, 1, 2], [0, 1, 2], [0, 1, 2], [0, 0, 0], [1, 1, 1], [2, 2, 2], [0, 1, 2], [2, 1, 0]])
+
+
+class BeamSearchAgent(SearchAgent):
+
+    def __init__(self, beam_width=8, weights=None):
+        """
+        Constructs beam search agent
+        :param beam_width: Number of move sequences kept per depth
+        :param weights: Dict of heuristic weights (missing keys use default_weights)
+        """
+        SearchAgent.__init__(self)
+        self._beam_width = beam_width
+        self._weights = dict(default_weights)
+        if weights is not None:
+            self._weights.update(weights)
+
+    def evaluate(self, boards, combos):
+        """
+        Heuristic evaluation of batch of afterstates
+        :param boards: Board color codes [np.array B x 3 x 3 x 3] (0 = empty)
+        :param combos: Combo counts [np.array B]
+        :return: Heuristic values [np.array B]
+        """
+        empty = boards == 0
+        colors = np.arange(1, SquareStackerGame._num_colors + 1)
+
+        # Near-complete lines: color on 2 of 3 tiles, third tile has an empty layer
+        present = np.any(boards[..., np.newaxis] == colors, axis=3)
+        line_present = present[:, _line_i, _line_j]
+        line_slack = np.any(empty, axis=3)[:, _line_i, _line_j]
+        missing_slack = np.sum(~line_present & line_slack[..., np.newaxis], axis=2)
+        near_lines = np.sum((np.sum(line_present, axis=2) == 2) & (missing_slack == 1), axis=(1, 2))
+
+        # Tile readiness: 2 layers of one color and one empty layer
+        counts = np.sum(boards[..., np.newaxis] == colors, axis=3)
+        tile_ready = np.sum(np.any(counts == 2, axis=3) & (np.sum(empty, axis=3) == 1), axis=(1, 2))
+
+        w = self._weights
+        return (w['near_lines'] * near_lines + w['empty'] * np.sum(empty, axis=(1, 2, 3))
+                + w['combo'] * combos + w['tile'] * tile_ready)
+
+    def select_move(self, game):
+        """
+        Selects next move to make for given game
+        :param game: Current game [SquareStackerGame]
+        :return: Move [k, i, j] or None if no moves exist
+        :return moves_searched: Number of moves searched before deciding
+        """
+
+        # Beam nodes: codes, combo, points so far, first move index
+        codes = game.get_state_vector('color')
+        beam = [(codes[:36], codes[37], 0, None)]
+        best_value = -np.inf
+        best_move = None
+        moves_searched = 0
+
+        while len(beam) > 0:
+
+            # Simulate all children of beam
+            child_codes, child_combos, child_points, child_firsts = [], [], [], []
+            for node_codes, combo, points, first in beam:
+                move_indices, boards, pieces, move_points, combos = afterstates(node_codes, combo)
+                num_moves = len(move_indices)
+                moves_searched += num_moves
+                if num_moves > 0:
+                    child_codes.append(np.concatenate((boards.reshape(num_moves, 27), pieces.reshape(num_moves, 9)), axis=1))
+                    child_combos.append(combos)
+                    child_points.append(points + move_points)
+                    child_firsts.append(move_indices if first is None else np.full(num_moves, first))
+                elif first is not None:
+
+                    # Leaf: hand played out, or game over if pieces remain
+                    value = points + self.evaluate(node_codes[np.newaxis, :27].reshape(1, 3, 3, 3), np.array([combo]))[0]
+                    if np.any(node_codes[27:36]):
+                        value -= self._weights['game_over']
+                    if value > best_value:
+                        best_value = value
+                        best_move = first
+
+            # Keep best children
+            if len(child_codes) == 0:
+                break
+            child_codes = np.concatenate(child_codes)
+            child_combos = np.concatenate(child_combos)
+            child_points = np.concatenate(child_points)
+            child_firsts = np.concatenate(child_firsts)
+            child_values = child_points + self.evaluate(child_codes[:, :27].reshape(-1, 3, 3, 3), child_combos)
+            keep = np.argsort(-child_values, kind='stable')[:self._beam_width]
+            beam = [(child_codes[n], child_combos[n], child_points[n], child_firsts[n]) for n in keep]
+
+        if best_move is None:
+            return None, 0
+        return index_to_move(int(best_move)), moves_searched
@@ -3,22 +3,29 @@ exhaustive.py
 Class for Square Stacker Exhaustive search Agent
 
 The exhaustive search agent searches all possible move sequences of a finite length
-and selects the move which maximizes score.
+and selects the move which maximizes score. With a transposition table, the max
+points gained from each searched state are shared between searches and processes.
 """
 
 import numpy as np
 from agents.search.agent import SearchAgent
+from utils.transposition_table import KIND_MAX, depth_tag, hash_state
 
 
 class ExhaustiveSearchAgent(SearchAgent):
 
-    def __init__(self, search_depth):
+    def __init__(self, search_depth, table=None, dedup=False, symmetric=False):
         """
         Constructs exhaustive search agent
         :param search_depth: Number of moves ahead to search
+        :param table: TranspositionTable shared by searches (or None)
+        :param dedup: Search one move per group of moves with the same afterstate
+        :param symmetric: Also group moves with symmetric afterstates (if dedup)
         """
-        SearchAgent.__init__(self)
+        SearchAgent.__init__(self, dedup, symmetric)
         self._search_depth = search_depth
+        self._table = table
+        self._table_depth = depth_tag(KIND_MAX, search_depth - 1)
 
     def select_move(self, game):
         """
@@ -31,8 +38,9 @@ class ExhaustiveSearchAgent(SearchAgent):
         # Moves searched counter
         moves_searched = 0
 
-        # Get valid moves
-        valid_moves = game.get_valid_moves()
+        # Get valid moves (one per afterstate if deduplicating above last depth,
+        # where moves are cheaper to make than to group)
+        valid_moves = self.get_search_moves(game) if self._search_depth > 1 else game.get_valid_moves()
         num_valid_moves = len(valid_moves)
 
         if num_valid_moves > 0:
@@ -49,11 +57,21 @@ class ExhaustiveSearchAgent(SearchAgent):
                 moves_searched += 1
                 next_score = game_next.get_score()
 
+                # Look up max points gained from next state
+                key = None
+                if self._search_depth > 1 and self._table is not None:
+                    key = hash_state(game_next)
+                    entry = self._table.lookup(key, self._table_depth)
+                    if entry is not None:
+                        max_scores.append(next_score + entry[1])
+                        continue
+
                 # Recursively search next moves
                 if self._search_depth > 1:
-                    agent = ExhaustiveSearchAgent(self._search_depth - 1)
+                    agent = ExhaustiveSearchAgent(self._search_depth - 1, self._table, self._dedup, self._symmetric)
                     next_next_move, next_moves_searched = agent.select_move(game_next)
                     moves_searched += next_moves_searched
+                    self._num_deduplicated += agent.get_num_deduplicated()
                     if next_next_move is not None:
                         game_next.make_move(next_next_move)
                         moves_searched += 1
@@ -61,6 +79,8 @@ class ExhaustiveSearchAgent(SearchAgent):
                         max_scores.append(max_score)
                     else:
                         max_scores.append(next_score)
+                    if key is not None:
+                        self._table.store(key, self._table_depth, max_scores[-1] - next_score)
                 else:
                     max_scores.append(next_score)
 
@@ -0,0 +1,49 @@
+"""
+moves.py
+Move generator grouping equivalent moves of Square Stacker search agents
+
+Different moves often lead to the same position: two piece slots may hold
+identical pieces, and different placements can leave the same board after
+clears. Moves are grouped by their afterstate (board, remaining pieces in
+any slot order, combo and points gained), so a search evaluates each group
+once and plays its first move. With symmetric=True, afterstates are also
+grouped over board symmetries and color relabeling (see agents/book.py),
+which the game rules and piece deals are invariant under.
+"""
+
+import numpy as np
+from square_stacker_game import afterstates, index_to_move
+
+
+def group_moves(game, symmetric=False):
+    """
+    Groups valid moves of game by resulting afterstate
+    :param game: Current game [SquareStackerGame]
+    :param symmetric: Also group symmetric afterstates (slower to group)
+    :return moves: First valid move of each group, in get_valid_moves order
+    :return num_deduplicated: Number of valid moves left out as equivalent to a listed move
+    """
+    codes = game.get_state_vector('color')
+    move_indices, boards, pieces, points, combos = afterstates(codes[:36], codes[37])
+    if symmetric:
+        from agents.book import canonical_key  # Imported here since book imports SearchAgent
+
+    # Afterstate keys (remaining pieces sorted, so slot order does not matter)
+    num_moves = len(move_indices)
+    if symmetric:
+        keys = [(canonical_key(np.concatenate((boards[m].ravel(), pieces[m].ravel())), combos[m])[0],
+                 int(points[m])) for m in range(num_moves)]
+    else:
+        piece_codes = np.sort(pieces @ np.array([49, 7, 1]), axis=1)
+        keys = np.concatenate((boards.reshape(num_moves, 27), piece_codes, combos[:, np.newaxis],
+                               points[:, np.newaxis]), axis=1)
+        keys = [key.tobytes() for key in keys]
+
+    # Keep first move of each afterstate
+    moves = []
+    seen = set()
+    for m, key in enumerate(keys):
+        if key not in seen:
+            seen.add(key)
+            moves.append(index_to_move(int(move_indices[m])))
+    return moves, num_moves - len(moves)
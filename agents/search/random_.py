@@ -14,18 +14,26 @@ Reference: https://ronzil.github.io/2048-AI/
 import numpy as np
 from agents.search.agent import SearchAgent
 from agents.random import RandomAgent
+from utils.transposition_table import KIND_PLAYOUT, depth_tag, hash_state
+
+# Transposition table depth tag of random playout results
+TABLE_DEPTH = depth_tag(KIND_PLAYOUT)
 
 
 class RandomSearchAgent(SearchAgent):
 
-    def __init__(self, games_per_move):
+    def __init__(self, games_per_move, table=None, dedup=False, symmetric=False):
         """
         Constructs random search agent
         :param games_per_move: Games to play per possible move
+        :param table: TranspositionTable shared by searches (or None)
+        :param dedup: Search one move per group of moves with the same afterstate
+        :param symmetric: Also group moves with symmetric afterstates (if dedup)
         """
-        SearchAgent.__init__(self)
+        SearchAgent.__init__(self, dedup, symmetric)
         self._games_per_move = games_per_move
         self._random_agent = RandomAgent()
+        self._table = table
 
     def select_move(self, game):
         """
@@ -38,8 +46,8 @@ class RandomSearchAgent(SearchAgent):
         # Moves searched counter
         moves_searched = 0
 
-        # Get valid moves
-        valid_moves = game.get_valid_moves()
+        # Get valid moves (one per afterstate if deduplicating)
+        valid_moves = self.get_search_moves(game)
         num_valid_moves = len(valid_moves)
 
         if num_valid_moves > 0:
@@ -55,6 +63,14 @@ class RandomSearchAgent(SearchAgent):
                 game_next.make_move(next_move)
                 moves_searched += 1
 
+                # Use mean points gained from next state if already sampled enough
+                if self._table is not None:
+                    key = hash_state(game_next)
+                    entry = self._table.lookup(key, TABLE_DEPTH)
+                    if entry is not None and entry[0] >= self._games_per_move:
+                        mean_scores.append(game_next.get_score() + entry[1])
+                        continue
+
                 # Play N games with random agent
                 mean_score = 0.0
                 for g in range(self._games_per_move):
@@ -68,6 +84,9 @@ class RandomSearchAgent(SearchAgent):
                             break
                     mean_score += game_test.get_score()
                 mean_score /= self._games_per_move
+                if self._table is not None:
+                    gain = mean_score - game_next.get_score()
+                    self._table.store(key, TABLE_DEPTH, gain, self._games_per_move, accumulate=True)
 
                 # Compute mean score
                 mean_scores.append(mean_score)
@@ -0,0 +1,101 @@
+"""
+bench.py
+Shared helpers for Square Stacker benchmarks (timing, seeded positions, baseline comparison)
+
+Benchmark results are dicts of name to {'value', 'unit', 'higher_is_better'}.
+"""
+
+import random
+from time import perf_counter
+
+import numpy as np
+from agents.random import RandomAgent
+from square_stacker_game import SquareStackerGame
+
+
+def result(value, unit, higher_is_better=False):
+    """
+    Makes benchmark result entry
+    :param value: Measured value
+    :param unit: Unit of value
+    :param higher_is_better: True for throughputs, False for times and sizes
+    :return: Dict
+    """
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def time_per_call(func, args_list, repeats=5):
+    """
+    Times function over list of argument tuples (best of repeats)
+    :param func: Function to time
+    :param args_list: List of argument tuples, one call each
+    :param repeats: Number of timed passes (a fresh copy of args_list is not made)
+    :return: Seconds per call
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        time_start = perf_counter()
+        for args in args_list:
+            func(*args)
+        best = min(best, perf_counter() - time_start)
+    return best / len(args_list)
+
+
+def seed_all(seed):
+    """
+    Seeds global random and NumPy generators
+    :param seed: Seed
+    :return: None
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def make_positions(num_positions, seed=0, max_moves=30):
+    """
+    Makes fixed, seeded game positions with at least one valid move
+    :param num_positions: Number of positions
+    :param seed: Seed of positions
+    :param max_moves: Max random moves played from new game
+    :return: List of SquareStackerGame
+    """
+    seed_all(seed)
+    agent = RandomAgent()
+    positions = []
+    n = 0
+    while len(positions) < num_positions:
+        game = SquareStackerGame(seed=(seed << 32) + n)
+        n += 1
+        for _ in range(np.random.randint(0, max_moves)):
+            move = agent.select_move(game)
+            if move is None:
+                break
+            game.make_move(move)
+        if len(game.get_valid_moves()) > 0:
+            positions.append(game)
+    return positions
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Compares results to baseline and flags regressions
+    :param results: Dict of benchmark results
+    :param baseline: Dict of baseline benchmark results
+    :param threshold: Relative change counted as regression
+    :return: List of names of regressed benchmarks
+    """
+    regressions = []
+    for name, entry in results.items():
+        if name not in baseline or entry.get('value') is None or baseline[name].get('value') is None:
+            continue
+        value = entry['value']
+        base = baseline[name]['value']
+        if base == 0:
+            continue
+        change = (value - base) / base
+        worse = -change if entry['higher_is_better'] else change
+        flag = 'REGRESSION' if worse > threshold else ''
+        if worse > threshold:
+            regressions.append(name)
+        print(f'{name}: {base:.4g} -> {value:.4g} {entry["unit"]} ({change * 100.0:+.1f}%) {flag}')
+    return regressions
@@ -0,0 +1,95 @@
+"""
+imports.py
+Import-time and memory benchmark for Square Stacker modules
+
+Each module is imported in a fresh interpreter, which reports the import time,
+peak resident set size (RSS) and which heavy backends (rendering, plotting,
+deep learning) were pulled in. Game and search-agent imports should stay
+headless (standard library and NumPy only).
+"""
+
+import json
+import subprocess
+import sys
+
+# Modules to benchmark
+modules = [
+    'numpy',
+    'square_stacker_game',
+    'agents.random',
+    'agents.search.random_',
+    'agents.search.dlrgs',
+    'agents.search.exhaustive',
+    'agents.mcts.mcts',
+    'agents.dqn_policy',
+    'agents.dqn',
+    'tests.agent',
+]
+
+# Backends which headless imports must not load
+heavy_modules = ['cv2', 'PIL', 'matplotlib', 'keras', 'tensorflow']
+
+# Code run in fresh interpreter per import
+# (peak RSS is read from /proc where available, since ru_maxrss survives fork and exec)
+_probe = '''
+import json, resource, sys, time
+def peak_rss_kb():
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_init = peak_rss_kb()
+time_init = time.perf_counter()
+__import__({module!r})
+time_import = time.perf_counter() - time_init
+rss = peak_rss_kb()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{'import_time_s': time_import, 'rss_kb': rss, 'rss_delta_kb': rss - rss_init, 'heavy': heavy}}))
+'''
+
+
+def benchmark_import(module, repeats=3):
+    """
+    Measures import of module in fresh interpreters
+    :param module: Module name
+    :param repeats: Number of fresh interpreters (min time is reported)
+    :return: Dict of results (or error message)
+    """
+    results = []
+    for _ in range(repeats):
+        code = _probe.format(module=module, heavy=heavy_modules)
+        proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {'error': proc.stderr.strip().splitlines()[-1]}
+        results.append(json.loads(proc.stdout))
+    result = min(results, key=lambda r: r['import_time_s'])
+    result['rss_kb'] = max(r['rss_kb'] for r in results)
+    return result
+
+
+def run(repeats=3):
+    """
+    Runs import benchmark on all modules
+    :param repeats: Number of fresh interpreters per module
+    :return: Dict of results per module
+    """
+    results = {}
+    for module in modules:
+        results[module] = benchmark_import(module, repeats)
+        result = results[module]
+        if 'error' in result:
+            print(f'{module}: {result["error"]}')
+        else:
+            print(f'{module}: {result["import_time_s"] * 1e3:.1f} ms, '
+                  f'RSS {result["rss_kb"] / 1024.0:.1f} MB, Heavy: {result["heavy"]}')
+    return results
+
+
+if __name__ == '__main__':
+    output_file = 'bench_imports.json'
+    with open(output_file, 'w') as file:
+        json.dump(run(), file, indent=2)
@@ -0,0 +1,108 @@
+"""
+macro.py
+Macrobenchmarks of Square Stacker agent decision and rollout throughput
+"""
+
+from time import perf_counter
+
+from agents.dqn_policy import DQNPolicy, DQNPolicyAgent
+from agents.mcts.mcts import MCTS
+from agents.ntuple import NTupleAgent
+from agents.random import RandomAgent
+from agents.search.agent import SearchAgent
+from agents.search.dlrgs import DepthLimitedRandomSearchAgent
+from agents.search.exhaustive import ExhaustiveSearchAgent
+from agents.search.random_ import RandomSearchAgent
+from benchmarks.bench import result, seed_all, make_positions
+import numpy as np
+
+# Benchmark Settings
+num_positions = 20
+ntuple_train_games = {'sequential': (32, 1), 'lockstep': (256, 256)}
+
+
+def make_agents():
+    """
+    Makes benchmarked agents
+    :return: Dict of agent name to agent
+    """
+    agents = {
+        'RandomAgent': RandomAgent(),
+        'RandomSearchAgent': RandomSearchAgent(2),
+        'DepthLimitedRandomSearchAgent': DepthLimitedRandomSearchAgent(2, 5),
+        'ExhaustiveSearchAgent': ExhaustiveSearchAgent(2),
+        'MCTS': MCTS(max_sims=50),
+    }
+
+    # DQN with random weights (same layer sizes as DQNAgent)
+    seed_all(0)
+    shapes = [(254, 128), (128,), (128, 128), (128,), (128, 27), (27,)]
+    policy = DQNPolicy([np.random.randn(*shape) * 0.1 for shape in shapes])
+    agents['DQNPolicyAgent'] = DQNPolicyAgent(policy)
+    try:
+        from agents.dqn import DQNAgent
+        dqn_agent = DQNAgent()
+        dqn_agent._dqn.set_weights(policy.get_weights())
+        agents['DQNAgent'] = dqn_agent
+    except ImportError:
+        print('DQNAgent: skipped (Keras not installed)')
+    return agents
+
+
+def run(num_positions=num_positions):
+    """
+    Runs agent macrobenchmarks on fixed seeded positions
+    :param num_positions: Number of positions
+    :return: Dict of benchmark results
+    """
+    positions = make_positions(num_positions, seed=1)
+    results = {}
+    for name, agent in make_agents().items():
+
+        # Time decisions (agent randomness seeded)
+        seed_all(0)
+        is_search_agent = issubclass(type(agent), SearchAgent)
+        moves_searched = 0
+        time_start = perf_counter()
+        for game in positions:
+            if is_search_agent:
+                moves_searched += agent.select_move(game)[1]
+            else:
+                agent.select_move(game)
+        time_total = perf_counter() - time_start
+
+        # Decisions and rollout moves (or simulations) per second
+        results[f'macro.{name}.decisions_per_s'] = result(num_positions / time_total, 'decisions/s', True)
+        if is_search_agent:
+            results[f'macro.{name}.rollout_moves_per_s'] = result(moves_searched / time_total, 'moves/s', True)
+        elif isinstance(agent, MCTS):
+            sims = agent.max_sims * num_positions
+            results[f'macro.{name}.rollouts_per_s'] = result(sims / time_total, 'rollouts/s', True)
+        for key in results:
+            if key.startswith(f'macro.{name}.'):
+                print(f'{key}: {results[key]["value"]:.1f} {results[key]["unit"]}')
+    results.update(ntuple_training())
+    return results
+
+
+def ntuple_training(train_games=None):
+    """
+    Times n-tuple network self-play training from new weights, one game at a time and in lockstep
+    :param train_games: Dict of name to (number of games, games played in lockstep)
+    :return: Dict of benchmark results
+    """
+    train_games = train_games if train_games is not None else ntuple_train_games
+    results = {}
+    for name, (num_games, num_parallel) in train_games.items():
+        seed_all(0)
+        agent = NTupleAgent()
+        time_start = perf_counter()
+        num_moves = agent.train(num_games, num_parallel=num_parallel)
+        key = f'macro.NTupleAgent.train_{name}_moves_per_s'
+        results[key] = result(num_moves / (perf_counter() - time_start), 'moves/s', True)
+        print(f'{key}: {results[key]["value"]:.1f} {results[key]["unit"]}')
+    return results
+
+
+if __name__ == '__main__':
+    run()
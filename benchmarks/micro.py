@@ -0,0 +1,58 @@
+"""
+micro.py
+Microbenchmarks of Square Stacker game engine operations
+"""
+
+from benchmarks.bench import result, time_per_call, make_positions
+
+# Benchmark Settings
+num_positions = 200
+repeats = 5
+
+
+def run(num_positions=num_positions, repeats=repeats):
+    """
+    Runs engine microbenchmarks on fixed seeded positions
+    :param num_positions: Number of positions
+    :param repeats: Timed passes per benchmark (best is kept)
+    :return: Dict of benchmark results
+    """
+    positions = make_positions(num_positions)
+    results = {}
+
+    # Read-only operations
+    results['micro.get_valid_moves'] = time_per_call(lambda g: g.get_valid_moves(), [(g,) for g in positions], repeats)
+    results['micro.get_valid_move_mask'] = time_per_call(
+        lambda g: g.get_valid_move_mask(), [(g,) for g in positions], repeats)
+    results['micro.deepcopy'] = time_per_call(lambda g: g.deepcopy(), [(g,) for g in positions], repeats)
+    for encoding in ['color', 'state', 'float32', 'bits']:
+        results[f'micro.get_state_vector.{encoding}'] = time_per_call(
+            lambda g: g.get_state_vector(encoding), [(g,) for g in positions], repeats)
+
+    # Line clear processing (writes only to scratch board)
+    line_args = []
+    for game in positions:
+        move = game.get_valid_moves()[0]
+        k, i, j = move
+        colors = set(game.get_piece()[k])
+        colors.discard('_')
+        line_args.append((game, i, colors, game.get_board()))
+    results['micro._process_line'] = time_per_call(
+        lambda g, i, colors, board: g._process_line(lambda m: i, lambda m: m, colors, board), line_args, repeats)
+
+    # Moves (fresh copies per pass, copy time excluded)
+    best = float('inf')
+    for _ in range(repeats):
+        move_args = [(g.deepcopy(), g.get_valid_moves()[0]) for g in positions]
+        best = min(best, time_per_call(lambda g, move: g.make_move(move), move_args, 1))
+    results['micro.make_move'] = best
+
+    # Convert to results
+    for name, seconds in results.items():
+        results[name] = result(seconds * 1e6, 'us/call')
+        print(f'{name}: {results[name]["value"]:.2f} us/call')
+    return results
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,69 @@
+"""
+run.py
+Runs Square Stacker benchmark suites and compares against a baseline
+
+Usage:
+    python -m benchmarks.run [--suites micro,macro,imports] [--output results.json]
+                             [--baseline baseline.json] [--threshold 0.1]
+Exits with status 1 if any benchmark regressed by more than the threshold.
+"""
+
+import argparse
+import json
+import platform
+import sys
+
+from benchmarks import imports, macro, micro
+from benchmarks.bench import compare, result
+
+
+def imports_results():
+    """
+    Runs import benchmark and converts it to benchmark results
+    :return: Dict of benchmark results
+    """
+    results = {}
+    for module, entry in imports.run().items():
+        if 'error' not in entry:
+            results[f'imports.{module}.time'] = result(entry['import_time_s'] * 1e3, 'ms')
+            results[f'imports.{module}.rss'] = result(entry['rss_kb'] / 1024.0, 'MB')
+            results[f'imports.{module}.heavy_modules'] = result(len(entry['heavy']), 'modules')
+    return results
+
+
+suites = {
+    'micro': micro.run,
+    'macro': macro.run,
+    'imports': imports_results,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Square Stacker benchmarks')
+    parser.add_argument('--suites', default='micro,macro,imports', help='Comma-separated suites to run')
+    parser.add_argument('--output', default='bench_results.json', help='Results JSON file')
+    parser.add_argument('--baseline', default=None, help='Baseline results JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative change counted as regression')
+    args = parser.parse_args()
+
+    # Run suites
+    results = {}
+    for suite in args.suites.split(','):
+        print(f'\n{suite.capitalize()} Benchmarks:')
+        results.update(suites[suite]())
+
+    # Save results
+    with open(args.output, 'w') as file:
+        json.dump({'python': platform.python_version(), 'results': results}, file, indent=2)
+    print(f'\nResults saved to {args.output}')
+
+    # Compare to baseline
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        print(f'\nComparison to {args.baseline}:')
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s): {", ".join(regressions)}')
+            sys.exit(1)
+        print('\nNo regressions')
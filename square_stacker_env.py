@@ -0,0 +1,253 @@
+"""
+square_stacker_env.py
+Gym-style vectorized Square Stacker environment
+
+SquareStackerVecEnv runs num_envs games in lockstep:
+    reset() -> observations, masks
+    step(actions) -> observations, rewards, dones, masks
+Actions are move indices (move_to_index). Finished games are reset
+automatically, so observations and masks of done environments belong to
+their next game (final scores are kept in get_scores()).
+
+With num_workers > 0, environments are split across worker processes which
+write observations, rewards, dones, masks and scores directly into shared
+NumPy arrays, so only a short command per step goes through pipes. Returned
+arrays are reused by the next step (copy them to keep them).
+
+Game r of environment e is seeded with (seed << 32) + r * num_envs + e, so
+seeded results do not depend on num_workers.
+"""
+
+import multiprocessing as mp
+import random
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from square_stacker_game import SquareStackerGame, index_to_move
+
+
+def _make_layout(num_envs, encoding):
+    """
+    Makes shared array layout
+    :param num_envs: Number of environments
+    :param encoding: State vector encoding of observations
+    :return: Dict of array name to (offset, shape, dtype) and total size in bytes
+    """
+    sample = SquareStackerGame().get_state_vector(encoding)
+    specs = [
+        ('observations', (num_envs,) + sample.shape, sample.dtype),
+        ('rewards', (num_envs,), np.float32),
+        ('dones', (num_envs,), np.bool_),
+        ('masks', (num_envs, 27), np.bool_),
+        ('scores', (num_envs,), np.int64),
+        ('actions', (num_envs,), np.int64),
+    ]
+    layout = {}
+    offset = 0
+    for name, shape, dtype in specs:
+        layout[name] = (offset, shape, np.dtype(dtype))
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offset += -offset % 8
+    return layout, offset
+
+
+def _map_arrays(layout, buffer):
+    """
+    :param layout: Layout from _make_layout
+    :param buffer: Buffer holding arrays
+    :return: Dict of array name to np.array
+    """
+    return {name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            for name, (offset, shape, dtype) in layout.items()}
+
+
+class _EnvSlice:
+
+    def __init__(self, first, num, num_envs, encoding, seed, arrays):
+        """
+        Steps contiguous slice of environments in shared arrays
+        :param first: Index of first environment
+        :param num: Number of environments in slice
+        :param num_envs: Total number of environments
+        :param encoding: State vector encoding of observations
+        :param seed: Environment seed (or None)
+        :param arrays: Dict of shared arrays
+        """
+        self._envs = range(first, first + num)
+        self._num_envs = num_envs
+        self._encoding = encoding
+        self._seed = seed
+        self._arrays = arrays
+        self._games = {}
+        self._num_games = {e: 0 for e in self._envs}
+
+    def _new_game(self, e):
+        """
+        Starts next game of environment and writes its observation and mask
+        :param e: Environment index
+        :return: None
+        """
+        game_seed = None
+        if self._seed is not None:
+            game_seed = (self._seed << 32) + self._num_games[e] * self._num_envs + e
+        self._num_games[e] += 1
+        game = SquareStackerGame(game_seed)
+        self._games[e] = game
+        self._arrays['observations'][e] = game.get_state_vector(self._encoding)
+        self._arrays['masks'][e] = game.get_valid_move_mask()
+
+    def reset(self):
+        """
+        Starts new games in all environments of slice
+        :return: None
+        """
+        for e in self._envs:
+            self._new_game(e)
+            self._arrays['rewards'][e] = 0.0
+            self._arrays['dones'][e] = False
+            self._arrays['scores'][e] = 0
+
+    def step(self):
+        """
+        Makes actions of slice, auto-resetting finished games
+        :return: None
+        """
+        arrays = self._arrays
+        for e in self._envs:
+            game = self._games[e]
+            arrays['rewards'][e] = game.make_move(index_to_move(int(arrays['actions'][e])))
+            arrays['scores'][e] = game.get_score()
+            mask = game.get_valid_move_mask()
+            done = not np.any(mask)
+            arrays['dones'][e] = done
+            if done:
+                self._new_game(e)
+            else:
+                arrays['observations'][e] = game.get_state_vector(self._encoding)
+                arrays['masks'][e] = mask
+
+
+def _run_worker(conn, shm_name, layout, first, num, num_envs, encoding, seed):
+    """
+    Worker process stepping slice of environments on command
+    :param conn: Pipe connection receiving 'reset', 'step' or 'close'
+    :param shm_name: Name of shared memory block
+    :param layout: Layout from _make_layout
+    :param first: Index of first environment
+    :param num: Number of environments in slice
+    :param num_envs: Total number of environments
+    :param encoding: State vector encoding of observations
+    :param seed: Environment seed (or None)
+    :return: None
+    """
+    shm = SharedMemory(name=shm_name)
+    random.seed()
+    arrays = _map_arrays(layout, shm.buf)
+    env_slice = _EnvSlice(first, num, num_envs, encoding, seed, arrays)
+    while True:
+        command = conn.recv()
+        if command == 'step':
+            env_slice.step()
+        elif command == 'reset':
+            env_slice.reset()
+        else:
+            break
+        conn.send(True)
+    del arrays, env_slice
+    shm.close()
+
+
+class SquareStackerVecEnv:
+
+    def __init__(self, num_envs, encoding='float32', seed=None, num_workers=0):
+        """
+        Constructs vectorized environment
+        :param num_envs: Number of games run in lockstep
+        :param encoding: State vector encoding of observations
+        :param seed: Environment seed (or None for unseeded games)
+        :param num_workers: Number of worker processes (0 steps games in this process)
+        """
+        self._num_envs = num_envs
+        layout, size = _make_layout(num_envs, encoding)
+        self._workers = []
+        if num_workers > 0:
+
+            # Shared arrays and worker processes with contiguous slices
+            self._shm = SharedMemory(create=True, size=size)
+            self._arrays = _map_arrays(layout, self._shm.buf)
+            bounds = np.linspace(0, num_envs, num_workers + 1).astype(int)
+            for w in range(num_workers):
+                conn, child_conn = mp.Pipe()
+                process = mp.Process(target=_run_worker, daemon=True, args=(
+                    child_conn, self._shm.name, layout, bounds[w], bounds[w + 1] - bounds[w], num_envs, encoding, seed))
+                process.start()
+                self._workers.append((process, conn))
+            self._env_slice = None
+        else:
+            self._shm = None
+            self._arrays = _map_arrays(layout, bytearray(size))
+            self._env_slice = _EnvSlice(0, num_envs, num_envs, encoding, seed, self._arrays)
+
+    def get_num_envs(self):
+        """
+        :return: Number of environments
+        """
+        return self._num_envs
+
+    def _command(self, command):
+        """
+        Runs command in this process or all workers
+        :param command: 'reset' or 'step'
+        :return: None
+        """
+        if self._env_slice is not None:
+            getattr(self._env_slice, command)()
+        else:
+            for _, conn in self._workers:
+                conn.send(command)
+            for _, conn in self._workers:
+                conn.recv()
+
+    def reset(self):
+        """
+        Starts new games in all environments
+        :return observations: State vectors [np.array num_envs x state_dim]
+        :return masks: Valid move masks [np.array num_envs x 27]
+        """
+        self._command('reset')
+        return self._arrays['observations'], self._arrays['masks']
+
+    def step(self, actions):
+        """
+        Makes one move in every environment
+        :param actions: Move indices [np.array num_envs]
+        :return observations: State vectors (of next game where done) [np.array num_envs x state_dim]
+        :return rewards: Points for each move [np.array num_envs]
+        :return dones: True where move ended game [np.array num_envs]
+        :return masks: Valid move masks (of next game where done) [np.array num_envs x 27]
+        """
+        self._arrays['actions'][:] = actions
+        self._command('step')
+        arrays = self._arrays
+        return arrays['observations'], arrays['rewards'], arrays['dones'], arrays['masks']
+
+    def get_scores(self):
+        """
+        :return: Game scores after last step, before auto-reset [np.array num_envs]
+        """
+        return self._arrays['scores']
+
+    def close(self):
+        """
+        Stops workers and frees shared memory
+        :return: None
+        """
+        for process, conn in self._workers:
+            conn.send('close')
+            process.join()
+        self._workers = []
+        if self._shm is not None:
+            self._arrays = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
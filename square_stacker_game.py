@@ -24,14 +24,17 @@ Moves
 Scoring
     _score = Points scored so far
     _combo = Number of scores in a row
+State Vectors (see get_state_vector)
+    'color' = Color index [0..6] per board and piece cell, score, combo
+    'state' = One-hot color per cell (36 x 7), score, combo [float64, 254]
+    'float32' = 'state' with score and combo normalized [float32, 254]
+    'bits' = Packed bit-planes (7 colors x 36 cells), score, combo [uint8, 40]
 """
 
-from random import randint
+from random import randint, Random
 from copy import deepcopy
 from operator import add
 from typing import List
-from PIL import Image
-import cv2
 import numpy as np
 
 
@@ -69,6 +72,34 @@ def move_to_vector(move):
     return vector
 
 
+# Packed 'bits' state vector layout
+STATE_PLANE_BYTES = 32  # 7 color planes x 36 cells = 252 bits (padded to 256)
+STATE_BITS_BYTES = STATE_PLANE_BYTES + 8  # Plus score and combo as little-endian uint32
+
+# Normalization of score and combo for 'float32' state vectors
+SCORE_SCALE = 1000.0
+COMBO_SCALE = 10.0
+
+
+def unpack_state_bits(packed, normalize=False):
+    """
+    Unpacks batch of 'bits' state vectors to 'state' layout (lossless)
+    :param packed: Packed state vectors [np.array N x 40 uint8]
+    :param normalize: Scale score and combo as in 'float32' encoding
+    :return: State vectors [np.array N x 254 float32]
+    """
+    packed = np.atleast_2d(np.asarray(packed, dtype=np.uint8))
+    num_states = packed.shape[0]
+    planes = np.unpackbits(packed[:, :STATE_PLANE_BYTES], axis=1)[:, :252]
+    states = np.empty((num_states, 254), dtype=np.float32)
+    states[:, :252] = planes.reshape(num_states, 7, 36).transpose(0, 2, 1).reshape(num_states, 252)
+    states[:, 252:] = np.ascontiguousarray(packed[:, STATE_PLANE_BYTES:]).view('<u4')
+    if normalize:
+        states[:, 252] /= SCORE_SCALE
+        states[:, 253] /= COMBO_SCALE
+    return states
+
+
 def vector_to_move(vector):
     """
     Converts 27D move vector to move
@@ -80,25 +111,111 @@ def vector_to_move(vector):
     return move
 
 
+# Piece slot, row and column of each move index
+_move_k, _move_i, _move_j = (x.ravel() for x in np.meshgrid(np.arange(3), np.arange(3), np.arange(3), indexing='ij'))
+
+
+def batch_afterstates(codes, combos):
+    """
+    Simulates all valid moves of a batch of game states at once (before new pieces are dealt)
+    :param codes: Board and piece color codes [np.array N x 36] (first 36 of 'color' state vectors)
+    :param combos: Current combo counts [np.array N]
+    :return states: Index of state of each move, in increasing order [np.array M]
+    :return move_indices: Indices of valid moves [np.array M]
+    :return boards: Board color codes after each move [np.array M x 3 x 3 x 3]
+    :return pieces: Remaining piece color codes after each move [np.array M x 3 x 3]
+    :return points: Points of each move [np.array M]
+    :return combos: Combo counts after each move [np.array M]
+    """
+    codes = np.asarray(codes, dtype=np.int64).reshape(-1, 36)
+    board = codes[:, :27].reshape(-1, 3, 3, 3)
+    piece = codes[:, 27:36].reshape(-1, 3, 3)
+
+    # Piece color and occupied layer (pieces have one color)
+    piece_color = np.max(piece, axis=2)
+    piece_layer = np.argmax(piece != 0, axis=2)
+
+    # Valid moves: piece not yet played and its layer empty on tile
+    state_range = np.arange(len(codes))[:, np.newaxis]
+    valid = (piece_color[:, _move_k] != 0) & (board[state_range, _move_i, _move_j, piece_layer[:, _move_k]] == 0)
+    states, move_indices = np.nonzero(valid)
+    k, i, j = _move_k[move_indices], _move_i[move_indices], _move_j[move_indices]
+    num_moves = len(move_indices)
+    moves = np.arange(num_moves)
+    color = piece_color[states, k]
+
+    # Transfer pieces to boards
+    placed = board[states]
+    placed[moves, i, j, piece_layer[states, k]] = color
+    pieces = piece[states]
+    pieces[moves, k] = 0
+
+    # Colors present on each tile [M x 3 x 3 x 6]
+    present = np.any(placed[..., np.newaxis] == np.arange(1, SquareStackerGame._num_colors + 1), axis=3)
+
+    # Line clears per color through played tile
+    row_full = np.all(present[moves, i], axis=1)
+    col_full = np.all(present[moves, :, j], axis=1)
+    pos_full = np.all(present[:, [0, 1, 2], [0, 1, 2]], axis=1) & (i == j)[:, np.newaxis]
+    neg_full = np.all(present[:, [0, 1, 2], [2, 1, 0]], axis=1) & (i == 2 - j)[:, np.newaxis]
+    clears = row_full.astype(np.int64) + col_full + pos_full + neg_full
+    points = 3 * np.sum(clears ** 2, axis=1)
+
+    # Remove piece color from tiles of its cleared lines
+    c = color - 1
+    lines = np.zeros((num_moves, 3, 3), dtype=bool)
+    lines[row_full[moves, c]] |= np.arange(3)[:, np.newaxis] == i[row_full[moves, c], np.newaxis, np.newaxis]
+    lines[col_full[moves, c]] |= np.arange(3) == j[col_full[moves, c], np.newaxis, np.newaxis]
+    lines[pos_full[moves, c]] |= np.eye(3, dtype=bool)
+    lines[neg_full[moves, c]] |= np.fliplr(np.eye(3, dtype=bool))
+    boards = np.where(lines[..., np.newaxis] & (placed == color[:, np.newaxis, np.newaxis, np.newaxis]), 0, placed)
+
+    # Tile clears (all layers same color)
+    tiles = placed[moves, i, j]
+    tile_clear = (tiles[:, 0] == tiles[:, 1]) & (tiles[:, 1] == tiles[:, 2])
+    boards[moves[tile_clear], i[tile_clear], j[tile_clear]] = 0
+    points += 5 * tile_clear
+
+    # Combo multiplier
+    next_combos = np.where(points > 0, np.asarray(combos, dtype=np.int64)[states] + 1, 0)
+    points *= next_combos
+    return states, move_indices, boards, pieces, points, next_combos
+
+
+def afterstates(codes, combo):
+    """
+    Simulates all valid moves of a game state at once (before new pieces are dealt)
+    :param codes: Board and piece color codes [np.array 36] (first 36 of 'color' state vector)
+    :param combo: Current combo count
+    :return move_indices: Indices of valid moves [np.array M]
+    :return boards: Board color codes after each move [np.array M x 3 x 3 x 3]
+    :return pieces: Remaining piece color codes after each move [np.array M x 3 x 3]
+    :return points: Points of each move [np.array M]
+    :return combos: Combo counts after each move [np.array M]
+    """
+    return batch_afterstates(np.asarray(codes)[np.newaxis], np.array([combo]))[1:]
+
+
 class SquareStackerGame:
     _colors: List[str] = ['P', 'G', 'B', 'Y', 'O', 'V']  # Piece colors
 
-    # colors in BGR
-    _colors_rgb = {'P': (128, 0, 255),
-                   'G': (103, 251, 37),
-                   'B': (242, 226, 53),
-                   'Y': (14, 223, 246),
-                   'O': (2, 121, 255),
-                   'V': (255, 46, 184),
-                   '_': (87, 92, 95)}
-
     _num_colors: int = len(_colors)  # Number of piece colors
 
-    def __init__(self):
+    def __init__(self, seed=None, deals=None):
         """
         Initializes new Square Stacker game.
+        :param seed: Seed of private piece generator (None uses global random module)
+        :param deals: Scripted dealt pieces as codes 3 * color + layer (overrides seed)
         """
 
+        # Piece generator (search copies made by deepcopy never inherit a seeded
+        # generator, so searching agents cannot foresee the pieces of the real game)
+        self._rng = Random(seed) if seed is not None else None
+        self._scripted_deals = bytes(deals) if deals is not None else None
+
+        # Log of dealt pieces (codes 3 * color + layer)
+        self._deals = bytearray()
+
         # Initialize Empty Board
         self._board = []
         self._piece = []
@@ -124,91 +241,18 @@ class SquareStackerGame:
 
     def show(self, game_num=0, update_time=500):
         """
-        creates image of current game state and displays it
+        displays image of current game state without blocking
+        (rendering backends are imported on first call)
         :param game_num: int
-        :param update_time: int, time in ms for how often img gets updated
+        :param update_time: int, min time in ms between window updates
         :return:
         """
-        SIZE = 30   # size of initial array
-        WIN_SIZE = 300  # size of window when rescaled
-
-        # Create env of array 30x30x3
-        # 30x30 is 2d grip, 3 is for rgb
-        env = np.zeros((SIZE, SIZE, 3), dtype=np.uint8)
-
-        # Iterate through each board tile and add the colors to the grid
-        for i in range(3):
-            for j in range(3):
-                # center points of each tile in env
-                x = 6 * i + 3
-                y = 6 * j + 3
-
-                tile = self._board[i][j]  # tile at point on board
-                self.color_tile(env, x, y, tile)
-
-        # Iterate through each piece tile and add the colors to the grid
-        for i in range(3):
-            # center points for each piece
-            x = 6 * i + 3
-            y = 23
-            tile = self._piece[i]  # tile at point on board
-            self.color_tile(env, x, y, tile)
-
-        img = Image.fromarray(env, 'RGB')   # convert grid to an rgb image
-        img = img.resize((WIN_SIZE, WIN_SIZE))  # resize to the complete window size
-
-        dy = 20 # offset pixels for each new line
-
-        line1 = "Game Number: " + str(game_num)
-        line2 = "Score: " + str(self.get_score())
-
-        img = np.array(img)     # convert to a nunmpy array
-
-        # display text
-        self.display_text(img, line1)
-        self.display_text(img, line2, dy)
-
-        cv2.imshow("image", img)    # display image
-        cv2.waitKey(update_time)    # delay between each update
+        import square_stacker_render
+        square_stacker_render.show(self, game_num, update_time)
 
     def close_window(self):
-        cv2.destroyWindow("image")
-
-    def display_text(self, img, text, dy=0):
-        """
-        displays text on the img
-        :param img: Image
-        :param text: String
-        :param dy: int of offset between lines
-        :return:
-        """
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        bottom_left = (10, 300 - 50 + dy)
-        font_scale = .5
-        font_color = (255, 255, 255)
-        cv2.putText(img, text, bottom_left, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_color)
-
-    def color_tile(self, env, x, y, tile):
-        """
-        Adds tile to the image grid
-        :param env: Array of img (30x30x3)
-        :param x: int
-        :param y: int
-        :param tile: Array of tile colors (3x1)
-        :return:
-        """
-        # outer color
-        for tx in range(-2, 3):
-            for ty in range(-2, 3):
-                env[x + tx][ y + ty] = self._colors_rgb[tile[2]]
-
-        # middle color
-        for tx in range(-1, 2):
-            for ty in range(-1, 2):
-                env[x + tx] [y + ty] = self._colors_rgb[tile[1]]
-
-        # inner color
-        env[x, y] = self._colors_rgb[tile[0]]
+        import square_stacker_render
+        square_stacker_render.close_window()
 
     def get_valid_moves(self):
         """
@@ -224,6 +268,15 @@ class SquareStackerGame:
                             moves.append(move)
         return moves
 
+    def get_valid_move_mask(self):
+        """
+        :return: Boolean mask of valid moves indexed by move_to_index [np.array]
+        """
+        mask = np.zeros(27, dtype=bool)
+        for move in self.get_valid_moves():
+            mask[move_to_index(move)] = True
+        return mask
+
     def is_move_valid(self, move):
         """
         Checks validity of game move
@@ -363,11 +416,16 @@ class SquareStackerGame:
         if True not in self._is_piece_playable:
 
             # For each game piece
+            randint_ = self._rng.randint if self._rng is not None else randint
             for k in range(3):
-                # Add random color to piece
-                c = randint(0, self._num_colors - 1)
-                n = randint(0, 2)
+                # Add random (or scripted) color to piece
+                if self._scripted_deals is not None:
+                    c, n = divmod(self._scripted_deals[len(self._deals)], 3)
+                else:
+                    c = randint_(0, self._num_colors - 1)
+                    n = randint_(0, 2)
                 self._piece[k][n] = self._colors[c]
+                self._deals.append(3 * c + n)
 
                 # Mark piece as playable
                 self._is_piece_playable[k] = True
@@ -384,6 +442,13 @@ class SquareStackerGame:
         """
         return deepcopy(self._piece)
 
+    def get_deals(self):
+        """
+        :return: Pieces dealt so far as codes 3 * color + layer [bytes]
+        (search copies made by deepcopy only log pieces dealt after copying)
+        """
+        return bytes(self._deals)
+
     def get_score(self):
         """
         :return: Current game score
@@ -399,7 +464,7 @@ class SquareStackerGame:
     def get_state_vector(self, encoding='state'):
         """
         Converts game state to a numeric vector
-        :param encoding: 'color' or 'state'
+        :param encoding: 'color', 'state', 'float32' or 'bits'
         :return: State vector representing game [np.array]
         """
         vector = []
@@ -438,6 +503,30 @@ class SquareStackerGame:
             vector.append(self._score)
             vector.append(self._combo)
 
+        elif encoding in ('float32', 'bits'):
+
+            # Color index per cell
+            cells = [tile[n] for row in self._board for tile in row for n in range(3)]
+            cells += [self._piece[k][n] for k in range(3) for n in range(3)]
+            codes = [colors.index(color) for color in cells]
+
+            if encoding == 'float32':
+
+                # Normalized float32 state-vector encoding
+                vector = np.zeros(254, dtype=np.float32)
+                vector[7 * np.arange(36) + codes] = 1.0
+                vector[252] = self._score / SCORE_SCALE
+                vector[253] = self._combo / COMBO_SCALE
+                return vector
+
+            else:
+
+                # Packed bit-plane encoding (plane c, cell m at bit 36 * c + m)
+                planes = np.zeros(256, dtype=bool)
+                planes[36 * np.array(codes) + np.arange(36)] = True
+                counters = np.array([self._score, self._combo], dtype='<u4').view(np.uint8)
+                return np.concatenate((np.packbits(planes), counters))
+
         # Return vector
         return np.array(vector)
 
@@ -479,12 +568,36 @@ class SquareStackerGame:
 
     def deepcopy(self):
         """
-        Returns deep copy of game
+        Returns search copy of game: same position, but pieces dealt after copying come
+        from the global random module (no seeded or scripted deals) and are logged from empty
+        """
+        return self._copy(None, None, bytearray())
+
+    def __deepcopy__(self, memo):
+        """
+        Exact copy via copy.deepcopy: same deal generator state and deal log, so the
+        copy deals the same pieces as the original
+        """
+        rng = None
+        if self._rng is not None:
+            rng = Random()
+            rng.setstate(self._rng.getstate())
+        return self._copy(rng, self._scripted_deals, bytearray(self._deals))
+
+    def _copy(self, rng, scripted_deals, deals):
+        """
+        Copies game without calling the constructor (which would deal pieces)
+        :param rng: Piece generator of copy (or None)
+        :param scripted_deals: Scripted deals of copy (or None)
+        :param deals: Deal log of copy (also indexes scripted deals)
+        :return: SquareStackerGame
         """
-        game = SquareStackerGame()
-        game._board = deepcopy(self._board)
-        game._piece = deepcopy(self._piece)
-        game._is_piece_playable = deepcopy(self._is_piece_playable)
-        game._score = self._score
-        game._combo = self._combo
+        game = object.__new__(SquareStackerGame)
+        game.__dict__.update(self.__dict__)
+        game._rng = rng
+        game._scripted_deals = scripted_deals
+        game._deals = deals
+        game._board = [[tile[:] for tile in row] for row in self._board]
+        game._piece = [piece[:] for piece in self._piece]
+        game._is_piece_playable = self._is_piece_playable[:]
         return game
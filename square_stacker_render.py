@@ -0,0 +1,333 @@
+"""
+square_stacker_render.py
+Square Stacker game rendering (OpenCV window, video or PNG frames)
+
+Kept separate from square_stacker_game.py so that the game engine only needs
+the standard library and NumPy. This module is imported on first call to
+SquareStackerGame.show, and OpenCV is only imported where frames get text,
+windows or files.
+
+Frames are built from precomputed tile sprites (one per combination of layer
+colors) with array blits, so rendering a mosaic of N games takes 12 blits for
+all games at once. GameRenderer sends compact game snapshots (color codes and
+scores) to a background process, which renders them and shows or writes the
+frames. By default submitting never blocks: when the queue is full the
+snapshot is dropped, and the window only shows the latest frame.
+"""
+
+import math
+import multiprocessing as mp
+import os
+from importlib.util import find_spec
+from queue import Empty, Full
+
+import numpy as np
+
+# colors in BGR
+colors_rgb = {'P': (128, 0, 255),
+              'G': (103, 251, 37),
+              'B': (242, 226, 53),
+              'Y': (14, 223, 246),
+              'O': (2, 121, 255),
+              'V': (255, 46, 184),
+              '_': (87, 92, 95)}
+
+# Palette indexed by color code ('color' state vector order)
+_palette = np.array([colors_rgb[color] for color in ['_', 'P', 'G', 'B', 'Y', 'O', 'V']], dtype=np.uint8)
+_num_codes = len(_palette)
+
+# Time between renderer process liveness checks while waiting on it [s]
+_poll_time = 0.1
+
+# Frame layout in grid cells (scaled by pixels per cell)
+_grid_size = 30
+_tile_size = 5
+_board_origins = [(6 * i + 1, 6 * j + 1) for i in range(3) for j in range(3)]
+_piece_origins = [(6 * k + 1, 21) for k in range(3)]
+
+
+def make_sprites(scale=10):
+    """
+    Precomputes tile sprites for all layer color combinations
+    Layer 2 fills the tile, layer 1 its middle 3x3 cells and layer 0 its center cell.
+    :param scale: Pixels per grid cell
+    :return: Sprites indexed by 49 * layer 2 + 7 * layer 1 + layer 0 code [np.array 343 x S x S x 3]
+    """
+    indices = np.arange(_num_codes ** 3)
+    outer, middle, inner = indices // _num_codes ** 2, indices // _num_codes % _num_codes, indices % _num_codes
+    cells = np.empty((_num_codes ** 3, _tile_size, _tile_size), dtype=np.int64)
+    cells[:] = outer[:, np.newaxis, np.newaxis]
+    cells[:, 1:4, 1:4] = middle[:, np.newaxis, np.newaxis]
+    cells[:, 2, 2] = inner
+    sprites = _palette[cells]
+    return np.repeat(np.repeat(sprites, scale, axis=1), scale, axis=2)
+
+
+def get_codes(games):
+    """
+    Snapshots color codes and scores of games
+    :param games: List of SquareStackerGame
+    :return codes: Board and piece color codes [np.array N x 36 uint8]
+    :return scores: Game scores [np.array N]
+    """
+    vectors = np.array([game.get_state_vector('color') for game in games], dtype=np.int64).reshape(len(games), -1)
+    return vectors[:, :36].astype(np.uint8), vectors[:, 36]
+
+
+def render_frame(codes, sprites, columns=None, num_cells=None):
+    """
+    Renders mosaic of games (without text)
+    :param codes: Board and piece color codes [np.array N x 36]
+    :param sprites: Tile sprites from make_sprites
+    :param columns: Games per mosaic row (default ceil(sqrt(num_cells)))
+    :param num_cells: Number of mosaic cells (default N, extra games are cut)
+    :return: BGR frame [np.array H x W x 3 uint8]
+    """
+    num_cells = num_cells if num_cells is not None else len(codes)
+    columns = columns if columns is not None else max(1, math.ceil(math.sqrt(num_cells)))
+    rows = max(1, math.ceil(num_cells / columns))
+    codes = np.asarray(codes, dtype=np.int64)[:num_cells]
+    num_games = len(codes)
+    scale = sprites.shape[1] // _tile_size
+    size = _grid_size * scale
+
+    # Sprite of each tile (9 board tiles, then 3 pieces; layer 0 is the first code)
+    tiles = codes.reshape(num_games, 12, 3)
+    sprite_indices = (_num_codes ** 2) * tiles[:, :, 2] + _num_codes * tiles[:, :, 1] + tiles[:, :, 0]
+
+    # Blit each tile position for all games at once
+    frames = np.zeros((rows * columns, size, size, 3), dtype=np.uint8)
+    for t, (r, c) in enumerate(_board_origins + _piece_origins):
+        frames[:num_games, r * scale:(r + _tile_size) * scale, c * scale:(c + _tile_size) * scale] = \
+            sprites[sprite_indices[:, t]]
+
+    # Arrange games in mosaic
+    frames = frames.reshape(rows, columns, size, size, 3).transpose(0, 2, 1, 3, 4)
+    return frames.reshape(rows * size, columns * size, 3)
+
+
+def draw_text(frame, scores, game_nums, columns, scale=10):
+    """
+    Draws game number and score of each game onto mosaic frame
+    :param frame: Frame from render_frame
+    :param scores: Game scores
+    :param game_nums: Game numbers
+    :param columns: Games per mosaic row
+    :param scale: Pixels per grid cell
+    :return: None
+    """
+    import cv2
+    size = _grid_size * scale
+    font_scale = 0.05 * scale
+    for n, (score, game_num) in enumerate(zip(scores, game_nums)):
+        x, y = (n % columns) * size, (n // columns) * size
+        for line, text in enumerate([f'Game Number: {game_num}', f'Score: {score}']):
+            bottom_left = (x + scale, y + size - 5 * scale + 2 * scale * line)
+            cv2.putText(frame, text, bottom_left, cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255))
+
+
+def _run_renderer(frame_queue, window, video_name, png_dir, fps, update_time, columns, scale, text):
+    """
+    Renderer process main loop: renders snapshots and shows or writes frames
+    :param frame_queue: Queue of snapshots (codes, scores, game_nums), None to stop
+    :param window: Show frames in OpenCV window
+    :param video_name: Name of video file (or None)
+    :param png_dir: Directory of PNG frames (or None)
+    :param fps: Video frame rate
+    :param update_time: Time between window updates [ms]
+    :param columns: Games per mosaic row (or None)
+    :param scale: Pixels per grid cell
+    :param text: Draw game numbers and scores
+    :return: None
+    """
+    import cv2
+    sprites = make_sprites(scale)
+    video = None
+    num_cells = None
+    frame_count = 0
+    if png_dir is not None:
+        os.makedirs(png_dir, exist_ok=True)
+
+    running = True
+    while running:
+
+        # Wait for snapshot, then take all queued snapshots
+        try:
+            snapshots = [frame_queue.get(timeout=update_time / 1000.0)]
+        except Empty:
+            if window:
+                cv2.waitKey(1)
+            continue
+        while True:
+            try:
+                snapshots.append(frame_queue.get_nowait())
+            except Empty:
+                break
+        if snapshots[-1] is None:
+            running = False
+            snapshots.pop()
+
+        # Files get every frame, window only the latest
+        for n, (codes, scores, game_nums) in enumerate(snapshots):
+            is_latest = n == len(snapshots) - 1
+            if video_name is None and png_dir is None and not is_latest:
+                continue
+            num_cells = num_cells if num_cells is not None else len(codes)
+            columns = columns if columns is not None else max(1, math.ceil(math.sqrt(num_cells)))
+            frame = render_frame(codes, sprites, columns, num_cells)
+            if text:
+                draw_text(frame, scores[:num_cells], game_nums[:num_cells], columns, scale)
+
+            # Write frame
+            if video_name is not None:
+                if video is None:
+                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                    video = cv2.VideoWriter(video_name, fourcc, fps, (frame.shape[1], frame.shape[0]))
+                video.write(frame)
+            if png_dir is not None:
+                cv2.imwrite(os.path.join(png_dir, f'frame_{frame_count:06d}.png'), frame)
+            frame_count += 1
+
+            # Show latest frame
+            if window and is_latest:
+                cv2.imshow('image', frame)
+                cv2.waitKey(max(1, update_time))
+
+    # Close outputs
+    if video is not None:
+        video.release()
+    if window:
+        cv2.destroyWindow('image')
+
+
+class GameRenderer:
+
+    def __init__(self, window=True, video_name=None, png_dir=None, fps=10, update_time=1, columns=None, scale=10,
+                 text=True, max_queue=16, drop_frames=True):
+        """
+        Constructs and starts renderer process
+        :param window: Show frames in OpenCV window
+        :param video_name: Name of video file written with OpenCV (or None)
+        :param png_dir: Directory of PNG frame sequence (or None)
+        :param fps: Video frame rate
+        :param update_time: Min time between window updates [ms]
+        :param columns: Games per mosaic row (default square mosaic)
+        :param scale: Pixels per grid cell (tiles are 5 cells, frames 30 cells per game)
+        :param text: Draw game numbers and scores
+        :param max_queue: Max queued snapshots
+        :param drop_frames: Drop snapshots when queue is full (else submit waits, so files get every frame)
+        """
+        if find_spec('cv2') is None:
+            raise ImportError('GameRenderer requires OpenCV (cv2)')
+        self._queue = mp.Queue(max_queue)
+        self._process = mp.Process(target=_run_renderer, daemon=True, args=(
+            self._queue, window, video_name, png_dir, fps, update_time, columns, scale, text))
+        self._process.start()
+        self._drop_frames = drop_frames
+        self._num_submitted = 0
+        self._num_dropped = 0
+
+    def submit(self, games, game_nums=None):
+        """
+        Queues frame of games (dropped if queue is full and dropping frames)
+        :param games: List of SquareStackerGame (one mosaic cell each)
+        :param game_nums: Game numbers shown in frame (default 0..N-1)
+        :return: True if frame was queued
+        """
+        codes, scores = get_codes(games)
+        return self.submit_codes(codes, scores, game_nums)
+
+    def submit_codes(self, codes, scores, game_nums=None):
+        """
+        Queues frame of games given as color codes (dropped if queue is full and dropping frames)
+        :param codes: Board and piece color codes [np.array N x 36] (e.g. 'color' observations)
+        :param scores: Game scores [np.array N]
+        :param game_nums: Game numbers shown in frame (default 0..N-1)
+        :return: True if frame was queued
+        """
+        game_nums = list(game_nums) if game_nums is not None else list(range(len(codes)))
+        snapshot = (np.asarray(codes, dtype=np.uint8), list(scores), game_nums)
+        self._num_submitted += 1
+        while True:
+            self._check_process()
+            try:
+                self._queue.put(snapshot, block=not self._drop_frames, timeout=_poll_time)
+                return True
+            except Full:
+                if self._drop_frames:
+                    self._num_dropped += 1
+                    return False
+
+    def _check_process(self):
+        """
+        Raises error if renderer process has exited (e.g. no display or unwritable output)
+        :return: None
+        """
+        if self._process is None:
+            raise RuntimeError('GameRenderer is closed')
+        if not self._process.is_alive():
+            self._queue.cancel_join_thread()
+            raise RuntimeError(f'Renderer process exited with code {self._process.exitcode}')
+
+    def get_num_dropped(self):
+        """
+        :return: Number of submitted frames dropped because the queue was full
+        """
+        return self._num_dropped
+
+    def get_num_submitted(self):
+        """
+        :return: Number of submitted frames
+        """
+        return self._num_submitted
+
+    def close(self):
+        """
+        Renders queued frames, closes outputs and stops renderer process
+        :return: None
+        """
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+
+        # Queue stop signal (unless process has exited) and wait for queued frames
+        while process.is_alive():
+            try:
+                self._queue.put(None, timeout=_poll_time)
+                break
+            except Full:
+                pass
+        while process.is_alive():
+            process.join(_poll_time)
+        if process.exitcode != 0:
+            self._queue.cancel_join_thread()
+            raise RuntimeError(f'Renderer process exited with code {process.exitcode}')
+
+
+# Renderer of SquareStackerGame.show (started on first call)
+_show_renderer = None
+
+
+def show(game, game_num=0, update_time=500):
+    """
+    Displays current game state in window without blocking
+    :param game: SquareStackerGame
+    :param game_num: int
+    :param update_time: int, min time in ms between window updates
+    :return:
+    """
+    global _show_renderer
+    if _show_renderer is None:
+        _show_renderer = GameRenderer(update_time=update_time, max_queue=2)
+    try:
+        _show_renderer.submit([game], [game_num])
+    except RuntimeError:
+        _show_renderer = None
+        raise
+
+
+def close_window():
+    global _show_renderer
+    if _show_renderer is not None:
+        renderer, _show_renderer = _show_renderer, None
+        renderer.close()
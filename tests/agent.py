@@ -3,87 +3,257 @@ agent.py
 Test function for evaluating Square Stacker AI agents
 """
 
+import multiprocessing as mp
+import random
+from hashlib import blake2b
+from time import perf_counter
 import numpy as np
-import matplotlib.pyplot as plt
 from utils.progress_tracker import ProgressTracker
+from utils.running_stats import RunningStats, PairedStats, QuantileSketch
 from agents.search.agent import SearchAgent
-from square_stacker_game import SquareStackerGame
+from square_stacker_game import SquareStackerGame, move_to_index
+from utils.game_records import GameRecord, GameRecordWriter
 
 
-def test_agent(agent, num_games=10000, num_bins=20, show=False):
+def play_game(agent, game_seed=None, show=False, game_num=0, record=False):
     """
-    tests given Square Stacker agent by running games
+    Plays one game with agent until no valid moves exist
     :param agent: Square Stacker AI agent
-    :param num_games: Number of games to test
-    :param num_bins: Number of histogram bins
+    :param game_seed: Seed of game pieces and agent randomness (or None)
     :param show: Show gameplay
+    :param game_num: Game number shown in window
+    :param record: Also return game record
+    :return score: Final game score
+    :return moves_searched: List of moves searched per move (search agents only)
+    :return decision_times: List of select_move durations per move [s]
+    :return record: GameRecord (only if record is True)
+    """
+
+    # Seed pieces and agent randomness (separately, so searches cannot foresee deals)
+    if game_seed is not None:
+        agent_seed = get_agent_seed(game_seed)
+        random.seed(agent_seed)
+        np.random.seed(agent_seed % 2 ** 32)
+    game = SquareStackerGame(seed=game_seed)
+
+    is_search_agent = issubclass(type(agent), SearchAgent)
+    moves_searched = []
+    decision_times = []
+    move_indices = bytearray()
+    while True:
+
+        if show:
+            game.show(game_num)
+
+        # Generate valid moves
+        valid_moves = game.get_valid_moves()
+        num_valid_moves = len(valid_moves)
+
+        if num_valid_moves > 0:
+            # Make move according to agent
+            time_start = perf_counter()
+            if is_search_agent:
+                move, moves_tried = agent.select_move(game)
+                moves_searched.append(moves_tried)
+            else:
+                move = agent.select_move(game)
+            decision_times.append(perf_counter() - time_start)
+            game.make_move(move)
+            move_indices.append(move_to_index(move))
+        else:
+            # Return score
+            if record:
+                game_record = GameRecord(game_seed, game.get_score(), game.get_deals(), bytes(move_indices))
+                return game.get_score(), moves_searched, decision_times, game_record
+            return game.get_score(), moves_searched, decision_times
+
+
+def get_game_seed(seed, game_num):
+    """
+    Derives deterministic per-game seed
+    :param seed: Test seed (or None)
+    :param game_num: Index of game in test
+    :return: Game seed (or None if seed is None)
+    """
+    return None if seed is None else (seed << 32) + game_num
+
+
+def get_agent_seed(game_seed):
+    """
+    Derives seed of agent randomness (global random and NumPy) from game seed
+    It is a hash of the game seed, so it never equals the seed of the game
+    pieces and all bits of the test seed and game index reach NumPy's 32-bit seed.
+    :param game_seed: Game seed from get_game_seed
+    :return: 64-bit agent seed
+    """
+    data = b'agent' + game_seed.to_bytes(16, 'little', signed=True)
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), 'little')
+
+
+# Agent of pool worker processes
+_worker_agent = None
+
+
+def _init_worker(agent):
+    """
+    Pool worker initializer
+    :param agent: Square Stacker AI agent (pickled once per worker)
     :return: None
     """
+    global _worker_agent
+    _worker_agent = agent
+
+
+def _play_worker_game(args):
+    """
+    Plays game in pool worker
+    :param args: Tuple (game_num, game_seed, record)
+    :return: Tuple (game_num, score, moves_searched, decision_times[, record])
+    """
+    game_num, game_seed, record = args
+    return (game_num,) + play_game(_worker_agent, game_seed, record=record)
 
-    # Only show every this number of games
-    show_interval = 1000
+
+def play_games(agent, num_games, seed=None, num_workers=1, show=False, show_interval=1000,
+               first_game=0, on_game=None, record_path=None):
+    """
+    Plays games with agent, serially or sharded across a process pool
+    Game i is seeded with get_game_seed(seed, i), so with a seed the results
+    are identical for any number of workers.
+    :param agent: Square Stacker AI agent (must be picklable if num_workers > 1)
+    :param num_games: Number of games to play
+    :param seed: Test seed (or None for unseeded games)
+    :param num_workers: Number of worker processes (1 plays in this process)
+    :param show: Show gameplay (serial only)
+    :param show_interval: Only show every this number of games
+    :param first_game: Index of first game (offsets game seeds)
+    :param on_game: Called as on_game(score, moves_searched, decision_times) for each game
+        in game order, stops early if it returns True (or None)
+    :param record_path: Path of game record file to append games to (or None)
+    :return scores_list: List of final scores in game order
+    :return moves_searched_list: List of moves searched per move in game order (search agents only)
+    :return decision_times_list: List of select_move durations per move in game order [s]
+    """
 
     # Play games and track scores
-    progress = ProgressTracker(1.0)
+    progress = ProgressTracker(1.0, num_games)
     progress.start()
-    scores_list = [0] * num_games
-
-    # search agent data
-    is_search_agent = issubclass(type(agent), SearchAgent)
+    scores_list = []
     moves_searched_list = []
+    decision_times_list = []
+    record = record_path is not None
+    writer = GameRecordWriter(record_path, append=True) if record else None
 
-    # Initial printout
-    print('Square Stacker Agent Test')
-    print(f'Playing {num_games} games...\n')
+    def finish(score, moves_searched, decision_times, game_record=None):
+        if writer is not None:
+            writer.add(*game_record)
+        scores_list.append(score)
+        moves_searched_list.extend(moves_searched)
+        decision_times_list.extend(decision_times)
+        return on_game is not None and on_game(score, moves_searched, decision_times)
 
-    for i in range(num_games):
+    if num_workers > 1:
 
-        # Play game until no valid moves exist
-        game = SquareStackerGame()
-        move_num = 0
-        while True:
+        # Shard games across process pool and stream results back
+        args = [(i, get_game_seed(seed, i), record) for i in range(first_game, first_game + num_games)]
+        chunk_size = max(1, min(16, num_games // (4 * num_workers)))
+        results = {}
+        with mp.Pool(num_workers, initializer=_init_worker, initargs=(agent,)) as pool:
+            for n, (i, *result) in enumerate(pool.imap_unordered(_play_worker_game, args, chunk_size)):
 
-            if show and i % show_interval == 0:
-                game.show(i)
+                # Update progress printer
+                progress.add()
 
-            # Generate valid moves
-            valid_moves = game.get_valid_moves()
-            num_valid_moves = len(valid_moves)
-
-            if num_valid_moves > 0:
-                # Make move according to agent
-                if is_search_agent:
-                    move, moves_tried = agent.select_move(game)
-                    moves_searched_list.append(moves_tried)
-                else:
-                    move = agent.select_move(game)
-                game.make_move(move)
-            else:
-                # Log score and exit game
-                scores_list[i] = game.get_score()
+                # Finish games in game order (pool is terminated on early stop)
+                results[i] = result
+                stop = False
+                while not stop and first_game + len(scores_list) in results:
+                    stop = finish(*results.pop(first_game + len(scores_list)))
+                if stop:
+                    break
+    else:
+        for i in range(first_game, first_game + num_games):
+            show_game = show and i % show_interval == 0
+            if finish(*play_game(agent, get_game_seed(seed, i), show_game, i, record)):
                 break
 
-        # Update progress printer
-        progress.update(float(i + 1) / num_games)
+            # Update progress printer
+            progress.add()
+
+    progress.stop()
+    if writer is not None:
+        writer.close()
+    return scores_list, moves_searched_list, decision_times_list
+
+
+def test_agent(agent, num_games=10000, num_bins=20, show=False, num_workers=1, seed=None,
+               ci_width=None, confidence=0.95, min_games=30, record_path=None):
+    """
+    tests given Square Stacker agent by running games
+    :param agent: Square Stacker AI agent
+    :param num_games: Number of games to test (max number if ci_width is given)
+    :param num_bins: Number of histogram bins
+    :param show: Show gameplay (serial only)
+    :param num_workers: Number of worker processes (agent must be picklable if > 1)
+    :param seed: Test seed for deterministic scores regardless of num_workers (or None)
+    :param ci_width: Stop once mean score confidence interval is narrower than this (or None)
+    :param confidence: Confidence level of mean score interval
+    :param min_games: Min games before stopping early
+    :param record_path: Path of game record file to append games to (or None)
+    :return: List of scores
+    """
+
+    # search agent data
+    is_search_agent = issubclass(type(agent), SearchAgent)
+
+    # Streaming statistics
+    score_stats = RunningStats()
+    score_sketch = QuantileSketch()
+    search_stats = RunningStats()
+
+    def on_game(score, moves_searched, decision_times):
+        score_stats.update(score)
+        score_sketch.update(score)
+        for moves_tried in moves_searched:
+            search_stats.update(moves_tried)
+
+        # Sequential stopping on confidence interval width
+        if ci_width is not None and score_stats.get_count() >= min_games:
+            low, high = score_stats.get_ci(confidence)
+            return high - low < ci_width
+        return False
+
+    # Initial printout
+    print('Square Stacker Agent Test')
+    print(f'Playing {num_games} games...\n')
+
+    # Play games and track scores
+    scores_list, moves_searched_list, _ = play_games(agent, num_games, seed, num_workers, show, on_game=on_game,
+                                                     record_path=record_path)
 
     print('\nComplete!\n')
 
     # Summary statistics
-    print('Score Stats:')
-    print(f'Mean: {np.mean(scores_list):.2f}')
-    print(f'Std: {np.std(scores_list):.2f}')
-    print(f'Min: {np.min(scores_list)}')
-    print(f'Max: {np.max(scores_list)}')
+    low, high = score_stats.get_ci(confidence)
+    print(f'Score Stats ({score_stats.get_count()} games):')
+    print(f'Mean: {score_stats.get_mean():.2f}')
+    print(f'{confidence * 100.0:.0f}% CI: [{low:.2f}, {high:.2f}]')
+    print(f'Std: {score_stats.get_std():.2f}')
+    print(f'Min: {score_stats.get_min()}')
+    print(f'Median: {score_sketch.quantile(0.5):.1f}')
+    print(f'90th Percentile: {score_sketch.quantile(0.9):.1f}')
+    print(f'Max: {score_stats.get_max()}')
 
     # search agent stats
     if is_search_agent:
         print('\nMove Search Stats:')
-        print(f'Mean: {np.mean(moves_searched_list):.2f}')
-        print(f'Std: {np.std(moves_searched_list):.2f}')
-        print(f'Min: {np.min(moves_searched_list)}')
-        print(f'Max: {np.max(moves_searched_list)}')
+        print(f'Mean: {search_stats.get_mean():.2f}')
+        print(f'Std: {search_stats.get_std():.2f}')
+        print(f'Min: {search_stats.get_min()}')
+        print(f'Max: {search_stats.get_max()}')
 
     # Plot histogram of scores
+    import matplotlib.pyplot as plt
     fig, axs = plt.subplots(1, 1)
     axs.hist(scores_list, bins=num_bins)
     axs.set_title('Agent Scores')
@@ -100,3 +270,94 @@ def test_agent(agent, num_games=10000, num_bins=20, show=False):
 
     # Show plots
     plt.show()
+
+    return scores_list
+
+
+def obrien_fleming_boundaries(fractions, alpha=0.05, num_paths=100000):
+    """
+    Computes two-sided O'Brien-Fleming group-sequential z boundaries
+    Look k rejects if |z_k| > c / sqrt(t_k), where t_k is the fraction of max
+    games played. The constant c is the 1 - alpha quantile of max_k |W(t_k)| of
+    a Brownian motion W, found by seeded simulation, so the overall type I
+    error over all looks is alpha.
+    :param fractions: Increasing information fractions t_k of looks (0,1]
+    :param alpha: Overall significance level
+    :param num_paths: Number of simulated paths
+    :return: z boundaries of looks [np.array]
+    """
+    fractions = np.asarray(fractions, dtype=float)
+    increments = np.diff(fractions, prepend=0.0)
+    rng = np.random.default_rng(0)
+    paths = np.cumsum(rng.standard_normal((num_paths, len(fractions))) * np.sqrt(increments), axis=1)
+    c = np.quantile(np.max(np.abs(paths), axis=1), 1.0 - alpha)
+    return c / np.sqrt(fractions)
+
+
+def compare_agents(agent_a, agent_b, alpha=0.05, max_games=10000, min_games=30, batch_games=100,
+                   num_workers=1, seed=None):
+    """
+    Plays batches of the same games with two agents until their mean scores
+    differ at significance alpha or max_games is reached
+    Both agents play game i with the same seed, so the test is a paired z-test
+    of score differences, checked after each batch against O'Brien-Fleming
+    group-sequential boundaries (overall type I error alpha over all looks).
+    :param agent_a: First Square Stacker AI agent
+    :param agent_b: Second Square Stacker AI agent
+    :param alpha: Significance level of test
+    :param max_games: Max games per agent
+    :param min_games: Min games per agent before first look
+    :param batch_games: Games per agent between looks
+    :param num_workers: Number of worker processes (agents must be picklable if > 1)
+    :param seed: Test seed shared by both agents (or None for unpaired random games)
+    :return: Dict of results
+    """
+    stats = PairedStats()
+
+    # Planned looks and their boundaries
+    looks = [n for n in range(batch_games, max_games + batch_games, batch_games) if n >= min_games]
+    looks = [min(n, max_games) for n in looks]
+    looks = sorted(set(looks)) if len(looks) > 0 else [max_games]
+    boundaries = dict(zip(looks, obrien_fleming_boundaries(np.array(looks) / max_games, alpha)))
+    z = 0.0
+    z_crit = boundaries[looks[-1]]
+
+    print('Square Stacker Agent Comparison')
+    print(f'Playing up to {max_games} games per agent...\n')
+
+    while stats.get_diff().get_count() < max_games:
+
+        # Play next batch of same games with each agent
+        first_game = stats.get_diff().get_count()
+        num_games = min(batch_games, max_games - first_game)
+        scores_a = play_games(agent_a, num_games, seed, num_workers, first_game=first_game)[0]
+        scores_b = play_games(agent_b, num_games, seed, num_workers, first_game=first_game)[0]
+        for score_a, score_b in zip(scores_a, scores_b):
+            stats.update(score_a, score_b)
+
+        # Paired z-test at planned looks
+        num_played = stats.get_diff().get_count()
+        z = stats.get_z()
+        print(f'Games: {num_played}, Mean A: {stats.get_a().get_mean():.2f}, '
+              f'Mean B: {stats.get_b().get_mean():.2f}, z: {z:.2f}')
+        if num_played in boundaries:
+            z_crit = boundaries[num_played]
+            if abs(z) > z_crit:
+                break
+
+    significant = bool(abs(z) > z_crit)
+    print('\nComplete!\n')
+    if significant:
+        print(f'Agent {"A" if z > 0 else "B"} scores higher (alpha = {alpha})')
+    else:
+        print(f'No significant difference (alpha = {alpha})')
+    return {
+        'games': stats.get_diff().get_count(),
+        'mean_a': stats.get_a().get_mean(),
+        'mean_b': stats.get_b().get_mean(),
+        'mean_diff': stats.get_diff().get_mean(),
+        'z': z,
+        'z_crit': float(z_crit),
+        'significant': significant,
+        'variance_reduction': stats.get_variance_reduction(),
+    }
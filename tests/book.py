@@ -0,0 +1,25 @@
+"""
+book.py
+Test script for Square Stacker position book
+"""
+
+from agents.book import build_book, with_book
+from agents.search.beam import BeamSearchAgent
+from tests.agent import test_agent
+
+# Test Settings
+book_file = 'position_book.npy'
+num_games = 10000
+max_moves = 6
+num_positions = 10000
+test_num_games = 100
+num_workers = 1  # Serial, so book hit and miss counters are kept in this process
+seed = 0
+
+# Build book with beam search, then test book-backed agent
+if __name__ == '__main__':
+    agent = BeamSearchAgent(32)
+    build_book(agent, book_file, num_games=num_games, max_moves=max_moves, num_positions=num_positions)
+    book_agent = with_book(BeamSearchAgent(8), book_file)
+    test_agent(book_agent, num_games=test_num_games, num_workers=num_workers, seed=seed)
+    print(f'Book hits: {book_agent.get_book().get_hits()}, misses: {book_agent.get_book().get_misses()}')
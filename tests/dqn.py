@@ -3,6 +3,7 @@ dqn.py
 Test script for Square Stacker Deep Q Network Agent
 """
 
+import os
 from agents.dqn import DQNAgent
 from tests.agent import test_agent
 
@@ -12,8 +13,15 @@ games_per_fit = 5000
 discount = 0.0
 epsilon = 0.1
 test_num_games = 1000
+policy_file = 'dqn_policy.npz'
+checkpoint_file = 'dqn_checkpoint.npz'
 
-# Test Agent
-agent = DQNAgent()
-agent.train(num_fits, games_per_fit, discount, epsilon)
-test_agent(agent, num_games=test_num_games)
+# Test Agent (resumes from checkpoint if one exists)
+# (guarded since the live plot runs in a spawned process, which imports this script)
+if __name__ == '__main__':
+    agent = DQNAgent()
+    if os.path.exists(checkpoint_file):
+        agent.load(checkpoint_file)
+    agent.train(num_fits, games_per_fit, discount, epsilon, checkpoint_name=checkpoint_file, resume=True, plot=True)
+    agent.export_policy().save(policy_file)
+    test_agent(agent, num_games=test_num_games)
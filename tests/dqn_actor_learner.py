@@ -0,0 +1,22 @@
+"""
+dqn_actor_learner.py
+Test script for Square Stacker Deep Q Network Agent trained by actors and learner
+"""
+
+from agents.dqn import DQNAgent
+from agents.dqn_actor_learner import ActorLearner
+from tests.agent import test_agent
+
+# Test Settings
+num_actors = 4
+num_updates = 50000
+discount = 0.0
+epsilon = 0.1
+test_num_games = 1000
+
+# Test Agent
+if __name__ == '__main__':
+    agent = DQNAgent()
+    trainer = ActorLearner(agent, num_actors=num_actors, epsilon=epsilon)
+    trainer.run(num_updates, discount)
+    test_agent(agent, num_games=test_num_games)
@@ -0,0 +1,15 @@
+"""
+dqn_policy.py
+Test script for exported Square Stacker Deep Q Network policy (no TensorFlow)
+"""
+
+from agents.dqn_policy import DQNPolicyAgent
+from tests.agent import test_agent
+
+# Test Settings
+policy_file = 'dqn_policy.npz'
+test_num_games = 1000
+
+# Test Agent
+agent = DQNPolicyAgent(policy_file)
+test_agent(agent, num_games=test_num_games)
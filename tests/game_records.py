@@ -0,0 +1,24 @@
+"""
+game_records.py
+Test script for recording Square Stacker games and replaying the records
+"""
+
+from time import perf_counter
+from agents.random import RandomAgent
+from tests.agent import play_games
+from utils.game_records import rescore_records
+
+# Test Settings
+record_file = 'games.ssgr'
+num_games = 10000
+num_workers = 4
+seed = 0
+
+# Record games, then replay them and check their scores
+if __name__ == '__main__':
+    play_games(RandomAgent(), num_games, seed=seed, num_workers=num_workers, record_path=record_file)
+    time_start = perf_counter()
+    scores, num_mismatches = rescore_records(record_file, num_workers=num_workers)
+    duration = perf_counter() - time_start
+    print(f'Replayed {len(scores)} games in {duration:.2f} s ({len(scores) / duration:.0f} games/s)')
+    print(f'Score mismatches: {num_mismatches}')
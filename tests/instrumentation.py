@@ -0,0 +1,48 @@
+"""
+instrumentation.py
+Test script for engine call counters and decision latency instrumentation of Square Stacker agents
+"""
+
+import pickle
+from agents.search.beam import BeamSearchAgent
+from agents.search.dlrgs import DepthLimitedRandomSearchAgent
+from tests.agent import play_games
+from utils.instrumentation import Instrumentation, ListSink
+
+# Test Settings
+search_depth = 1
+beam_width = 4
+games_per_move = 2
+num_games = 5
+num_workers = 2
+seed = 0
+
+# Instrument agent in this process, then in worker processes
+if __name__ == '__main__':
+    sink = ListSink()
+    instrumentation = Instrumentation(sink)
+    agent = DepthLimitedRandomSearchAgent(search_depth, games_per_move)
+    with instrumentation:
+        instrumentation.attach(agent, 'DLRGS')
+        scores = play_games(agent, num_games, seed=seed)[0]
+        instrumentation.summary()
+        print(f'Records: {len(sink.records)}, Engine calls: {instrumentation.get_counters()}\n')
+
+        # Attached agent is picklable (copies record into their own instrumentation)
+        num_decisions = instrumentation.get_latency('DLRGS').get_count()
+        agent_copy, instrumentation_copy = pickle.loads(pickle.dumps((agent, instrumentation)))
+        play_games(agent_copy, 1, seed=seed)
+        print(f'Pickled copy decisions: {instrumentation_copy.get_latency("DLRGS").get_count() - num_decisions}, '
+              f'original: {instrumentation.get_latency("DLRGS").get_count() - num_decisions}')
+        worker_scores = play_games(agent, num_games, seed=seed, num_workers=num_workers)[0]
+        print(f'Worker scores match: {worker_scores == scores}')
+
+        # Vectorized search counts afterstates simulated instead of engine calls
+        beam_agent = instrumentation.attach(BeamSearchAgent(beam_width), 'Beam')
+        play_games(beam_agent, 1, seed=seed)
+        print(f'Beam afterstate evaluations: {instrumentation.get_counters()["afterstate_evals"]}\n')
+
+    # Detached agent plays the same games without instrumentation
+    Instrumentation.detach(agent)
+    print(f'Detached scores match: {play_games(agent, num_games, seed=seed)[0] == scores}')
+    print(f'Records after detach: {len(sink.records)}')
@@ -0,0 +1,22 @@
+"""
+ntuple.py
+Test script for Square Stacker N-Tuple Network Agent
+"""
+
+import os
+from agents.ntuple import NTupleAgent
+from tests.agent import test_agent
+
+# Test Settings
+num_games = 10000
+alpha = 0.001
+epsilon = 0.0
+num_parallel = 256
+test_num_games = 1000
+weights_file = 'ntuple_weights.npy'
+
+# Test Agent (continues training saved weights if they exist)
+agent = NTupleAgent.load(weights_file) if os.path.exists(weights_file) else NTupleAgent()
+agent.train(num_games, alpha, epsilon, num_parallel=num_parallel)
+agent.save(weights_file)
+test_agent(agent, num_games=test_num_games)
@@ -0,0 +1,63 @@
+"""
+policy_server.py
+Test script for serving an exported Square Stacker DQN policy to concurrent games
+"""
+
+import asyncio
+from agents.dqn_policy import DQNPolicy
+from square_stacker_game import SquareStackerGame
+from tests.agent import play_games
+from utils.policy_server import PolicyServer, RemoteAgent, policy_evaluator
+
+# Test Settings
+policy_file = 'dqn_policy.npz'
+socket_path = 'dqn_policy.sock'
+num_concurrent_games = 256
+max_batch_size = 64
+max_wait_s = 0.001
+test_num_games = 1000
+num_workers = 4
+
+
+async def play_game(server, seed):
+    """
+    Plays one game with moves requested from server
+    :param server: Started PolicyServer
+    :param seed: Game seed
+    :return: Final game score
+    """
+    game = SquareStackerGame(seed)
+    while True:
+        move = await server.select_move(game)
+        if move is None:
+            return game.get_score()
+        game.make_move(move)
+
+
+async def play_in_process(server):
+    """
+    Plays concurrent games against in-process server
+    :param server: PolicyServer
+    :return: List of final scores
+    """
+    await server.start()
+    scores = await asyncio.gather(*[play_game(server, seed) for seed in range(num_concurrent_games)])
+    await server.stop()
+    return scores
+
+
+if __name__ == '__main__':
+    policy = DQNPolicy.load(policy_file)
+
+    # In-process concurrent games
+    server = PolicyServer(policy_evaluator(policy), max_batch_size, max_wait_s)
+    scores = asyncio.run(play_in_process(server))
+    print(f'In-process: {len(scores)} games, mean score {sum(scores) / len(scores):.2f}')
+    print(server.get_metrics())
+
+    # Worker processes sharing server over Unix socket
+    server = PolicyServer(policy_evaluator(policy), max_batch_size, max_wait_s)
+    stop = server.serve_unix_in_thread(socket_path)
+    play_games(RemoteAgent(socket_path), test_num_games, seed=0, num_workers=num_workers)
+    stop()
+    print(server.get_metrics())
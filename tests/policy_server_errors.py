@@ -0,0 +1,74 @@
+"""
+policy_server_errors.py
+Test script for Square Stacker policy server requests whose batch evaluation raises
+"""
+
+import asyncio
+from agents.random import RandomAgent
+from square_stacker_game import SquareStackerGame
+from utils.policy_server import PolicyServer, RemoteAgent, agent_evaluator
+
+# Test Settings
+socket_path = 'policy_errors.sock'
+num_concurrent_games = 8
+seed = 0
+
+
+class FailingEvaluator:
+
+    def __init__(self, evaluate):
+        """
+        Batch evaluator which raises until enabled
+        :param evaluate: Working batch evaluator
+        """
+        self._evaluate = evaluate
+        self.enabled = False
+
+    def __call__(self, states, masks):
+        if not self.enabled:
+            raise ValueError('Evaluator failed')
+        return self._evaluate(states, masks)
+
+
+async def request_moves(server, evaluator):
+    """
+    Requests moves of concurrent games while evaluator fails, then after enabling it
+    :param server: PolicyServer
+    :param evaluator: FailingEvaluator of server
+    :return results: Error or move of each request before enabling
+    :return moves: Moves after enabling
+    """
+    await server.start()
+    games = [SquareStackerGame(seed + n) for n in range(num_concurrent_games)]
+    results = await asyncio.gather(*[server.select_move(game) for game in games], return_exceptions=True)
+    evaluator.enabled = True
+    moves = await asyncio.gather(*[server.select_move(game) for game in games])
+    await server.stop()
+    return results, moves
+
+
+if __name__ == '__main__':
+
+    # In-process requests get the evaluator's exception, and the server keeps serving
+    evaluator = FailingEvaluator(agent_evaluator(RandomAgent()))
+    server = PolicyServer(evaluator)
+    results, moves = asyncio.run(asyncio.wait_for(request_moves(server, evaluator), 10.0))
+    print(f'In-process errors: {sum(isinstance(result, ValueError) for result in results)}/{len(results)}, '
+          f'moves after recovery: {sum(move is not None for move in moves)}/{len(moves)}')
+
+    # Socket clients get RuntimeError instead of hanging
+    evaluator = FailingEvaluator(agent_evaluator(RandomAgent()))
+    server = PolicyServer(evaluator)
+    stop = server.serve_unix_in_thread(socket_path)
+    agent = RemoteAgent(socket_path)
+    game = SquareStackerGame(seed)
+    try:
+        agent.select_move(game)
+        print('Socket error: none')
+    except RuntimeError as error:
+        print(f'Socket error: {error}')
+    evaluator.enabled = True
+    print(f'Socket move after recovery: {agent.select_move(game)}')
+    agent.close()
+    stop()
+    print(server.get_metrics())
@@ -0,0 +1,46 @@
+"""
+render.py
+Test script for non-blocking mosaic rendering of Square Stacker games
+Plays random games in lockstep with and without rendering every move to a window, video and PNG frames.
+"""
+
+import random
+from time import perf_counter
+from square_stacker_game import SquareStackerGame
+from square_stacker_render import GameRenderer
+
+# Test Settings
+num_games = 16
+num_steps = 500
+video_name = 'render_test.mp4'
+png_dir = 'render_test_frames'
+
+
+def play_steps(renderer=None):
+    """
+    Plays random moves in num_games games (restarting finished games)
+    :param renderer: GameRenderer receiving a mosaic of all games per step (or None)
+    :return: Moves per second
+    """
+    games = [SquareStackerGame() for _ in range(num_games)]
+    game_nums = list(range(num_games))
+    time_start = perf_counter()
+    for _ in range(num_steps):
+        for n, game in enumerate(games):
+            moves = game.get_valid_moves()
+            if len(moves) == 0:
+                games[n] = SquareStackerGame()
+                game_nums[n] += num_games
+            else:
+                game.make_move(random.choice(moves))
+        if renderer is not None:
+            renderer.submit(games, game_nums)
+    return num_games * num_steps / (perf_counter() - time_start)
+
+
+if __name__ == '__main__':
+    print(f'No rendering: {play_steps():.0f} moves/s')
+    renderer = GameRenderer(window=True, video_name=video_name, png_dir=png_dir)
+    print(f'Rendering: {play_steps(renderer):.0f} moves/s')
+    renderer.close()
+    print(f'Frames: {renderer.get_num_submitted()}, Dropped: {renderer.get_num_dropped()}')
@@ -0,0 +1,15 @@
+"""
+beam.py
+Test script for Square Stacker Beam Search Agent
+"""
+
+from agents.search.beam import BeamSearchAgent
+from tests.agent import test_agent
+
+# Test Settings
+beam_width = 8
+test_num_games = 100
+
+# Test Agent
+agent = BeamSearchAgent(beam_width)
+test_agent(agent, num_games=test_num_games)
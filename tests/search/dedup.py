@@ -0,0 +1,30 @@
+"""
+dedup.py
+Test script comparing Square Stacker search agents with and without equivalent-move deduplication
+"""
+
+import numpy as np
+from agents.search.dlrgs import DepthLimitedRandomSearchAgent
+from agents.search.exhaustive import ExhaustiveSearchAgent
+from agents.search.random_ import RandomSearchAgent
+from tests.agent import play_games
+
+# Test Settings
+test_num_games = 5
+seed = 0
+modes = {'Off': (False, False), 'Afterstate': (True, False), 'Symmetric': (True, True)}
+
+# Test Agents
+if __name__ == '__main__':
+    for name, make_agent in [
+        ('RandomSearch', lambda dedup, symmetric: RandomSearchAgent(5, dedup=dedup, symmetric=symmetric)),
+        ('DLRGS', lambda dedup, symmetric: DepthLimitedRandomSearchAgent(2, 15, dedup=dedup, symmetric=symmetric)),
+        ('Exhaustive', lambda dedup, symmetric: ExhaustiveSearchAgent(2, dedup=dedup, symmetric=symmetric)),
+    ]:
+        for mode, (dedup, symmetric) in modes.items():
+            agent = make_agent(dedup, symmetric)
+            scores, moves_searched, decision_times = play_games(agent, test_num_games, seed)
+            print(f'{name} ({mode}): Mean score: {np.mean(scores):.1f}, '
+                  f'Moves searched per move: {np.mean(moves_searched):.1f}, '
+                  f'Decision time: {np.mean(decision_times) * 1e3:.2f} ms, '
+                  f'Deduplicated: {agent.get_num_deduplicated()}')
@@ -10,7 +10,10 @@ from tests.agent import test_agent
 search_depth = 2
 games_per_move = 15
 test_num_games = 1000
+num_workers = 4
+seed = 0
 
 # Test Agent
-agent = DepthLimitedRandomSearchAgent(search_depth, games_per_move)
-test_agent(agent, num_games=test_num_games)
+if __name__ == '__main__':
+    agent = DepthLimitedRandomSearchAgent(search_depth, games_per_move)
+    test_agent(agent, num_games=test_num_games, num_workers=num_workers, seed=seed)
@@ -0,0 +1,59 @@
+"""
+shared_table.py
+Test script for Square Stacker search agents of different kinds sharing one transposition table
+"""
+
+import random
+from agents.search.dlrgs import DepthLimitedRandomSearchAgent
+from agents.search.exhaustive import ExhaustiveSearchAgent
+from square_stacker_game import SquareStackerGame
+from utils.transposition_table import KIND_MAX, KIND_ROLLOUT, TranspositionTable, depth_tag, hash_state
+
+# Test Settings
+search_depth = 2
+games_per_move = 4
+num_positions = 20
+seed = 0
+
+def count_hits(game, tag):
+    """
+    Counts next states of game with table entry under depth tag
+    :param game: Current game [SquareStackerGame]
+    :param tag: Depth tag
+    :return: Number of hits
+    """
+    hits = 0
+    for next_move in game.get_valid_moves():
+        game_next = game.deepcopy()
+        game_next.make_move(next_move)
+        hits += table.lookup(hash_state(game_next), tag) is not None
+    return hits
+
+
+# Each agent only reads entries of its own kind (DLRGS(d) rollout means are not Exhaustive(d + 1) maxima)
+if __name__ == '__main__':
+    random.seed(seed)
+    table = TranspositionTable(2 ** 16)
+    dlrgs = DepthLimitedRandomSearchAgent(search_depth - 1, games_per_move, table)
+    exhaustive = ExhaustiveSearchAgent(search_depth, table)
+    rollout_tag = depth_tag(KIND_ROLLOUT, search_depth - 1)
+    max_tag = depth_tag(KIND_MAX, search_depth - 1)
+    hits = {'DLRGS own': 0, 'Exhaustive on DLRGS': 0, 'Exhaustive own': 0, 'DLRGS on Exhaustive': 0}
+    game = SquareStackerGame(seed)
+    for position in range(num_positions):
+
+        # DLRGS entries of next states are invisible to Exhaustive, and the other way around
+        move = dlrgs.select_move(game)[0]
+        if move is None:
+            break
+        hits['DLRGS own'] += count_hits(game, rollout_tag)
+        hits['Exhaustive on DLRGS'] += count_hits(game, max_tag)
+        exhaustive.select_move(game)
+        hits['Exhaustive own'] += count_hits(game, max_tag)
+        hits['DLRGS on Exhaustive'] += count_hits(game, rollout_tag)
+        table.clear()
+        game.make_move(move)
+
+    print(f'Table hits: {hits}')
+    print(f'Kinds kept apart: {hits["Exhaustive on DLRGS"] == 0 and hits["DLRGS on Exhaustive"] == 0}')
+    table.close()
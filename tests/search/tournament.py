@@ -0,0 +1,27 @@
+"""
+tournament.py
+Test script for paired tournament of Square Stacker search agents
+"""
+
+from agents.random import RandomAgent
+from agents.search.random_ import RandomSearchAgent
+from agents.search.dlrgs import DepthLimitedRandomSearchAgent
+from agents.search.exhaustive import ExhaustiveSearchAgent
+from agents.search.beam import BeamSearchAgent
+from tests.tournament import run_tournament
+
+# Test Settings
+test_num_games = 100
+num_workers = 4
+seed = 0
+
+# Test Agents
+if __name__ == '__main__':
+    agents = {
+        'Random': RandomAgent(),
+        'RandomSearch': RandomSearchAgent(10),
+        'DLRGS': DepthLimitedRandomSearchAgent(2, 15),
+        'Exhaustive': ExhaustiveSearchAgent(2),
+        'Beam': BeamSearchAgent(8),
+    }
+    run_tournament(agents, num_games=test_num_games, seed=seed, num_workers=num_workers)
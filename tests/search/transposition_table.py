@@ -0,0 +1,23 @@
+"""
+transposition_table.py
+Test script for Square Stacker search agents sharing a transposition table across workers
+"""
+
+from agents.search.exhaustive import ExhaustiveSearchAgent
+from tests.agent import test_agent
+from utils.transposition_table import TranspositionTable
+
+# Test Settings
+search_depth = 3
+table_entries = 2 ** 22
+test_num_games = 20
+num_workers = 4
+seed = 0
+
+# Test Agent (workers share table entries)
+if __name__ == '__main__':
+    table = TranspositionTable(table_entries)
+    agent = ExhaustiveSearchAgent(search_depth, table)
+    test_agent(agent, num_games=test_num_games, num_workers=num_workers, seed=seed)
+    print(table.get_stats())
+    table.close()
@@ -0,0 +1,29 @@
+"""
+square_stacker_env.py
+Throughput test of vectorized Square Stacker environment (random valid moves)
+"""
+
+from time import perf_counter
+import numpy as np
+from square_stacker_env import SquareStackerVecEnv
+
+# Test Settings
+num_envs = 256
+num_steps = 1000
+encoding = 'float32'
+worker_counts = [0, 2, 4]
+seed = 0
+
+if __name__ == '__main__':
+    for num_workers in worker_counts:
+        env = SquareStackerVecEnv(num_envs, encoding, seed, num_workers)
+        observations, masks = env.reset()
+        num_games = 0
+        time_start = perf_counter()
+        for _ in range(num_steps):
+            actions = np.argmax(np.where(masks, np.random.random(masks.shape), -1.0), axis=1)
+            observations, rewards, dones, masks = env.step(actions)
+            num_games += np.sum(dones)
+        duration = perf_counter() - time_start
+        env.close()
+        print(f'Workers: {num_workers}, Steps/s: {num_envs * num_steps / duration:.0f}, Games: {num_games}')
@@ -0,0 +1,81 @@
+"""
+tournament.py
+Paired head-to-head tournament for Square Stacker AI agents
+
+Every agent plays the same seeded games (identical piece streams), so agent
+scores on each game are paired. Piece luck shared between agents cancels in the
+paired score differences, which lowers the games needed per comparison by the
+reported variance reduction factor (unpaired over paired difference variance).
+"""
+
+from itertools import combinations
+
+import numpy as np
+from tests.agent import play_games
+from utils.running_stats import PairedStats, normal_quantile
+
+
+def run_tournament(agents, num_games=1000, seed=0, num_workers=1, confidence=0.95):
+    """
+    Plays all agents on the same seeded games and compares them pairwise
+    :param agents: Dict of agent name to Square Stacker AI agent
+    :param num_games: Number of games per agent
+    :param seed: Tournament seed (shared by all agents)
+    :param num_workers: Number of worker processes (agents must be picklable if > 1)
+    :param confidence: Confidence level of score difference intervals
+    :return: Dict of results with 'agents' (per-agent stats) and 'pairs' (pairwise stats)
+    """
+
+    # Initial printout
+    print('Square Stacker Agent Tournament')
+    print(f'Playing {num_games} games per agent...\n')
+
+    # Play same games with each agent
+    scores = {}
+    results = {'agents': {}, 'pairs': []}
+    for name, agent in agents.items():
+        print(f'Agent: {name}')
+        scores_list, _, decision_times_list = play_games(agent, num_games, seed, num_workers)
+        scores[name] = np.array(scores_list, dtype=float)
+        decision_times = np.array(decision_times_list)
+        results['agents'][name] = {
+            'mean_score': float(np.mean(scores[name])),
+            'std_score': float(np.std(scores[name], ddof=1)),
+            'decisions': len(decision_times),
+            'mean_latency_s': float(np.mean(decision_times)),
+            'p50_latency_s': float(np.percentile(decision_times, 50)),
+            'p99_latency_s': float(np.percentile(decision_times, 99)),
+        }
+
+    # Paired score differences
+    z = normal_quantile(0.5 + confidence / 2.0)
+    for name_a, name_b in combinations(agents, 2):
+        stats = PairedStats()
+        for score_a, score_b in zip(scores[name_a], scores[name_b]):
+            stats.update(score_a, score_b)
+        low, high = stats.get_ci(confidence)
+        results['pairs'].append({
+            'a': name_a,
+            'b': name_b,
+            'mean_diff': stats.get_diff().get_mean(),
+            'ci_low': low,
+            'ci_high': high,
+            'z': stats.get_z(),
+            'variance_reduction': stats.get_variance_reduction(),
+        })
+
+    # Results printout
+    print('\nComplete!\n')
+    print('Agent Stats:')
+    for name, stats in results['agents'].items():
+        print(f'{name}: Mean score: {stats["mean_score"]:.2f}, Std: {stats["std_score"]:.2f}, '
+              f'Latency mean: {stats["mean_latency_s"] * 1e3:.3f} ms, '
+              f'p99: {stats["p99_latency_s"] * 1e3:.3f} ms')
+    print(f'\nPaired Differences ({confidence * 100.0:.0f}% CI):')
+    for pair in results['pairs']:
+        significant = abs(pair['z']) > z
+        print(f'{pair["a"]} - {pair["b"]}: {pair["mean_diff"]:.2f} '
+              f'[{pair["ci_low"]:.2f}, {pair["ci_high"]:.2f}]{" *" if significant else ""}, '
+              f'Variance reduction: {pair["variance_reduction"]:.1f}x')
+
+    return results
@@ -0,0 +1,30 @@
+"""
+trajectories.py
+Test script for recording Square Stacker trajectories and fitting a DQN offline
+"""
+
+from agents.dqn import DQNAgent
+from agents.random import RandomAgent
+from tests.agent import test_agent
+from utils.trajectories import TrajectoryWriter, TrajectoryDataset, record_games
+
+# Test Settings
+trajectory_dir = 'trajectories'
+record_num_games = 10000
+num_updates = 1000
+batch_size = 1024
+discount = 0.0
+test_num_games = 1000
+
+# Record random agent games
+writer = TrajectoryWriter(trajectory_dir)
+record_games(writer, RandomAgent(), record_num_games)
+writer.close()
+
+# Fit DQN from memory-mapped dataset
+dataset = TrajectoryDataset(trajectory_dir)
+print(f'Dataset moves: {len(dataset)}')
+agent = DQNAgent()
+for update in range(num_updates):
+    agent.fit_replay(batch_size, discount, batch_size, batch_size, replay=dataset)
+test_agent(agent, num_games=test_num_games)
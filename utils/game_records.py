@@ -0,0 +1,209 @@
+"""
+Game Records
+Compact binary per-game records and a replay engine
+
+A record file starts with the magic bytes b'SSGR' and a format version byte,
+followed by one record per game:
+    header = seed [uint64, 2 ** 64 - 1 if unseeded], final score [uint32],
+             number of dealt pieces [uint32], number of moves [uint32]
+    deals = Dealt pieces as 1-byte codes 3 * color + layer
+    moves = Moves as 1-byte indices (move_to_index)
+A game takes 2 bytes per move plus the 20-byte header. Records are buffered and written
+in batches, so recording costs one bytearray append per move in the play loop.
+Replaying a record with a scripted deal source re-executes the game exactly,
+to regenerate its state vectors. Scores are checked without game objects by
+stepping all records in lockstep with batch_afterstates.
+"""
+
+import multiprocessing as mp
+import struct
+from collections import namedtuple
+
+import numpy as np
+from square_stacker_game import SquareStackerGame, batch_afterstates, index_to_move
+
+_magic = b'SSGR\x01'
+_header = struct.Struct('<QIII')
+_no_seed = 2 ** 64 - 1
+
+GameRecord = namedtuple('GameRecord', ['seed', 'score', 'deals', 'moves'])
+
+
+class GameRecordWriter:
+
+    def __init__(self, file_name, append=False, buffer_size=1 << 20):
+        """
+        Opens game record file for writing
+        :param file_name: Path of record file
+        :param append: Append to existing file (else overwrite)
+        :param buffer_size: Bytes buffered before each write
+        """
+        self._file = open(file_name, 'ab' if append else 'wb')
+        if self._file.tell() == 0:
+            self._file.write(_magic)
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+        self._num_records = 0
+
+    def add(self, seed, score, deals, moves):
+        """
+        Adds game record
+        :param seed: Game seed (or None)
+        :param score: Final game score
+        :param deals: Dealt pieces [bytes] (SquareStackerGame.get_deals)
+        :param moves: Move indices [bytes or bytearray]
+        :return: None
+        """
+        self._buffer += _header.pack(_no_seed if seed is None else seed, score, len(deals), len(moves))
+        self._buffer += deals
+        self._buffer += moves
+        self._num_records += 1
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def add_game(self, game, moves, seed=None):
+        """
+        Adds record of finished game
+        :param game: Finished SquareStackerGame
+        :param moves: Move indices [bytes or bytearray]
+        :param seed: Game seed (or None)
+        :return: None
+        """
+        self.add(seed, game.get_score(), game.get_deals(), moves)
+
+    def get_num_records(self):
+        """
+        :return: Number of records added
+        """
+        return self._num_records
+
+    def flush(self):
+        """
+        Writes buffered records
+        :return: None
+        """
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._buffer = bytearray()
+
+    def close(self):
+        """
+        Writes buffered records and closes file
+        :return: None
+        """
+        self.flush()
+        self._file.close()
+
+
+def read_records(file_name):
+    """
+    Reads game records
+    :param file_name: Path of record file
+    :return: Generator of GameRecord
+    """
+    with open(file_name, 'rb') as file:
+        data = file.read()
+    if data[:len(_magic)] != _magic:
+        raise ValueError(f'{file_name} is not a game record file')
+    offset = len(_magic)
+    while offset < len(data):
+        seed, score, num_deals, num_moves = _header.unpack_from(data, offset)
+        offset += _header.size
+        deals = data[offset:offset + num_deals]
+        moves = data[offset + num_deals:offset + num_deals + num_moves]
+        offset += num_deals + num_moves
+        yield GameRecord(None if seed == _no_seed else seed, score, deals, moves)
+
+
+def replay_game(record, encoding=None):
+    """
+    Re-executes recorded game
+    :param record: GameRecord
+    :param encoding: State vector encoding to regenerate (or None)
+    :return game: Finished SquareStackerGame
+    :return states: State vectors before each move [np.array] (None if encoding is None)
+    """
+    game = SquareStackerGame(deals=record.deals)
+    states = [] if encoding is not None else None
+    for index in record.moves:
+        if states is not None:
+            states.append(game.get_state_vector(encoding))
+        game.make_move(index_to_move(index))
+    return game, np.array(states) if states is not None else None
+
+
+def _deal(codes, slots, deals, num_dealt):
+    """
+    Deals next three recorded pieces to games
+    :param codes: Board and piece color codes of games [np.array N x 36]
+    :param slots: Indices of games to deal to [np.array]
+    :param deals: Dealt pieces of each game, zero padded [np.array N x max deals]
+    :param num_dealt: Number of pieces dealt to each game so far [np.array N]
+    :return: None
+    """
+    colors, layers = np.divmod(deals[slots[:, np.newaxis], num_dealt[slots, np.newaxis] + np.arange(3)], 3)
+    codes[slots, 27:] = 0
+    codes[slots[:, np.newaxis], 27 + 3 * np.arange(3) + layers] = colors + 1
+    num_dealt[slots] += 3
+
+
+def _replay_scores(records):
+    """
+    Replays records in lockstep, simulating the next recorded move of all running games in one batch
+    :param records: List of GameRecord
+    :return: Replayed final scores [np.array]
+    """
+    num_records = len(records)
+    num_moves = np.array([len(record.moves) for record in records], dtype=np.int64)
+    moves = np.zeros((num_records, max(num_moves, default=0)), dtype=np.int64)
+    deals = np.zeros((num_records, max((len(record.deals) for record in records), default=0) + 3), dtype=np.int64)
+    for r, record in enumerate(records):
+        moves[r, :len(record.moves)] = np.frombuffer(record.moves, dtype=np.uint8)
+        deals[r, :len(record.deals)] = np.frombuffer(record.deals, dtype=np.uint8)
+
+    # New games (codes are boards then pieces, as in 'color' state vectors)
+    codes = np.zeros((num_records, 36), dtype=np.int64)
+    combos = np.zeros(num_records, dtype=np.int64)
+    scores = np.zeros(num_records, dtype=np.int64)
+    num_dealt = np.zeros(num_records, dtype=np.int64)
+    _deal(codes, np.arange(num_records), deals, num_dealt)
+
+    for t in range(moves.shape[1]):
+        slots = np.flatnonzero(num_moves > t)
+
+        # Simulate moves of recorded piece only and keep recorded moves (invalid moves change nothing,
+        # as in make_move)
+        slot_moves = moves[slots, t]
+        slot_codes = codes[slots]
+        slot_codes[:, 27:][np.repeat(np.arange(3) != (slot_moves // 9)[:, np.newaxis], 3, axis=1)] = 0
+        states, move_indices, boards, _, points, next_combos = batch_afterstates(slot_codes, combos[slots])
+        played = np.flatnonzero(move_indices == slot_moves[states])
+        moving = slots[states[played]]
+        codes[moving, :27] = boards[played].reshape(-1, 27)
+        codes[moving[:, np.newaxis], 27 + 3 * (move_indices[played] // 9)[:, np.newaxis] + np.arange(3)] = 0
+        combos[moving] = next_combos[played]
+        scores[moving] += points[played]
+        _deal(codes, moving[~np.any(codes[moving, 27:], axis=1)], deals, num_dealt)
+    return scores
+
+
+def rescore_records(file_name, num_workers=1):
+    """
+    Replays all records of file and checks their scores
+    :param file_name: Path of record file
+    :param num_workers: Number of worker processes (each replays every num_workers-th record)
+    :return scores: Replayed final scores [np.array]
+    :return num_mismatches: Number of records whose replayed score differs from recorded score
+    """
+    records = list(read_records(file_name))
+    if num_workers > 1:
+        shares = [records[w::num_workers] for w in range(num_workers)]
+        with mp.Pool(num_workers) as pool:
+            share_scores = pool.map(_replay_scores, shares)
+        scores = np.zeros(len(records), dtype=np.int64)
+        for w, share in enumerate(share_scores):
+            scores[w::num_workers] = share
+    else:
+        scores = _replay_scores(records)
+    num_mismatches = int(np.sum(scores != np.array([record.score for record in records])))
+    return scores, num_mismatches
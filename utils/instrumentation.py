@@ -0,0 +1,234 @@
+"""
+Instrumentation
+Optional hot-path counters and decision latency histograms for agents and the game engine
+
+Instrumentation.install() wraps SquareStackerGame methods with call counters and
+the vectorized afterstate simulator with a counter of states simulated, and
+Instrumentation.attach(agent) wraps the agent's select_move to emit one record
+per decision to a pluggable sink (any callable taking a dict). Nothing is
+wrapped until install/attach is called, and uninstall/detach restore the
+original methods, so disabled instrumentation costs nothing.
+
+Attached agents stay picklable (select_move is replaced by an
+InstrumentedSelectMove object, not a closure), so they can be played by worker
+processes. Each worker then records into its own copy of the instrumentation
+and sink, and engine calls are only counted where install is in effect (e.g.
+inherited by forked workers).
+"""
+
+import json
+from functools import wraps
+from time import perf_counter
+
+import square_stacker_game
+from square_stacker_game import SquareStackerGame
+from utils.running_stats import RunningStats, QuantileSketch
+
+# Counted engine methods (counter name, method name)
+_counted_methods = [
+    ('clones', 'deepcopy'),
+    ('make_moves', 'make_move'),
+    ('valid_move_gens', 'get_valid_moves'),
+    ('state_encodings', 'get_state_vector'),
+]
+
+# Counted afterstate function (counter name, square_stacker_game function name), counting states simulated
+# (afterstates() looks batch_afterstates up in its module, so single-state calls are counted as well)
+_afterstate_counter = ('afterstate_evals', 'batch_afterstates')
+
+
+class ListSink:
+
+    def __init__(self):
+        """
+        Sink which keeps records in a list
+        """
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+
+class PrintSink:
+
+    def __call__(self, record):
+        print(record)
+
+
+class JSONLSink:
+
+    def __init__(self, file_name):
+        """
+        Sink which writes records as JSON lines
+        :param file_name: Name of JSON-lines file
+        """
+        self._file = open(file_name, 'w')
+
+    def __call__(self, record):
+        self._file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+class InstrumentedSelectMove:
+
+    def __init__(self, select_move, instrumentation, name):
+        """
+        Picklable select_move wrapper which records counters and latency per decision
+        :param select_move: Original agent select_move
+        :param instrumentation: Instrumentation receiving records
+        :param name: Agent name in records
+        """
+        self._select_move = select_move
+        self._instrumentation = instrumentation
+        self._name = name
+
+    def __call__(self, game):
+        counters = self._instrumentation._counters
+        counts_start = dict(counters)
+        time_start = perf_counter()
+        result = self._select_move(game)
+        latency_s = perf_counter() - time_start
+        self._instrumentation._record(self._name, latency_s, counters, counts_start)
+        return result
+
+
+class Instrumentation:
+
+    def __init__(self, sink=None):
+        """
+        Constructs instrumentation (disabled until installed or attached)
+        :param sink: Callable receiving one dict per decision (or None)
+        """
+        self._sink = sink
+        self._counters = {name: 0 for name, _ in _counted_methods + [_afterstate_counter]}
+        self._originals = {}
+        self._latency = {}
+        self._stats = {}
+
+    def install(self):
+        """
+        Wraps SquareStackerGame methods and batch_afterstates with counters
+        :return: self
+        """
+        if self._originals:
+            return self
+        counters = self._counters
+        for counter, method_name in _counted_methods:
+            original = getattr(SquareStackerGame, method_name)
+            self._originals[method_name] = original
+
+            def make_wrapper(original_, counter_):
+                @wraps(original_)
+                def wrapper(*args, **kwargs):
+                    counters[counter_] += 1
+                    return original_(*args, **kwargs)
+                return wrapper
+
+            setattr(SquareStackerGame, method_name, make_wrapper(original, counter))
+
+        # Count states (rows of codes) simulated by batch_afterstates
+        counter, function_name = _afterstate_counter
+        original = getattr(square_stacker_game, function_name)
+        self._originals[function_name] = original
+
+        @wraps(original)
+        def afterstates_wrapper(codes, combos):
+            counters[counter] += len(codes)
+            return original(codes, combos)
+
+        setattr(square_stacker_game, function_name, afterstates_wrapper)
+        return self
+
+    def uninstall(self):
+        """
+        Restores original SquareStackerGame methods and batch_afterstates
+        :return: None
+        """
+        _, function_name = _afterstate_counter
+        for method_name, original in self._originals.items():
+            setattr(square_stacker_game if method_name == function_name else SquareStackerGame, method_name, original)
+        self._originals = {}
+
+    def __getstate__(self):
+        # Copies (e.g. in worker processes) are not installed
+        state = dict(self.__dict__)
+        state['_originals'] = {}
+        return state
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+
+    def attach(self, agent, name=None):
+        """
+        Wraps agent select_move to record counters and latency per decision
+        :param agent: Square Stacker AI agent
+        :param name: Agent name in records (default class name)
+        :return: agent
+        """
+        name = name if name is not None else type(agent).__name__
+        self._latency.setdefault(name, QuantileSketch())
+        self._stats.setdefault(name, {counter: RunningStats() for counter in self._counters})
+        agent.select_move = InstrumentedSelectMove(agent.select_move, self, name)
+        return agent
+
+    def _record(self, name, latency_s, counters, counts_start):
+        """
+        Records one decision and sends it to sink
+        :param name: Agent name
+        :param latency_s: Decision latency [s]
+        :param counters: Engine call counters after decision
+        :param counts_start: Engine call counters before decision
+        :return: None
+        """
+        record = {'agent': name, 'latency_s': latency_s}
+        stats = self._stats[name]
+        for counter, count in counters.items():
+            record[counter] = count - counts_start[counter]
+            stats[counter].update(record[counter])
+        self._latency[name].update(latency_s)
+        if self._sink is not None:
+            self._sink(record)
+
+    @staticmethod
+    def detach(agent):
+        """
+        Restores agent select_move
+        :param agent: Attached agent
+        :return: agent
+        """
+        if 'select_move' in vars(agent):
+            del agent.select_move
+        return agent
+
+    def get_counters(self):
+        """
+        :return: Dict of total engine call counts since construction
+        """
+        return dict(self._counters)
+
+    def get_latency(self, name):
+        """
+        :param name: Agent name
+        :return: QuantileSketch of select_move latencies [s]
+        """
+        return self._latency[name]
+
+    def summary(self):
+        """
+        Prints per-agent latency quantiles and mean engine calls per decision
+        :return: None
+        """
+        for name, latency in self._latency.items():
+            if latency.get_count() == 0:
+                continue
+            print(f'{name} ({latency.get_count()} decisions):')
+            print(f'Latency p50: {latency.quantile(0.5) * 1e3:.3f} ms, '
+                  f'p90: {latency.quantile(0.9) * 1e3:.3f} ms, '
+                  f'p99: {latency.quantile(0.99) * 1e3:.3f} ms')
+            calls = ', '.join(f'{counter}: {stats.get_mean():.1f}' for counter, stats in self._stats[name].items())
+            print(f'Mean calls per decision: {calls}')
@@ -0,0 +1,179 @@
+"""
+Metrics Sink
+Non-blocking sink for training metrics with background CSV/JSONL writing and live plotting
+
+Records are put on a queue by the training loop and drained by a background
+writer thread. Summary records can optionally drive a live matplotlib plot in a
+separate process, so the training thread never waits on file or GUI work.
+A sink with no outputs (headless) drops records without queueing them.
+"""
+
+import csv
+import json
+import multiprocessing as mp
+from queue import Queue, Empty
+from threading import Thread
+
+
+def _run_plotter(plot_queue, title):
+    """
+    Plot process main loop: redraws score plot for each summary record
+    :param plot_queue: Queue of summary records (None to stop)
+    :param title: Plot title
+    :return: None
+    """
+    import matplotlib.pyplot as plt
+
+    # Score plotting
+    plot_game_count = []
+    plot_mean_score = []
+    plot_min_score = []
+    plot_max_score = []
+    fig = plt.figure()
+    axes = fig.add_subplot(1, 1, 1)
+
+    while True:
+
+        # Get summary (keep GUI responsive while waiting)
+        try:
+            record = plot_queue.get(timeout=0.1)
+        except Empty:
+            plt.pause(0.1)
+            continue
+        if record is None:
+            break
+
+        # Update score lists
+        plot_mean_score.append(record['mean'])
+        plot_min_score.append(record['min'])
+        plot_max_score.append(record['max'])
+        plot_game_count.append(record['game'])
+
+        # Update progress plot
+        axes.clear()
+        axes.set_title(title)
+        axes.set_xlabel('Game')
+        axes.set_ylabel('Score')
+        axes.plot(plot_game_count, plot_mean_score, label='Mean')
+        axes.plot(plot_game_count, plot_min_score, label='Min')
+        axes.plot(plot_game_count, plot_max_score, label='Max')
+        axes.legend()
+        axes.grid()
+        plt.draw()
+        plt.pause(1e-6)
+
+    # Keep final plot open until closed
+    plt.show()
+
+
+class MetricsSink:
+
+    def __init__(self, csv_name=None, jsonl_name=None, plot=False, append=False, title='Score Progress'):
+        """
+        Constructs and starts metrics sink
+        :param csv_name: Name of CSV file of 'game' record values (or None)
+        :param jsonl_name: Name of JSON-lines file of all records (or None)
+        :param plot: Live plot 'summary' records in separate process
+        :param append: Append to existing files instead of overwriting
+        :param title: Plot title
+        """
+        self._enabled = csv_name is not None or jsonl_name is not None or plot
+        self._queue = None
+        self._thread = None
+        self._plot_queue = None
+        self._plot_process = None
+        if not self._enabled:
+            return
+
+        # Output files
+        mode = 'a' if append else 'w'
+        self._csv_file = open(csv_name, mode, newline='') if csv_name is not None else None
+        self._csv_writer = csv.writer(self._csv_file, delimiter=',') if csv_name is not None else None
+        self._jsonl_file = open(jsonl_name, mode) if jsonl_name is not None else None
+
+        # Plot process
+        if plot:
+            ctx = mp.get_context('spawn')
+            self._plot_queue = ctx.Queue()
+            self._plot_process = ctx.Process(target=_run_plotter, args=(self._plot_queue, title))
+            self._plot_process.start()
+
+        # Writer thread
+        self._queue = Queue()
+        self._thread = Thread(target=self._run_writer, daemon=True)
+        self._thread.start()
+
+    def is_enabled(self):
+        """
+        :return: False if sink is headless (records are dropped)
+        """
+        return self._enabled
+
+    def publish(self, kind, record):
+        """
+        Publishes record without blocking
+        :param kind: Record kind ('game' records go to CSV, 'summary' records to plot)
+        :param record: Dict of metric values
+        :return: None
+        """
+        if self._enabled:
+            self._queue.put_nowait((kind, record))
+
+    def flush(self):
+        """
+        Blocks until all published records are written
+        :return: None
+        """
+        if self._enabled:
+            self._queue.join()
+
+    def close(self):
+        """
+        Writes remaining records, closes files and stops plot updates
+        :return: None
+        """
+        if not self._enabled:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        for file in (self._csv_file, self._jsonl_file):
+            if file is not None:
+                file.close()
+        if self._plot_queue is not None:
+            self._plot_queue.put(None)
+        self._enabled = False
+
+    def _run_writer(self):
+        """
+        Writer thread main loop
+        :return: None
+        """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._flush_files()
+                self._queue.task_done()
+                break
+
+            # Write record
+            kind, record = item
+            if kind == 'game' and self._csv_writer is not None:
+                self._csv_writer.writerow([str(value) for value in record.values()])
+            if self._jsonl_file is not None:
+                self._jsonl_file.write(json.dumps(dict(kind=kind, **record)) + '\n')
+            if kind == 'summary' and self._plot_queue is not None:
+                self._plot_queue.put(record)
+
+            # Flush once queue is drained
+            if self._queue.empty():
+                self._flush_files()
+            self._queue.task_done()
+
+    def _flush_files(self):
+        """
+        Flushes output files
+        :return: None
+        """
+        for file in (self._csv_file, self._jsonl_file):
+            if file is not None:
+                file.flush()
@@ -0,0 +1,54 @@
+"""
+Periodic Reporter
+Background thread which calls a report function on a timer, off the hot path
+"""
+
+from threading import Thread, Event
+
+
+class PeriodicReporter:
+
+    def __init__(self, interval, report):
+        """
+        Constructs reporter (started by start)
+        :param interval: Report interval [s]
+        :param report: Function called with no arguments every interval
+        """
+        self._interval = interval
+        self._report = report
+        self._stop_event = Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts report thread (no-op if already running)
+        :return: None
+        """
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stops report thread
+        :return: None
+        """
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self):
+        """
+        :return: True if report thread is running
+        """
+        return self._thread is not None
+
+    def _run(self):
+        """
+        Report thread main loop
+        :return: None
+        """
+        while not self._stop_event.wait(self._interval):
+            self._report()
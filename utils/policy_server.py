@@ -0,0 +1,335 @@
+"""
+Policy Server
+Asyncio move-selection service which micro-batches concurrent requests
+
+Requests carry packed 'bits' state vectors (40 bytes). The server queues
+them and evaluates each batch with one call of a batch evaluator, which is
+any callable mapping (states [N x 40 uint8], valid move masks [N x 27 bool])
+to move indices [N] (-1 where no moves are valid). A batch is evaluated once
+max_batch_size requests are queued or max_wait_s after its first request.
+
+Requests are made in-process (await server.select_move(game)) or over a
+Unix socket, where each request is 40 state bytes and each reply is one
+move index byte (255 = no valid move, 254 = evaluation error). RemoteAgent is a
+synchronous Agent client of the socket, so play_games workers can share one
+server. If the evaluator raises, the requests of that batch get the exception
+(RemoteAgent raises RuntimeError) and the server keeps serving.
+"""
+
+import asyncio
+import socket
+import threading
+from time import perf_counter
+
+import numpy as np
+from agents.agent import Agent
+from agents.search.agent import SearchAgent
+from square_stacker_game import SquareStackerGame, STATE_BITS_BYTES, index_to_move, move_to_index, \
+    unpack_state_bits
+from utils.running_stats import RunningStats, QuantileSketch
+
+# Reply bytes of states without valid moves and of failed evaluations
+_no_move = 255
+_error = 254
+
+
+def decode_states(states):
+    """
+    Decodes batch of packed 'bits' state vectors
+    :param states: Packed state vectors [np.array N x 40 uint8]
+    :return codes: Board and piece color codes [np.array N x 36]
+    :return scores: Game scores [np.array N]
+    :return combos: Combo counts [np.array N]
+    """
+    unpacked = unpack_state_bits(states)
+    codes = np.argmax(unpacked[:, :252].reshape(-1, 36, 7), axis=2)
+    return codes, unpacked[:, 252].astype(np.int64), unpacked[:, 253].astype(np.int64)
+
+
+def valid_move_masks(codes):
+    """
+    Computes valid move masks of batch of states
+    :param codes: Board and piece color codes [np.array N x 36]
+    :return: Valid move masks indexed by move_to_index [np.array N x 27]
+    """
+    boards = codes[:, :27].reshape(-1, 9, 3)
+    pieces = codes[:, 27:36].reshape(-1, 3, 3)
+    has_piece = np.any(pieces != 0, axis=2)
+    layers = np.argmax(pieces != 0, axis=2)
+    layer_empty = np.take_along_axis(boards, np.repeat(layers[:, np.newaxis, :], 9, axis=1), axis=2) == 0
+    return (has_piece[:, :, np.newaxis] & layer_empty.transpose(0, 2, 1)).reshape(-1, 27)
+
+
+def decode_game(codes, score=0, combo=0):
+    """
+    Builds game from color codes (pieces dealt after this are random)
+    :param codes: Board and piece color codes [np.array 36]
+    :param score: Game score
+    :param combo: Combo count
+    :return: SquareStackerGame
+    """
+    game = SquareStackerGame()
+    colors = ['_'] + SquareStackerGame._colors
+    game._board = [[[colors[codes[9 * i + 3 * j + n]] for n in range(3)] for j in range(3)] for i in range(3)]
+    game._piece = [[colors[codes[27 + 3 * k + n]] for n in range(3)] for k in range(3)]
+    game._is_piece_playable = [any(codes[27 + 3 * k:30 + 3 * k]) for k in range(3)]
+    game._score = int(score)
+    game._combo = int(combo)
+    return game
+
+
+def policy_evaluator(policy):
+    """
+    Makes batch evaluator from DQNPolicy (one forward pass per batch)
+    :param policy: DQNPolicy taking 'state' vectors
+    :return: Batch evaluator
+    """
+    def evaluate(states, masks):
+        return policy.select_move_indices(unpack_state_bits(states), masks)
+    return evaluate
+
+
+def agent_evaluator(agent):
+    """
+    Makes batch evaluator from any agent (one select_move per state)
+    :param agent: Square Stacker AI agent
+    :return: Batch evaluator
+    """
+    is_search_agent = issubclass(type(agent), SearchAgent)
+
+    def evaluate(states, masks):
+        codes, scores, combos = decode_states(states)
+        indices = np.full(len(states), -1)
+        for n in np.flatnonzero(np.any(masks, axis=1)):
+            game = decode_game(codes[n], scores[n], combos[n])
+            move = agent.select_move(game)
+            move = move[0] if is_search_agent else move
+            if move is not None:
+                indices[n] = move_to_index(move)
+        return indices
+    return evaluate
+
+
+class PolicyServer:
+
+    def __init__(self, evaluate, max_batch_size=64, max_wait_s=0.001):
+        """
+        Constructs server (started by start or serve_unix)
+        :param evaluate: Batch evaluator (states, masks) -> move indices
+        :param max_batch_size: Max requests per evaluation
+        :param max_wait_s: Max time a batch waits for more requests [s]
+        """
+        self._evaluate = evaluate
+        self._max_batch_size = max_batch_size
+        self._max_wait_s = max_wait_s
+        self._queue = None
+        self._batch_full = None
+        self._task = None
+        self._unix_server = None
+
+        # Metrics
+        self._latency = QuantileSketch()
+        self._batch_sizes = RunningStats()
+
+    async def start(self):
+        """
+        Starts batching loop in running event loop
+        :return: None
+        """
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._batch_full = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops socket server and batching loop
+        :return: None
+        """
+        if self._unix_server is not None:
+            self._unix_server.close()
+            await self._unix_server.wait_closed()
+            self._unix_server = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def select_move_index(self, state):
+        """
+        Requests move for packed state vector
+        :param state: Packed 'bits' state vector [np.array 40 uint8 or bytes]
+        :return: Move index (-1 if no moves are valid)
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((np.frombuffer(bytes(state), dtype=np.uint8), perf_counter(), future))
+        if self._queue.qsize() >= self._max_batch_size - 1:
+            self._batch_full.set()
+        return await future
+
+    async def select_move(self, game):
+        """
+        Requests move for game
+        :param game: Current game [SquareStackerGame]
+        :return: Move [k, i, j] or None if no moves exist
+        """
+        index = await self.select_move_index(game.get_state_vector('bits'))
+        return index_to_move(index) if index >= 0 else None
+
+    async def _run(self):
+        """
+        Batching loop: collects requests and evaluates them in executor thread
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+
+            # Wait for first request, then for full batch or timeout
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self._max_batch_size - 1:
+                self._batch_full.clear()
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self._max_wait_s)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < self._max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            # Evaluate batch (loop keeps queueing requests meanwhile), failing its requests on error
+            try:
+                states = np.stack([state for state, _, _ in batch])
+                masks = valid_move_masks(decode_states(states)[0])
+                indices = await loop.run_in_executor(None, self._evaluate, states, masks)
+            except Exception as error:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            # Reply to callers
+            time_done = perf_counter()
+            for (_, time_start, future), index in zip(batch, indices):
+                if not future.cancelled():
+                    future.set_result(int(index))
+                self._latency.update(time_done - time_start)
+            self._batch_sizes.update(len(batch))
+
+    async def serve_unix(self, path):
+        """
+        Starts server and accepts requests on Unix socket
+        :param path: Socket path
+        :return: None
+        """
+        await self.start()
+        self._unix_server = await asyncio.start_unix_server(self._handle_client, path)
+
+    async def _handle_client(self, reader, writer):
+        """
+        Serves requests of one socket connection in order
+        :param reader: asyncio.StreamReader
+        :param writer: asyncio.StreamWriter
+        :return: None
+        """
+        try:
+            while True:
+                state = await reader.readexactly(STATE_BITS_BYTES)
+                try:
+                    index = await self.select_move_index(state)
+                    reply = index if index >= 0 else _no_move
+                except Exception:
+                    reply = _error
+                writer.write(bytes([reply]))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    def serve_unix_in_thread(self, path):
+        """
+        Runs Unix socket server on event loop in background thread
+        :param path: Socket path
+        :return: Function which stops server and thread
+        """
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.serve_unix(path))
+            started.set()
+            loop.run_forever()
+            loop.run_until_complete(self.stop())
+            loop.close()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        started.wait()
+
+        def stop():
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+        return stop
+
+    def get_metrics(self):
+        """
+        :return: Dict of request count, latency quantiles [s] and batch size stats
+        """
+        return {
+            'requests': self._latency.get_count(),
+            'batches': self._batch_sizes.get_count(),
+            'p50_latency_s': self._latency.quantile(0.5),
+            'p99_latency_s': self._latency.quantile(0.99),
+            'mean_batch_size': self._batch_sizes.get_mean(),
+            'max_batch_size': self._batch_sizes.get_max(),
+        }
+
+
+class RemoteAgent(Agent):
+
+    def __init__(self, path):
+        """
+        Constructs agent which requests moves from PolicyServer Unix socket
+        :param path: Socket path
+        """
+        Agent.__init__(self)
+        self._path = path
+        self._socket = None
+
+    def __getstate__(self):
+        """
+        Pickles socket path only (each process connects separately)
+        """
+        return {'path': self._path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def select_move(self, game):
+        """
+        Requests move from server
+        :param game: Current game [SquareStackerGame]
+        :return: Move [k, i, j] or None if no moves exist
+        """
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(self._path)
+        self._socket.sendall(game.get_state_vector('bits').tobytes())
+        reply = self._socket.recv(1)
+        if len(reply) == 0:
+            raise ConnectionError('Policy server closed connection')
+        if reply[0] == _error:
+            raise RuntimeError('Policy server failed to evaluate move')
+        return index_to_move(reply[0]) if reply[0] != _no_move else None
+
+    def close(self):
+        """
+        Closes connection to server
+        :return: None
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
@@ -2,43 +2,104 @@
 Progress Tracker
 Class for tracking and printing progress of long calculations
 Written by Dan Oates (WPI Class of 2020
+
+Progress is set as a ratio (update) or counted in units of work out of a
+total (add), so counts reported by worker processes can be merged. Printing
+is done by a background timer thread between start and stop; update and add
+only store numbers. Time left is estimated from the rate over the last print
+interval (rolling) and over the whole run (cumulative).
 """
 
 from time import time
 
+from utils.periodic_reporter import PeriodicReporter
+
 
 class ProgressTracker:
 
-    def __init__(self, interval):
+    def __init__(self, interval, total=None):
         """
-        Constructs and starts new progress tracker
+        Constructs new progress tracker (printing starts with start)
         :param interval: Print interval [s]
+        :param total: Total units of work counted by add (or None)
         """
         self._interval = interval
-        self._time_init = 0.0
-        self._time_print = 0.0
-        self.start()
+        self._total = total
+        self._done = 0
+        self._progress = 0.0
+        self._time_init = time()
+        self._last_report = (self._time_init, 0.0)
+        self._reporter = PeriodicReporter(interval, self.report)
 
     def start(self):
         """
-        Resets progress tracking
+        Resets progress tracking and starts background printouts
         :return: None
         """
+        self._done = 0
+        self._progress = 0.0
         self._time_init = time()
-        self._time_print = self._time_init
+        self._last_report = (self._time_init, 0.0)
+        self._reporter.start()
+
+    def stop(self):
+        """
+        Stops background printouts
+        :return: None
+        """
+        self._reporter.stop()
 
     def update(self, progress):
         """
-        Updates tracker and periodically prints
+        Sets progress
         :param progress: Progress ratio [0,1]
-        :return: True if printout occurred
+        :return: None
+        """
+        self._progress = progress
+
+    def add(self, count=1):
+        """
+        Counts completed units of work (requires total)
+        :param count: Number of units completed
+        :return: None
+        """
+        self._done += count
+        self._progress = self._done / self._total
+
+    def merge(self, other):
+        """
+        Adds units of work completed by other tracker (same total)
+        :param other: ProgressTracker
+        :return: None
+        """
+        self.add(other.get_done())
+
+    def get_done(self):
+        """
+        :return: Completed units of work
+        """
+        return self._done
+
+    def get_progress(self):
+        """
+        :return: Progress ratio [0,1]
+        """
+        return self._progress
+
+    def report(self):
+        """
+        Prints progress and time left if progress changed since last report
+        :return: None
         """
         time_now = time()
-        do_update = time_now - self._time_print > self._interval
-        if do_update:
-            self._time_print = time_now
-            time_left = (1.0 - progress) * (time_now - self._time_init) / progress
-            print(f'Progress: {progress * 100.0:.3f}%, Time left: {time_left / 60.0:.1f} min')
-
-        # Return update flag
-        return do_update
+        progress = self._progress
+        time_last, progress_last = self._last_report
+        if progress <= progress_last or progress <= 0.0:
+            return
+        self._last_report = (time_now, progress)
+
+        # Cumulative and rolling time left estimates
+        time_left = (1.0 - progress) * (time_now - self._time_init) / progress
+        recent_left = (1.0 - progress) * (time_now - time_last) / (progress - progress_last)
+        print(f'Progress: {progress * 100.0:.3f}%, Time left: {time_left / 60.0:.1f} min '
+              f'({recent_left / 60.0:.1f} min at recent rate)')
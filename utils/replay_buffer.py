@@ -0,0 +1,331 @@
+"""
+Replay Buffer
+Fixed-capacity experience replay for RL agents backed by preallocated NumPy arrays
+
+Transitions are stored in a ring buffer (oldest overwritten first), so insertion
+is O(1) and memory stays flat over long runs. Minibatches are sampled either
+uniformly or by priority (proportional prioritization via a sum tree) and are
+gathered into preallocated batch arrays which are reused between samples.
+States may be stored in a compact encoding (e.g. packed 'bits' state vectors)
+and unpacked per sampled batch.
+"""
+
+import numpy as np
+
+
+class SumTree:
+
+    def __init__(self, capacity):
+        """
+        Constructs sum tree with all priorities zero
+        :param capacity: Number of leaves
+        """
+        self._num_leaves = 1
+        while self._num_leaves < capacity:
+            self._num_leaves *= 2
+        self._tree = np.zeros(2 * self._num_leaves)
+        self._depth = self._num_leaves.bit_length() - 1
+
+    def total(self):
+        """
+        :return: Sum of all priorities
+        """
+        return self._tree[1]
+
+    def max(self):
+        """
+        :return: Max leaf priority
+        """
+        return np.max(self._tree[self._num_leaves:])
+
+    def get(self, indices):
+        """
+        :param indices: Leaf indices [np.array]
+        :return: Priorities of leaves [np.array]
+        """
+        return self._tree[self._num_leaves + indices]
+
+    def update(self, indices, priorities):
+        """
+        Sets leaf priorities and updates parent sums
+        :param indices: Leaf indices [np.array]
+        :param priorities: New priorities [np.array]
+        :return: None
+        """
+        nodes = self._num_leaves + np.asarray(indices)
+        self._tree[nodes] = priorities
+        for _ in range(self._depth):
+            nodes = np.unique(nodes // 2)
+            self._tree[nodes] = self._tree[2 * nodes] + self._tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        Finds leaves by descending tree with prefix-sum values
+        :param values: Prefix sums in [0, total) [np.array]
+        :return: Leaf indices [np.array]
+        """
+        values = np.array(values, dtype=float)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self._depth):
+            left = self._tree[2 * nodes]
+            go_right = values >= left
+            values -= left * go_right
+            nodes = 2 * nodes + go_right
+        return nodes - self._num_leaves
+
+
+class ReplayBuffer:
+
+    def __init__(self, capacity, state_dim, prioritized=False, alpha=0.6, beta=0.4,
+                 state_dtype=np.float32, eps=1e-3, unpack=None):
+        """
+        Constructs empty replay buffer
+        :param capacity: Max number of transitions stored
+        :param state_dim: Length of state vectors
+        :param prioritized: Sample proportional to priority if True, else uniformly
+        :param alpha: Priority exponent [0,1] (prioritized only)
+        :param beta: Importance-sampling exponent [0,1] (prioritized only)
+        :param state_dtype: Storage dtype of state vectors
+        :param eps: Priority added to absolute TD errors
+        :param unpack: Function mapping batch of stored states to network inputs (or None)
+        """
+        self._capacity = capacity
+        self._state_dim = state_dim
+        self._prioritized = prioritized
+        self._alpha = alpha
+        self._beta = beta
+        self._eps = eps
+        self._unpack = unpack
+
+        # Transition storage
+        self._states = np.zeros((capacity, state_dim), dtype=state_dtype)
+        self._moves = np.zeros(capacity, dtype=np.int64)
+        self._rewards = np.zeros(capacity, dtype=np.float32)
+        self._next_states = np.zeros((capacity, state_dim), dtype=state_dtype)
+        self._dones = np.zeros(capacity, dtype=bool)
+
+        # Ring buffer pointers
+        self._next = 0
+        self._size = 0
+
+        # Priorities
+        self._tree = SumTree(capacity) if prioritized else None
+        self._max_priority = 1.0
+
+        # Reusable batch arrays
+        self._batch = None
+
+    def __len__(self):
+        """
+        :return: Number of transitions stored
+        """
+        return self._size
+
+    def get_capacity(self):
+        """
+        :return: Max number of transitions stored
+        """
+        return self._capacity
+
+    def is_prioritized(self):
+        """
+        :return: True if sampling is prioritized
+        """
+        return self._prioritized
+
+    def copy_to(self, other):
+        """
+        Adds stored transitions to other buffer, oldest first (newest kept if other is smaller)
+        Copied transitions get the other buffer's max priority.
+        :param other: ReplayBuffer with same state encoding
+        :return: None
+        """
+        order = (self._next - self._size + np.arange(self._size)) % self._capacity
+        order = order[max(0, self._size - other.get_capacity()):]
+        other.add_batch(self._states[order], self._moves[order], self._rewards[order], self._next_states[order],
+                        self._dones[order])
+
+    def get_state_dtype(self):
+        """
+        :return: Storage dtype of state vectors
+        """
+        return self._states.dtype
+
+    def add(self, state, move_index, reward, next_state, done):
+        """
+        Inserts transition (overwrites oldest if full)
+        :param state: State vector [np.array]
+        :param move_index: Index of move made [0..26]
+        :param reward: Points for move
+        :param next_state: State vector after move [np.array]
+        :param done: True if game ended after move
+        :return: Index of stored transition
+        """
+        n = self._next
+        self._states[n] = state
+        self._moves[n] = move_index
+        self._rewards[n] = reward
+        self._next_states[n] = next_state
+        self._dones[n] = done
+        if self._prioritized:
+            self._tree.update([n], [self._max_priority ** self._alpha])
+        self._next = (n + 1) % self._capacity
+        self._size = min(self._size + 1, self._capacity)
+        return n
+
+    def add_batch(self, states, move_indices, rewards, next_states, dones):
+        """
+        Inserts batch of transitions (overwrites oldest if full)
+        :param states: State vectors [np.array N x state_dim]
+        :param move_indices: Indices of moves made [np.array N]
+        :param rewards: Points for moves [np.array N]
+        :param next_states: State vectors after moves [np.array N x state_dim]
+        :param dones: Game-over flags [np.array N]
+        :return: Indices of stored transitions [np.array]
+        """
+        indices = (self._next + np.arange(len(move_indices))) % self._capacity
+        self._states[indices] = states
+        self._moves[indices] = move_indices
+        self._rewards[indices] = rewards
+        self._next_states[indices] = next_states
+        self._dones[indices] = dones
+        if self._prioritized:
+            self._tree.update(indices, np.full(len(indices), self._max_priority ** self._alpha))
+        self._next = (self._next + len(move_indices)) % self._capacity
+        self._size = min(self._size + len(move_indices), self._capacity)
+        return indices
+
+    def sample(self, batch_size):
+        """
+        Samples minibatch of transitions
+        Returned arrays are reused by the next call to sample with the same batch size.
+        :param batch_size: Number of transitions to sample
+        :return: Tuple (states, move_indices, rewards, next_states, dones, weights, indices)
+        """
+
+        # Select indices
+        if self._prioritized:
+            total = self._tree.total()
+            segment = total / batch_size
+            values = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+            indices = np.minimum(self._tree.find(values), self._size - 1)
+        else:
+            indices = np.random.randint(0, self._size, batch_size)
+
+        # Gather into preallocated batch arrays
+        batch = self._get_batch(batch_size)
+        states, moves, rewards, next_states, dones, weights = batch
+        np.take(self._states, indices, axis=0, out=states)
+        np.take(self._moves, indices, out=moves)
+        np.take(self._rewards, indices, out=rewards)
+        np.take(self._next_states, indices, axis=0, out=next_states)
+        np.take(self._dones, indices, out=dones)
+
+        # Unpack compact states
+        if self._unpack is not None:
+            states = self._unpack(states)
+            next_states = self._unpack(next_states)
+
+        # Importance-sampling weights
+        if self._prioritized:
+            probs = self._tree.get(indices) / total
+            np.power(self._size * probs, -self._beta, out=weights)
+            weights /= np.max(weights)
+        else:
+            weights.fill(1.0)
+
+        return states, moves, rewards, next_states, dones, weights, indices
+
+    def update_priorities(self, indices, td_errors):
+        """
+        Updates priorities of sampled transitions (no-op if uniform)
+        :param indices: Indices returned by sample
+        :param td_errors: TD errors of transitions [np.array]
+        :return: None
+        """
+        if self._prioritized:
+            priorities = np.abs(td_errors) + self._eps
+            self._max_priority = max(self._max_priority, float(np.max(priorities)))
+            self._tree.update(indices, priorities ** self._alpha)
+
+    def to_arrays(self):
+        """
+        Snapshots stored transitions and sampling state
+        :return: Dict of arrays (see ReplayBuffer.from_arrays)
+        """
+        size = self._size
+        arrays = {
+            'capacity': np.array(self._capacity),
+            'next': np.array(self._next),
+            'states': self._states[:size],
+            'moves': self._moves[:size],
+            'rewards': self._rewards[:size],
+            'next_states': self._next_states[:size],
+            'dones': self._dones[:size],
+            'params': np.array([self._alpha, self._beta, self._eps, self._max_priority]),
+        }
+        if self._prioritized:
+            arrays['priorities'] = self._tree.get(np.arange(size))
+        return arrays
+
+    @staticmethod
+    def from_arrays(arrays, unpack=None):
+        """
+        Restores replay buffer from snapshot made by to_arrays
+        :param arrays: Dict of arrays
+        :param unpack: Function mapping batch of stored states to network inputs (or None)
+        :return: ReplayBuffer
+        """
+        states = arrays['states']
+        alpha, beta, eps, max_priority = arrays['params']
+        replay = ReplayBuffer(int(arrays['capacity']), states.shape[1],
+                              prioritized='priorities' in arrays, alpha=alpha, beta=beta,
+                              state_dtype=states.dtype, eps=eps, unpack=unpack)
+        size = len(states)
+        replay._states[:size] = states
+        replay._moves[:size] = arrays['moves']
+        replay._rewards[:size] = arrays['rewards']
+        replay._next_states[:size] = arrays['next_states']
+        replay._dones[:size] = arrays['dones']
+        replay._next = int(arrays['next'])
+        replay._size = size
+        replay._max_priority = float(max_priority)
+        if replay._prioritized:
+            replay._tree.update(np.arange(size), arrays['priorities'])
+        return replay
+
+    def save(self, file_name):
+        """
+        Saves snapshot to compressed NumPy archive
+        :param file_name: Path of .npz file
+        :return: None
+        """
+        np.savez_compressed(file_name, **self.to_arrays())
+
+    @staticmethod
+    def load(file_name, unpack=None):
+        """
+        Loads replay buffer saved by ReplayBuffer.save
+        :param file_name: Path of .npz file
+        :param unpack: Function mapping batch of stored states to network inputs (or None)
+        :return: ReplayBuffer
+        """
+        with np.load(file_name) as arrays:
+            return ReplayBuffer.from_arrays(dict(arrays), unpack)
+
+    def _get_batch(self, batch_size):
+        """
+        Returns preallocated batch arrays of given size
+        :param batch_size: Number of transitions per batch
+        :return: Tuple of batch arrays
+        """
+        if self._batch is None or len(self._batch[1]) != batch_size:
+            self._batch = (
+                np.zeros((batch_size, self._state_dim), dtype=self._states.dtype),
+                np.zeros(batch_size, dtype=self._moves.dtype),
+                np.zeros(batch_size, dtype=self._rewards.dtype),
+                np.zeros((batch_size, self._state_dim), dtype=self._next_states.dtype),
+                np.zeros(batch_size, dtype=self._dones.dtype),
+                np.zeros(batch_size, dtype=float),
+            )
+        return self._batch
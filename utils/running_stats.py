@@ -0,0 +1,258 @@
+"""
+Running Stats
+Streaming, mergeable summary statistics (Welford mean/variance, approximate quantiles)
+"""
+
+import math
+from statistics import NormalDist
+
+
+def normal_quantile(p):
+    """
+    :param p: Probability (0,1)
+    :return: Standard normal quantile at p
+    """
+    return NormalDist().inv_cdf(p)
+
+
+class RunningStats:
+
+    def __init__(self):
+        """
+        Constructs empty running statistics
+        """
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+
+    def update(self, x):
+        """
+        Adds sample (Welford update)
+        :param x: Sample value
+        :return: None
+        """
+        self._count += 1
+        delta = x - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (x - self._mean)
+        self._min = min(self._min, x)
+        self._max = max(self._max, x)
+
+    def merge(self, other):
+        """
+        Adds all samples summarized by other running statistics (Chan et al.)
+        :param other: RunningStats
+        :return: None
+        """
+        if other._count == 0:
+            return
+        count = self._count + other._count
+        delta = other._mean - self._mean
+        self._m2 += other._m2 + delta ** 2 * self._count * other._count / count
+        self._mean += delta * other._count / count
+        self._count = count
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+
+    def get_count(self):
+        """
+        :return: Number of samples
+        """
+        return self._count
+
+    def get_mean(self):
+        """
+        :return: Sample mean
+        """
+        return self._mean
+
+    def get_var(self):
+        """
+        :return: Unbiased sample variance (0 for fewer than 2 samples)
+        """
+        return self._m2 / (self._count - 1) if self._count > 1 else 0.0
+
+    def get_std(self):
+        """
+        :return: Unbiased sample standard deviation
+        """
+        return math.sqrt(self.get_var())
+
+    def get_min(self):
+        """
+        :return: Min sample
+        """
+        return self._min
+
+    def get_max(self):
+        """
+        :return: Max sample
+        """
+        return self._max
+
+    def get_sem(self):
+        """
+        :return: Standard error of the mean (inf for fewer than 2 samples)
+        """
+        return math.sqrt(self.get_var() / self._count) if self._count > 1 else math.inf
+
+    def get_ci(self, confidence=0.95):
+        """
+        Normal-approximation confidence interval of the mean
+        :param confidence: Confidence level (0,1)
+        :return: Tuple (low, high)
+        """
+        half_width = normal_quantile(0.5 + confidence / 2.0) * self.get_sem()
+        return self._mean - half_width, self._mean + half_width
+
+
+class PairedStats:
+
+    def __init__(self):
+        """
+        Constructs empty running statistics of paired samples (a, b) and their differences a - b
+        """
+        self._a = RunningStats()
+        self._b = RunningStats()
+        self._diff = RunningStats()
+
+    def update(self, a, b):
+        """
+        Adds paired sample
+        :param a: Sample of first variable
+        :param b: Sample of second variable on the same trial
+        :return: None
+        """
+        self._a.update(a)
+        self._b.update(b)
+        self._diff.update(a - b)
+
+    def get_a(self):
+        """
+        :return: RunningStats of first variable
+        """
+        return self._a
+
+    def get_b(self):
+        """
+        :return: RunningStats of second variable
+        """
+        return self._b
+
+    def get_diff(self):
+        """
+        :return: RunningStats of paired differences a - b
+        """
+        return self._diff
+
+    def get_z(self):
+        """
+        :return: Paired z statistic of mean difference (0 if standard error is 0 or undefined)
+        """
+        sem = self._diff.get_sem()
+        return self._diff.get_mean() / sem if 0.0 < sem < math.inf else 0.0
+
+    def get_ci(self, confidence=0.95):
+        """
+        Normal-approximation confidence interval of the mean difference
+        :param confidence: Confidence level (0,1)
+        :return: Tuple (low, high)
+        """
+        return self._diff.get_ci(confidence)
+
+    def get_variance_reduction(self):
+        """
+        :return: Variance of unpaired difference over variance of paired difference (inf if paired variance is 0)
+        """
+        var = self._diff.get_var()
+        return (self._a.get_var() + self._b.get_var()) / var if var > 0.0 else math.inf
+
+
+class QuantileSketch:
+
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Constructs empty mergeable quantile sketch
+        Samples are counted in logarithmic buckets, so quantiles are accurate to
+        within relative_accuracy of the true sample value.
+        :param relative_accuracy: Max relative error of quantiles (0,1)
+        """
+        self._gamma = (1.0 + relative_accuracy) / (1.0 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._positive = {}
+        self._negative = {}
+        self._zeros = 0
+        self._count = 0
+
+    def update(self, x, count=1):
+        """
+        Adds sample
+        :param x: Sample value
+        :param count: Number of times to add sample
+        :return: None
+        """
+        self._count += count
+        if x > 0.0:
+            key = math.ceil(math.log(x) / self._log_gamma)
+            self._positive[key] = self._positive.get(key, 0) + count
+        elif x < 0.0:
+            key = math.ceil(math.log(-x) / self._log_gamma)
+            self._negative[key] = self._negative.get(key, 0) + count
+        else:
+            self._zeros += count
+
+    def merge(self, other):
+        """
+        Adds all samples counted by other sketch (same relative accuracy)
+        :param other: QuantileSketch
+        :return: None
+        """
+        for key, count in other._positive.items():
+            self._positive[key] = self._positive.get(key, 0) + count
+        for key, count in other._negative.items():
+            self._negative[key] = self._negative.get(key, 0) + count
+        self._zeros += other._zeros
+        self._count += other._count
+
+    def get_count(self):
+        """
+        :return: Number of samples
+        """
+        return self._count
+
+    def quantile(self, q):
+        """
+        :param q: Quantile [0,1]
+        :return: Approximate q-quantile (None if sketch is empty)
+        """
+        if self._count == 0:
+            return None
+        rank = q * (self._count - 1)
+        seen = 0
+
+        # Negative buckets (most negative first)
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > rank:
+                return -self._bucket_value(key)
+
+        # Zeros
+        seen += self._zeros
+        if seen > rank:
+            return 0.0
+
+        # Positive buckets
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > rank:
+                return self._bucket_value(key)
+        return self._bucket_value(max(self._positive))
+
+    def _bucket_value(self, key):
+        """
+        :param key: Bucket index
+        :return: Representative magnitude of bucket
+        """
+        return 2.0 * self._gamma ** key / (self._gamma + 1.0)
@@ -2,70 +2,214 @@
 Score Tracker
 Class for tracking and printing score summary statistics for RL algorithms
 Written by Dan Oates (WPI Class of 2020)
+
+Scores are aggregated into mergeable summaries (Welford count/mean/variance,
+min/max and a quantile sketch). Worker processes can keep their own
+ScoreSummary and send it to the parent, which merges it into its tracker.
+The tracker keeps a window view (last completed window of interval games)
+and a cumulative view. Printing is done by a background timer thread
+(start/stop), never by update.
 """
 
-from sys import float_info
+from threading import Lock
+
+from utils.periodic_reporter import PeriodicReporter
+from utils.running_stats import RunningStats, QuantileSketch
+
+
+class ScoreSummary:
+
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Constructs empty mergeable score summary
+        :param relative_accuracy: Max relative error of score quantiles
+        """
+        self._stats = RunningStats()
+        self._sketch = QuantileSketch(relative_accuracy)
+
+    def update(self, score):
+        """
+        Adds game score
+        :param score: Game score
+        :return: None
+        """
+        self._stats.update(score)
+        self._sketch.update(score)
+
+    def merge(self, other):
+        """
+        Adds all scores summarized by other summary
+        :param other: ScoreSummary
+        :return: None
+        """
+        self._stats.merge(other._stats)
+        self._sketch.merge(other._sketch)
+
+    def get_count(self):
+        """
+        :return: Number of scores
+        """
+        return self._stats.get_count()
+
+    def get_mean(self):
+        """
+        :return: Mean score
+        """
+        return self._stats.get_mean()
+
+    def get_std(self):
+        """
+        :return: Score standard deviation
+        """
+        return self._stats.get_std()
+
+    def get_min(self):
+        """
+        :return: Min score
+        """
+        return self._stats.get_min()
+
+    def get_max(self):
+        """
+        :return: Max score
+        """
+        return self._stats.get_max()
+
+    def quantile(self, q):
+        """
+        :param q: Quantile [0,1]
+        :return: Approximate score q-quantile (None if empty)
+        """
+        return self._sketch.quantile(q)
+
+    def get_stats(self):
+        """
+        :return: RunningStats of scores
+        """
+        return self._stats
+
+    def __str__(self):
+        return f'Mean: {self.get_mean():.3f}, Min: {self.get_min():.3f}, ' \
+               f'Median: {self.quantile(0.5):.1f}, Max: {self.get_max():.3f}'
 
 
 class ScoreTracker:
 
-    def __init__(self, interval):
+    def __init__(self, interval, print_interval=5.0):
         """
         Makes score tracker interface
-        :param interval: Number of games to min, max, mean over
+        :param interval: Min number of games per window (min, max, mean over)
+        :param print_interval: Time between printouts once started [s]
         """
         self._interval = interval
-        self._num_scores = 0
-        self._mean_score = 0.0
-        self._min_score = float_info.max
-        self._max_score = float_info.min
+        self._lock = Lock()
+        self._window = ScoreSummary()
+        self._last_window = None
+        self._total = ScoreSummary()
+        self._num_reported = 0
+        self._reporter = PeriodicReporter(print_interval, self.report)
+
+    def start(self):
+        """
+        Starts background printouts
+        :return: None
+        """
+        self._reporter.start()
+
+    def stop(self):
+        """
+        Stops background printouts and prints final report
+        :return: None
+        """
+        self._reporter.stop()
+        self.report()
 
     def update(self, score):
         """
-        Updates score statistics and periodically prints
+        Updates score statistics
         :param score: Most recent game score
-        :return: True if print and reset occurred
+        :return: True if a window was completed
         """
+        with self._lock:
+            self._window.update(score)
+            self._total.update(score)
+            return self._complete_window()
 
-        # Update stats
-        self._mean_score += score
-        self._min_score = min(self._min_score, score)
-        self._max_score = max(self._max_score, score)
+    def merge(self, summary):
+        """
+        Adds partial score aggregate (e.g. from a worker process)
+        :param summary: ScoreSummary
+        :return: True if a window was completed
+        """
+        with self._lock:
+            self._window.merge(summary)
+            self._total.merge(summary)
+            return self._complete_window()
 
-        # Print check
-        self._num_scores += 1
-        do_update = self._num_scores == self._interval
-        if do_update:
-            self._mean_score /= self._interval
-            print(f'Scores: Mean: {self._mean_score:.3f}, Min: {self._min_score:.3f}, Max: {self._max_score:.3f}')
+    def _complete_window(self):
+        """
+        Starts new window once current window has interval games
+        :return: True if a window was completed
+        """
+        if self._window.get_count() < self._interval:
+            return False
+        self._last_window = self._window
+        self._window = ScoreSummary()
+        return True
+
+    def get_window(self):
+        """
+        :return: ScoreSummary of last completed window (None before first window)
+        """
+        return self._last_window
 
-        # Return update flag
-        return do_update
+    def get_total(self):
+        """
+        :return: ScoreSummary of all games
+        """
+        return self._total
 
     def get_mean_score(self):
         """
-        :return: Mean score from game batch
+        :return: Mean score from last game window
         """
-        return self._mean_score
+        return self._last_window.get_mean()
 
     def get_min_score(self):
         """
-        :return: Min score from game batch
+        :return: Min score from last game window
         """
-        return self._min_score
+        return self._last_window.get_min()
 
     def get_max_score(self):
         """
-        :return: Max score from game batch
+        :return: Max score from last game window
+        """
+        return self._last_window.get_max()
+
+    def report(self):
+        """
+        Prints window and cumulative stats if games finished since last report
+        :return: None
         """
-        return self._max_score
+        with self._lock:
+            num_games = self._total.get_count()
+            if num_games == self._num_reported:
+                return
+            self._num_reported = num_games
+            window = self._last_window if self._last_window is not None else self._window
+            window_text = f'Scores (last {window.get_count()}): {window}'
+            total_text = f'All {num_games} games: Mean: {self._total.get_mean():.3f}, ' \
+                         f'Median: {self._total.quantile(0.5):.1f}, Max: {self._total.get_max():.3f}'
+        print(f'{window_text} | {total_text}')
 
     def reset(self):
         """
         Resets score tracking stats
         :return: None
         """
-        self._num_scores = 0
-        self._mean_score = 0.0
-        self._min_score = float_info.max
-        self._max_score = float_info.min
+        with self._lock:
+            self._window = ScoreSummary()
+            self._last_window = None
+            self._total = ScoreSummary()
+            self._num_reported = 0
@@ -0,0 +1,219 @@
+"""
+Trajectories
+Append-only, sharded on-disk dataset of Square Stacker game trajectories
+
+Each shard holds whole games as one .npy file per field:
+    state = State vector before move (packed 'bits' encoding by default)
+    move = Index of move made [0..26]
+    reward = Points for move
+    done = True for last move of game
+    score = Game score after move
+Shards are listed in index.json, which is rewritten after each shard so
+readers only see complete shards. TrajectoryDataset memory-maps the shards and
+serves random minibatches without loading them into RAM.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from agents.search.agent import SearchAgent
+from square_stacker_game import SquareStackerGame, move_to_index, unpack_state_bits
+
+_fields = ['state', 'move', 'reward', 'done', 'score']
+
+
+class TrajectoryWriter:
+
+    def __init__(self, directory, shard_size=1000000, encoding='bits'):
+        """
+        Opens trajectory dataset for appending (created if missing)
+        :param directory: Dataset directory
+        :param shard_size: Min moves per shard (shards end on game boundaries)
+        :param encoding: State vector encoding ('bits', 'float32' or 'state')
+        """
+        self._directory = directory
+        self._shard_size = shard_size
+        os.makedirs(directory, exist_ok=True)
+
+        # Load or start index
+        self._index_name = os.path.join(directory, 'index.json')
+        if os.path.exists(self._index_name):
+            with open(self._index_name) as file:
+                self._index = json.load(file)
+            if self._index['encoding'] != encoding:
+                raise ValueError(f'Dataset encoding is {self._index["encoding"]}, not {encoding}')
+        else:
+            self._index = {'encoding': encoding, 'shards': []}
+
+        # Buffered games
+        self._buffer = {field: [] for field in _fields}
+        self._num_buffered = 0
+
+    def get_encoding(self):
+        """
+        :return: State vector encoding of dataset
+        """
+        return self._index['encoding']
+
+    def add_game(self, states, move_indices, rewards, scores):
+        """
+        Adds trajectory of one complete game
+        :param states: State vectors before each move [list or np.array]
+        :param move_indices: Indices of moves made [list or np.array]
+        :param rewards: Points for each move [list or np.array]
+        :param scores: Game score after each move [list or np.array]
+        :return: None
+        """
+        num_moves = len(move_indices)
+        if num_moves == 0:
+            return
+        dones = np.zeros(num_moves, dtype=bool)
+        dones[-1] = True
+        self._buffer['state'].append(np.asarray(states))
+        self._buffer['move'].append(np.asarray(move_indices, dtype=np.uint8))
+        self._buffer['reward'].append(np.asarray(rewards, dtype=np.float32))
+        self._buffer['done'].append(dones)
+        self._buffer['score'].append(np.asarray(scores, dtype=np.float32))
+        self._num_buffered += num_moves
+        if self._num_buffered >= self._shard_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes buffered games to new shard and updates index
+        :return: None
+        """
+        if self._num_buffered == 0:
+            return
+        shard = len(self._index['shards'])
+        for field in _fields:
+            file_name = os.path.join(self._directory, f'{field}_{shard:05d}.npy')
+            np.save(file_name, np.concatenate(self._buffer[field]))
+            self._buffer[field] = []
+        self._index['shards'].append({'id': shard, 'length': self._num_buffered})
+        self._num_buffered = 0
+
+        # Replace index only after shard files are complete
+        tmp_name = self._index_name + '.tmp'
+        with open(tmp_name, 'w') as file:
+            json.dump(self._index, file)
+        os.replace(tmp_name, self._index_name)
+
+    def close(self):
+        """
+        Flushes remaining games
+        :return: None
+        """
+        self.flush()
+
+
+def record_games(writer, agent, num_games):
+    """
+    Plays games with agent and records their trajectories
+    :param writer: TrajectoryWriter
+    :param agent: Square Stacker AI agent
+    :param num_games: Number of games to play
+    :return: List of final game scores
+    """
+    is_search_agent = issubclass(type(agent), SearchAgent)
+    encoding = writer.get_encoding()
+    final_scores = []
+    for _ in range(num_games):
+
+        # Play game until no valid moves exist
+        game = SquareStackerGame()
+        states, move_indices, rewards, scores = [], [], [], []
+        while True:
+            if is_search_agent:
+                move, _ = agent.select_move(game)
+            else:
+                move = agent.select_move(game)
+            if move is None:
+                break
+            states.append(game.get_state_vector(encoding))
+            move_indices.append(move_to_index(move))
+            rewards.append(game.make_move(move))
+            scores.append(game.get_score())
+
+        # Record trajectory
+        writer.add_game(states, move_indices, rewards, scores)
+        final_scores.append(game.get_score())
+    return final_scores
+
+
+class TrajectoryDataset:
+
+    def __init__(self, directory):
+        """
+        Opens trajectory dataset with memory-mapped shards
+        :param directory: Dataset directory (written by TrajectoryWriter)
+        """
+        with open(os.path.join(directory, 'index.json')) as file:
+            index = json.load(file)
+        self._encoding = index['encoding']
+        self._shards = []
+        for shard in index['shards']:
+            self._shards.append({field: np.load(os.path.join(directory, f'{field}_{shard["id"]:05d}.npy'),
+                                                mmap_mode='r') for field in _fields})
+        lengths = [shard['length'] for shard in index['shards']]
+        self._offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+
+    def __len__(self):
+        """
+        :return: Number of moves in dataset
+        """
+        return int(self._offsets[-1])
+
+    def get_encoding(self):
+        """
+        :return: State vector encoding of dataset
+        """
+        return self._encoding
+
+    def get(self, field, indices):
+        """
+        Reads field at global move indices
+        :param field: 'state', 'move', 'reward', 'done' or 'score'
+        :param indices: Global move indices [np.array]
+        :return: Field values [np.array]
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        shard_ids = np.searchsorted(self._offsets, indices, side='right') - 1
+        first = self._shards[0][field]
+        result = np.empty((len(indices),) + first.shape[1:], dtype=first.dtype)
+        for shard_id in np.unique(shard_ids):
+            rows = shard_ids == shard_id
+            result[rows] = self._shards[shard_id][field][indices[rows] - self._offsets[shard_id]]
+        return result
+
+    def sample(self, batch_size):
+        """
+        Samples minibatch of transitions (same layout as ReplayBuffer.sample)
+        :param batch_size: Number of transitions to sample
+        :return: Tuple (states, move_indices, rewards, next_states, dones, weights, indices)
+        """
+        indices = np.random.randint(0, len(self), batch_size)
+        dones = self.get('done', indices)
+
+        # Next state is following move of same game (unused after last move)
+        next_indices = np.where(dones, indices, indices + 1)
+        states = self.get('state', indices)
+        next_states = self.get('state', next_indices)
+        if self._encoding == 'bits':
+            states = unpack_state_bits(states)
+            next_states = unpack_state_bits(next_states)
+        move_indices = self.get('move', indices).astype(np.int64)
+        rewards = self.get('reward', indices)
+        weights = np.ones(batch_size)
+        return states, move_indices, rewards, next_states, dones, weights, indices
+
+    def update_priorities(self, indices, td_errors):
+        """
+        No-op (dataset is sampled uniformly), for compatibility with ReplayBuffer
+        :param indices: Indices returned by sample
+        :param td_errors: TD errors of transitions [np.array]
+        :return: None
+        """
+        pass
@@ -0,0 +1,192 @@
+"""
+Transposition Table
+Fixed-size state-value hash table in shared memory, shared by worker processes
+
+Entries live in one multiprocessing.shared_memory block, so every process
+holding the table (e.g. pool workers receiving a pickled agent) reads and
+writes the same entries. Each entry stores:
+    key = State hash (0 = empty slot)
+    depth = Depth tag: kind of value and search depth it was computed for (see depth_tag)
+    visits = Number of samples averaged into value
+    value = Mean points gained from state
+Slots are direct-mapped (slot = key % num_entries) and guarded by striped
+locks (stripe = slot % num_locks). A store to a slot holding another key
+replaces it and counts as a collision. Statistics are kept per stripe under
+the same locks, so they need no extra synchronization.
+
+Each kind of agent value has its own depth tag namespace, so agents sharing
+one table only ever read entries written by the same kind of search:
+    KIND_PLAYOUT = Mean points of random playouts to game end (RandomSearchAgent)
+    KIND_MCTS = Mean points of MCTS simulations to game end
+    KIND_ROLLOUT = Mean points of depth-limited random rollouts (DepthLimitedRandomSearchAgent)
+    KIND_MAX = Max points over all move sequences of search depth (ExhaustiveSearchAgent)
+"""
+
+import multiprocessing as mp
+from hashlib import blake2b
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from square_stacker_game import STATE_PLANE_BYTES
+
+entry_dtype = np.dtype([('key', '<u8'), ('depth', '<i4'), ('visits', '<u4'), ('value', '<f8')])
+
+# Kinds of stored values (each with its own depth tags)
+KIND_PLAYOUT = 0
+KIND_MCTS = 1
+KIND_ROLLOUT = 2
+KIND_MAX = 3
+_kind_stride = 2 ** 16
+
+# Per-stripe statistics counters
+_stat_names = ['lookups', 'hits', 'stores', 'collisions', 'occupied']
+
+
+def hash_state(game):
+    """
+    Hashes game position (board, pieces and combo, not score)
+    :param game: Square Stacker game
+    :return: Nonzero 64-bit state hash [int]
+    """
+    bits = game.get_state_vector('bits')
+    data = bits[:STATE_PLANE_BYTES].tobytes() + bits[STATE_PLANE_BYTES + 4:].tobytes()
+    key = int.from_bytes(blake2b(data, digest_size=8).digest(), 'little')
+    return key if key != 0 else 1
+
+
+def depth_tag(kind, depth=0):
+    """
+    Makes depth tag of stored value
+    :param kind: Kind of value (KIND_PLAYOUT, KIND_MCTS, KIND_ROLLOUT or KIND_MAX)
+    :param depth: Search depth of value (0 for playouts to game end) [0, 2 ** 16)
+    :return: Depth tag [int]
+    """
+    return kind * _kind_stride + depth
+
+
+class TranspositionTable:
+
+    def __init__(self, num_entries=2 ** 20, num_locks=64):
+        """
+        Creates empty table in new shared memory block
+        :param num_entries: Number of entry slots
+        :param num_locks: Number of lock stripes
+        """
+        self._num_entries = num_entries
+        self._num_locks = num_locks
+        size = num_entries * entry_dtype.itemsize + num_locks * len(_stat_names) * 8
+        self._shm = SharedMemory(create=True, size=size)
+        self._locks = [mp.Lock() for _ in range(num_locks)]
+        self._is_owner = True
+        self._map_arrays()
+        self._entries[:] = 0
+        self._stats[:] = 0
+
+    def _map_arrays(self):
+        """
+        Maps entry and statistics arrays onto shared memory
+        :return: None
+        """
+        self._entries = np.ndarray(self._num_entries, dtype=entry_dtype, buffer=self._shm.buf)
+        self._stats = np.ndarray((self._num_locks, len(_stat_names)), dtype=np.int64, buffer=self._shm.buf,
+                                 offset=self._num_entries * entry_dtype.itemsize)
+
+    def __getstate__(self):
+        """
+        Pickles shared memory name and locks (entries stay in shared memory)
+        """
+        return {'name': self._shm.name, 'num_entries': self._num_entries,
+                'num_locks': self._num_locks, 'locks': self._locks}
+
+    def __setstate__(self, state):
+        """
+        Attaches to shared memory of pickled table
+        """
+        self._num_entries = state['num_entries']
+        self._num_locks = state['num_locks']
+        self._locks = state['locks']
+        self._shm = SharedMemory(name=state['name'])
+        self._is_owner = False
+        self._map_arrays()
+
+    def _slot(self, key):
+        """
+        :param key: State hash
+        :return slot: Entry index
+        :return lock: Index of lock stripe
+        """
+        slot = key % self._num_entries
+        return slot, slot % self._num_locks
+
+    def lookup(self, key, depth):
+        """
+        Looks up value of state with depth tag
+        :param key: State hash (from hash_state)
+        :param depth: Depth tag (from depth_tag)
+        :return: Tuple (visits, value) or None if not found
+        """
+        slot, stripe = self._slot(key)
+        with self._locks[stripe]:
+            entry = self._entries[slot]
+            self._stats[stripe, 0] += 1
+            if entry['key'] == key and entry['depth'] == depth:
+                self._stats[stripe, 1] += 1
+                return int(entry['visits']), float(entry['value'])
+        return None
+
+    def store(self, key, depth, value, visits=1, accumulate=False):
+        """
+        Stores value of state with depth tag
+        :param key: State hash (from hash_state)
+        :param depth: Depth tag (from depth_tag)
+        :param value: Mean points gained from state
+        :param visits: Number of samples averaged into value
+        :param accumulate: Average with stored value of same state and depth tag
+        :return: None
+        """
+        slot, stripe = self._slot(key)
+        with self._locks[stripe]:
+            entry = self._entries[slot]
+            self._stats[stripe, 2] += 1
+            if accumulate and entry['key'] == key and entry['depth'] == depth:
+                total = int(entry['visits']) + visits
+                value = (float(entry['value']) * int(entry['visits']) + value * visits) / total
+                visits = total
+            elif entry['key'] == 0:
+                self._stats[stripe, 4] += 1
+            elif entry['key'] != key:
+                self._stats[stripe, 3] += 1
+            self._entries[slot] = (key, depth, visits, value)
+
+    def get_stats(self):
+        """
+        :return: Dict of table size, occupancy and lookup, hit, store and collision counts
+        """
+        totals = dict(zip(_stat_names, (int(x) for x in np.sum(self._stats, axis=0))))
+        totals['num_entries'] = self._num_entries
+        totals['occupancy'] = totals['occupied'] / self._num_entries
+        totals['hit_rate'] = totals['hits'] / totals['lookups'] if totals['lookups'] > 0 else 0.0
+        return totals
+
+    def clear(self):
+        """
+        Empties all entries and resets statistics
+        :return: None
+        """
+        for lock in self._locks:
+            lock.acquire()
+        self._entries[:] = 0
+        self._stats[:] = 0
+        for lock in self._locks:
+            lock.release()
+
+    def close(self):
+        """
+        Detaches from shared memory (and frees it if this process created it)
+        :return: None
+        """
+        self._entries = None
+        self._stats = None
+        self._shm.close()
+        if self._is_owner:
+            self._shm.unlink()